@@ -0,0 +1,252 @@
+'''
+Offline benchmarks of the checkpoint, restore and transfer paths of the checkpointer.
+Results are written as JSON, and can be compared against the results of an earlier run to detect regressions:
+
+    python benchmarks/run_benchmarks.py --output results.json
+    python benchmarks/run_benchmarks.py --compare results.json --tolerance 0.25
+
+Remote storage is replaced by local stand-ins: the local mode (string paths like xrootd, resolved in a directory)
+and the manual mode with a copying callback, so no network access or credentials are needed.
+'''
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from checkpointer.archiving import extract_archive, make_archive
+from checkpointer.checkpointer import Checkpointer
+
+MiB = 2**20
+
+
+def parse_size(text: str) -> int:
+    units = {"K": 2**10, "M": 2**20, "G": 2**30}
+    text = text.strip().upper().rstrip("B").rstrip("I")
+    if text and text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(text)
+
+
+def measure(function, repeats: int, setup=None) -> list:
+    '''
+    Returns the durations of repeats calls of function in seconds. setup is called before each, without being timed.
+    '''
+    durations = []
+    for _ in range(repeats):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        function()
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+def result(benchmark: str, durations: list, nbytes: int = None, **params) -> dict:
+    median = statistics.median(durations)
+    return {
+        "benchmark": benchmark,
+        "params": params,
+        "median_seconds": median,
+        "min_seconds": min(durations),
+        "repeats": len(durations),
+        "throughput_bytes_per_second": nbytes / median if nbytes and median else None,
+    }
+
+
+def write_bytes(path, value):
+    path.write_bytes(value)
+
+
+def read_bytes(path):
+    return path.read_bytes()
+
+
+def make_checkpointer(local_checkpoint_file, **kwargs):
+    return Checkpointer(
+        local_checkpoint_file=local_checkpoint_file,
+        checkpoint_function=write_bytes,
+        restore_function=read_bytes,
+        **kwargs,
+    )
+
+
+def benchmark_step_overhead(work_dir: Path, args) -> list:
+    '''
+    Time per step() call for different checkpoint_every, with a small checkpoint written to work_dir.
+    '''
+    results = []
+    value = os.urandom(4096)
+    for checkpoint_every in [1, 10, 100, 1000]:
+        checkpointer = make_checkpointer(work_dir / "step.bin", checkpoint_every=checkpoint_every)
+
+        def run_steps():
+            for _ in range(args.steps):
+                checkpointer.step(value)
+
+        durations = [duration / args.steps for duration in measure(run_steps, args.repeats)]
+        results.append(result("step_overhead", durations, checkpoint_every=checkpoint_every))
+    return results
+
+
+def benchmark_checkpoint_restore(work_dir: Path, args) -> list:
+    '''
+    Throughput of checkpoint() and restore() without transfers.
+    '''
+    results = []
+    for size in args.sizes:
+        value = os.urandom(size)
+        checkpointer = make_checkpointer(work_dir / "checkpoint.bin")
+        durations = measure(lambda: checkpointer.checkpoint(value), args.repeats)
+        results.append(result("checkpoint", durations, size, size=size))
+        durations = measure(lambda: checkpointer.restore(None), args.repeats)
+        results.append(result("restore", durations, size, size=size))
+    return results
+
+
+def benchmark_transfers(work_dir: Path, args) -> list:
+    '''
+    Throughput of transfer_checkpoint_files() and get_checkpoint() in shared mode on tmpfs and disk,
+    and in local (stand-in for xrootd) and manual mode.
+    '''
+    storages = {"disk": Path(args.disk_dir) if args.disk_dir else work_dir}
+    if Path("/dev/shm").is_dir():
+        storages["tmpfs"] = Path("/dev/shm")
+
+    results = []
+    for storage_name, storage in storages.items():
+        with tempfile.TemporaryDirectory(dir=storage) as target_dir:
+            target_dir = Path(target_dir)
+            configurations = {
+                "shared": dict(checkpoint_transfer_mode="shared", checkpoint_transfer_target=target_dir / "target.bin"),
+                "local": dict(
+                    checkpoint_transfer_mode="local",
+                    checkpoint_transfer_target="/store/target.bin",
+                    checkpoint_transfer_backend_kwargs={"root": target_dir},
+                ),
+                "manual": dict(
+                    checkpoint_transfer_mode="manual",
+                    checkpoint_transfer_target=target_dir / "manual.bin",
+                    checkpoint_transfer_callback=lambda source, destination: shutil.copyfile(source, destination),
+                    checkpoint_transfer_callback_kwargs={},
+                ),
+            }
+            for mode, kwargs in configurations.items():
+                for size in args.sizes:
+                    local_file = work_dir / f"{mode}.bin"
+                    checkpointer = make_checkpointer(local_file, **kwargs)
+                    checkpointer.checkpoint(os.urandom(size))
+                    durations = measure(checkpointer.transfer_checkpoint_files, args.repeats)
+                    results.append(result("transfer", durations, size, mode=mode, storage=storage_name, size=size))
+                    if mode != "manual":  # manual mode can not check for existing checkpoints
+                        durations = measure(
+                            checkpointer.get_checkpoint, args.repeats, setup=lambda: local_file.unlink(missing_ok=True)
+                        )
+                        results.append(result("fetch", durations, size, mode=mode, storage=storage_name, size=size))
+                    local_file.unlink(missing_ok=True)
+    return results
+
+
+def benchmark_archive(work_dir: Path, args) -> list:
+    '''
+    Throughput of the archive path of the Keras callback, for a directory of 8 files per size.
+    '''
+    results = []
+    for size in args.sizes:
+        source_dir = work_dir / "backup"
+        source_dir.mkdir()
+        for index in range(8):
+            # half random, half zeros, so compression has some effect
+            (source_dir / f"file{index}.bin").write_bytes(os.urandom(size // 16) + bytes(size // 16))
+        for codec in ["gz", "zst", "none"]:
+            archive = work_dir / "backup.tar"
+            try:
+                durations = measure(lambda: make_archive(archive, source_dir, codec=codec), args.repeats)
+            except (ImportError, OSError) as e:  # codec not available
+                print(f"skipping codec {codec}: {e}", file=sys.stderr)
+                continue
+            results.append(result("archive", durations, size, codec=codec, size=size))
+            extract_dir = work_dir / "extracted"
+            durations = measure(
+                lambda: extract_archive(archive, extract_dir), args.repeats,
+                setup=lambda: shutil.rmtree(extract_dir, ignore_errors=True),
+            )
+            results.append(result("extract", durations, size, codec=codec, size=size))
+            shutil.rmtree(extract_dir, ignore_errors=True)
+            archive.unlink()
+        shutil.rmtree(source_dir)
+    return results
+
+
+BENCHMARKS = {
+    "step_overhead": benchmark_step_overhead,
+    "checkpoint_restore": benchmark_checkpoint_restore,
+    "transfers": benchmark_transfers,
+    "archive": benchmark_archive,
+}
+
+
+def key(entry: dict) -> str:
+    return entry["benchmark"] + json.dumps(entry["params"], sort_keys=True)
+
+
+def compare(results: list, baseline: list, tolerance: float) -> list:
+    '''
+    Returns descriptions of the results more than tolerance (relative) slower than in the baseline.
+    '''
+    baseline = {key(entry): entry for entry in baseline}
+    regressions = []
+    for entry in results:
+        reference = baseline.get(key(entry))
+        if reference is None:
+            continue
+        ratio = entry["median_seconds"] / reference["median_seconds"]
+        if ratio > 1 + tolerance:
+            regressions.append(f"{key(entry)}: {ratio:.2f}x slower than the baseline")
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--benchmarks", nargs="+", choices=list(BENCHMARKS), default=list(BENCHMARKS))
+    parser.add_argument("--sizes", default="1M,16M,64M", help="comma-separated checkpoint sizes, e.g. 1M,1G")
+    parser.add_argument("--repeats", type=int, default=5, help="repetitions per measurement, the median is reported")
+    parser.add_argument("--steps", type=int, default=1000, help="number of step() calls per step_overhead measurement")
+    parser.add_argument("--disk-dir", help="directory on disk used as transfer target, defaults to the temporary directory")
+    parser.add_argument("--output", help="file to write the JSON results to, defaults to stdout")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="relative slowdown reported as regression")
+    args = parser.parse_args(argv)
+    args.sizes = [parse_size(size) for size in args.sizes.split(",")]
+
+    results = []
+    for name in args.benchmarks:
+        with tempfile.TemporaryDirectory() as work_dir:
+            results.extend(BENCHMARKS[name](Path(work_dir), args))
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(text)
+    else:
+        print(text)
+
+    if args.compare:
+        regressions = compare(results, json.loads(Path(args.compare).read_text())["results"], args.tolerance)
+        for regression in regressions:
+            print(f"regression: {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
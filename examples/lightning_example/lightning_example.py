@@ -84,14 +84,16 @@ model = LightningModuleExample()
 # create the checkpointer callback
 checkpoint_path = 'trainer_checkpoint.ckpt'
 
+# with async_io, checkpoints are written and transferred in the background
 checkpointer = LightningCheckpointerCallback(
     local_checkpoint_file=Path(checkpoint_path),
-    checkpoint_every=1
+    checkpoint_every=1,
+    async_io=True,
 )
 
 # create the lightning trainer instance
 epochs = 500
-trainer = Trainer(max_epochs=epochs, accelerator='gpu', callbacks=[checkpointer])
+trainer = Trainer(max_epochs=epochs, accelerator='gpu', callbacks=[checkpointer], plugins=[checkpointer.checkpoint_io])
 # do the fitting.
 # the callbacks restor fuunction takes care of checking for checkpoints
 # and transfering them. The trainers fit function takes care of the
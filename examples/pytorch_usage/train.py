@@ -8,6 +8,8 @@ from torchvision import datasets
 from torchvision.transforms import ToTensor
 from pathlib import Path
 from checkpointer.checkpointer import Checkpointer
+from checkpointer.snapshot import StateSnapshot
+from checkpointer.tensorfile import load_tensors, save_tensors
 
 
 # Download training data from open datasets.
@@ -105,11 +107,15 @@ def test(dataloader, model, loss_fn):
 # model checkpoint. For a more useful application, the losses, epoch
 # number and more can be stored defining a custom `checkpoint_function`
 # and `restore_function`
+# The `StateSnapshot` copies the model's state_dict into reusable host buffers,
+# `save_tensors` then writes the copy in the background while training continues.
+# `load_tensors` memory-maps the checkpoint, so tensors are only read when they are used.
 
 checkpointer = Checkpointer(
-    local_checkpoint_file=Path("checkpoint.pt"),
-    restore_function=lambda path: torch.load(path),
-    checkpoint_function=lambda path, model: torch.save(model.state_dict(), path),
+    local_checkpoint_file=Path("checkpoint.tensors"),
+    restore_function=load_tensors,
+    checkpoint_function=save_tensors,
+    snapshot_function=StateSnapshot(),
     checkpoint_every=100,
 )
 
@@ -129,3 +135,7 @@ for t in range(epochs):
     train(train_dataloader, model, loss_fn, optimizer)
     test(test_dataloader, model, loss_fn)
     checkpointer.checkpoint(model)
+
+# The last checkpoint is written in the background, wait for it before the script ends
+if not checkpointer.flush():
+    raise RuntimeError("the last checkpoint could not be written")
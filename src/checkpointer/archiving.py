@@ -0,0 +1,169 @@
+import gzip
+import os
+import shutil
+import subprocess
+import tarfile
+from contextlib import contextmanager
+from pathlib import Path
+
+# magic bytes at the start of compressed archives
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+CODECS = ["gz", "zst", "none"]
+DEFAULT_LEVELS = {"gz": 6, "zst": 3}
+
+
+def _compressor_command(codec, compresslevel):
+    '''
+    Returns the command line of a multi-threaded compressor binary for codec, or None if none is installed.
+    '''
+    if codec == "gz" and shutil.which("pigz"):
+        return ["pigz", "-c", f"-{_level(codec, compresslevel)}"]
+    if codec == "zst" and shutil.which("zstd"):
+        return ["zstd", "-c", "-q", "-T0", f"-{_level(codec, compresslevel)}"]
+    return None
+
+
+def _level(codec, compresslevel):
+    # 0 is a valid level, e.g. gzip without compression
+    if compresslevel is None:
+        return DEFAULT_LEVELS[codec]
+    return compresslevel
+
+
+def _decompressor_command(codec):
+    if codec == "gz" and shutil.which("pigz"):
+        return ["pigz", "-dc"]
+    if codec == "gz" and shutil.which("gzip"):
+        return ["gzip", "-dc"]
+    if codec == "zst" and shutil.which("zstd"):
+        return ["zstd", "-dc", "-q"]
+    return None
+
+
+def _detect_codec(path):
+    with open(path, "rb") as file:
+        magic = file.read(4)
+    if magic.startswith(GZIP_MAGIC):
+        return "gz"
+    if magic == ZSTD_MAGIC:
+        return "zst"
+    return "none"
+
+
+def make_archive(output_filename, source_dir, codec: str = "gz", compresslevel: int = None) -> None:
+    '''
+    Writes source_dir as a tar archive to output_filename.
+    The archive is streamed through a multi-threaded compressor (pigz for gz, zstd -T0 or the zstandard module
+    for zst) if one is available, otherwise it is compressed in-process.
+    It is written to a temporary file next to output_filename and renamed when complete, so output_filename
+    can be on the transfer target directly and never holds a partial archive.
+    If output_filename is inside source_dir, it is not added to the archive.
+    '''
+    assert codec in CODECS, f"codec must be one of {', '.join(CODECS)}"
+    output_filename = Path(output_filename)
+    source_dir = Path(source_dir)
+    tmp_filename = output_filename.with_name(f".{output_filename.name}.{os.getpid()}.tmp")
+    try:
+        exclude = str(output_filename.relative_to(source_dir.parent))
+    except ValueError:
+        exclude = None
+    # the temporary file must not end up in the archive either
+    tmp_exclude = str(Path(exclude).with_name(tmp_filename.name)) if exclude else None
+
+    def skip_output(tarinfo):
+        return None if tarinfo.name in (exclude, tmp_exclude) else tarinfo
+
+    def add(tar):
+        tar.add(source_dir, arcname=source_dir.name, recursive=True, filter=skip_output)
+
+    command = _compressor_command(codec, compresslevel)
+    try:
+        with open(tmp_filename, "wb") as output:
+            if codec == "none":
+                with tarfile.open(fileobj=output, mode="w|") as tar:
+                    add(tar)
+            elif command is not None:
+                process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=output)
+                with _terminating(process), process.stdin, tarfile.open(fileobj=process.stdin, mode="w|") as tar:
+                    add(tar)
+                assert process.wait() == 0, f"{command[0]} failed with exit code {process.returncode}"
+            elif codec == "zst":
+                import zstandard
+                compressor = zstandard.ZstdCompressor(level=_level(codec, compresslevel), threads=-1)
+                with compressor.stream_writer(output, closefd=False) as writer:
+                    with tarfile.open(fileobj=writer, mode="w|") as tar:
+                        add(tar)
+            else:
+                with gzip.GzipFile(fileobj=output, mode="wb", compresslevel=_level(codec, compresslevel)) as writer:
+                    with tarfile.open(fileobj=writer, mode="w|") as tar:
+                        add(tar)
+        os.replace(tmp_filename, output_filename)
+    finally:
+        if tmp_filename.exists():
+            tmp_filename.unlink()
+
+
+def extract_archive(tar_filename, extract_folder) -> None:
+    '''
+    Extracts an archive written by make_archive (or any tar, tar.gz or tar.zst) to extract_folder.
+    The compression is detected from the file. If a decompressor binary is available, decompression runs
+    in a separate process, in parallel to writing the extracted files.
+    '''
+    codec = _detect_codec(tar_filename)
+    command = _decompressor_command(codec)
+    if codec == "none":
+        with tarfile.open(tar_filename, mode="r|") as tar:
+            _extract_all(tar, extract_folder)
+    elif command is not None:
+        process = subprocess.Popen(command + [str(tar_filename)], stdout=subprocess.PIPE)
+        with _terminating(process), process.stdout:
+            with tarfile.open(fileobj=process.stdout, mode="r|") as tar:
+                _extract_all(tar, extract_folder)
+            # consume the padding after the end of the archive, so the decompressor can exit cleanly
+            while process.stdout.read(2**16):
+                pass
+        assert process.wait() == 0, f"{command[0]} failed with exit code {process.returncode}"
+    elif codec == "zst":
+        import zstandard
+        with open(tar_filename, "rb") as file, zstandard.ZstdDecompressor().stream_reader(file) as reader:
+            with tarfile.open(fileobj=reader, mode="r|") as tar:
+                _extract_all(tar, extract_folder)
+    else:
+        with tarfile.open(tar_filename, mode="r|gz") as tar:
+            _extract_all(tar, extract_folder)
+
+
+@contextmanager
+def _terminating(process):
+    '''
+    Kills the compressor or decompressor process if the archive can not be written or read completely,
+    instead of leaving it running.
+    '''
+    try:
+        yield process
+    except BaseException:
+        process.kill()
+        process.wait()
+        raise
+
+
+def _extract_all(tar, extract_folder) -> None:
+    '''
+    Extracts the members of tar to extract_folder, refusing members that would be written outside of it,
+    e.g. absolute paths, paths containing .. and links pointing elsewhere.
+    '''
+    if hasattr(tarfile, "data_filter"):
+        tar.extractall(extract_folder, filter="data")
+        return
+    root = os.path.realpath(extract_folder)
+
+    def inside(path):
+        return os.path.commonpath([root, os.path.realpath(os.path.join(root, path))]) == root
+
+    for member in tar:
+        link_target = os.path.join(os.path.dirname(member.name), member.linkname) if member.issym() else member.linkname
+        if not inside(member.name) or ((member.issym() or member.islnk()) and not inside(link_target)):
+            raise tarfile.TarError(f"{member.name} would be extracted outside of {extract_folder}")
+        tar.extract(member, extract_folder)
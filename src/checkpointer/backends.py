@@ -0,0 +1,499 @@
+import io
+import os
+import posixpath
+import sys
+import threading
+from collections import namedtuple
+from pathlib import Path
+from typing import Callable, List
+from .transport import copy_file
+
+ENTRY_POINT_GROUP = "checkpointer.backends"
+
+# operations a backend may support
+CAPABILITIES = frozenset([
+    "stat", "put", "get", "ranged_get", "ranged_put", "move", "delete", "list", "direct_read", "stream_read"
+])
+
+# error number of XRootD for files that do not exist (kXR_NotFound)
+XROOTD_NOT_FOUND = 3011
+
+RemoteStat = namedtuple("RemoteStat", ["size", "mtime"])
+
+_backends = {}
+_entry_points_loaded = False
+_registry_lock = threading.Lock()
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def remote_join(base, name: str):
+    '''
+    Joins a remote path and a (relative, POSIX) name, keeping Paths as Paths and strings as strings.
+    '''
+    if isinstance(base, Path):
+        return base / name
+    return posixpath.join(base, name)
+
+
+def remote_with_suffix(path, suffix: str):
+    '''
+    Returns the sibling of a remote path with suffix appended to its name.
+    '''
+    if isinstance(path, Path):
+        return path.with_name(path.name + suffix)
+    return path + suffix
+
+
+def remote_parent(path):
+    '''
+    Returns the directory containing a remote path.
+    '''
+    if isinstance(path, Path):
+        return path.parent
+    return posixpath.dirname(path)
+
+
+def get_session(key, factory: Callable):
+    '''
+    Returns the session object (e.g. a connection) stored under key, creating it with factory on first use.
+    Sessions are shared by all backends, and thereby all Checkpointers, of the process.
+    '''
+    with _sessions_lock:
+        if key not in _sessions:
+            _sessions[key] = factory()
+        return _sessions[key]
+
+
+def register_backend(name: str, backend_class=None):
+    '''
+    Registers backend_class as transfer backend for checkpoint_transfer_mode name.
+    Can be used as a class decorator: `@register_backend("name")`.
+    '''
+    def register(backend_class):
+        with _registry_lock:
+            _backends[name] = backend_class
+        return backend_class
+    if backend_class is None:
+        return register
+    return register(backend_class)
+
+
+def _load_entry_points():
+    global _entry_points_loaded
+    if _entry_points_loaded:
+        return
+    _entry_points_loaded = True
+    from importlib import metadata
+    if sys.version_info >= (3, 10):
+        entry_points = metadata.entry_points(group=ENTRY_POINT_GROUP)
+    else:
+        entry_points = metadata.entry_points().get(ENTRY_POINT_GROUP, [])
+    for entry_point in entry_points:
+        if entry_point.name not in _backends:
+            register_backend(entry_point.name, entry_point.load())
+
+
+def available_backends() -> List[str]:
+    '''
+    Names of all registered backends, including those installed through the `checkpointer.backends` entry point group.
+    '''
+    _load_entry_points()
+    return sorted(_backends)
+
+
+def create_backend(name: str, **kwargs):
+    '''
+    Creates the backend registered as name with kwargs.
+    '''
+    if name not in _backends:
+        _load_entry_points()
+    assert name in _backends, f"unknown transfer backend {name}, available are {', '.join(available_backends())}"
+    return _backends[name](**kwargs)
+
+
+class TransferBackend:
+    '''
+    Base class of transfer backends, which move checkpoint files between the local file system and a target.
+    Subclasses implement the operations listed in their `capabilities` and are registered with `register_backend`,
+    or installed through the `checkpointer.backends` entry point group.
+    '''
+    capabilities = frozenset()
+
+    def supports(self, *capabilities) -> bool:
+        return all(capability in self.capabilities for capability in capabilities)
+
+    def stat(self, remote):
+        '''
+        Returns a RemoteStat of the remote file, or None if it does not exist.
+        '''
+        raise NotImplementedError
+
+    def exists(self, remote) -> bool:
+        return self.stat(remote) is not None
+
+    def put(self, local: Path, remote):
+        '''
+        Uploads the local file to the remote path.
+        '''
+        raise NotImplementedError
+
+    def get(self, remote, local: Path):
+        '''
+        Downloads the remote file to the local path.
+        '''
+        raise NotImplementedError
+
+    def get_range(self, remote, offset: int, size: int) -> bytes:
+        '''
+        Returns size bytes of the remote file starting at offset.
+        '''
+        raise NotImplementedError
+
+    def open_range_reader(self, remote):
+        '''
+        Opens the remote file for reading ranges. The returned handle has the thread-safe methods
+        read(offset, size) -> bytes and close().
+        '''
+        raise NotImplementedError
+
+    def open_range_writer(self, remote, truncate: bool = True):
+        '''
+        Opens the remote file for writing ranges, creating it if needed and truncating it if truncate is True.
+        The returned handle has the thread-safe methods write(offset, data) and close().
+        '''
+        raise NotImplementedError
+
+    def move(self, remote_source, remote_target):
+        '''
+        Renames remote_source to remote_target, replacing it if it exists.
+        '''
+        raise NotImplementedError
+
+    def direct_path(self, remote) -> Path:
+        '''
+        Returns a local Path under which the remote file or directory can be read (and memory-mapped) directly.
+        '''
+        raise NotImplementedError
+
+    def open_stream(self, remote):
+        '''
+        Returns a seekable, buffered binary file object reading the remote file without copying it first.
+        '''
+        raise NotImplementedError
+
+    def delete(self, remote):
+        '''
+        Removes the remote file, if it exists.
+        '''
+        raise NotImplementedError
+
+    def list(self, remote) -> List[str]:
+        '''
+        Returns the names of the entries of the remote directory.
+        '''
+        raise NotImplementedError
+
+    def make_dir(self, remote):
+        '''
+        Creates the remote directory and its parents, if they do not exist.
+        Does nothing by default, for backends without directories or creating them on put.
+        '''
+
+    def remove_dir(self, remote):
+        '''
+        Removes the remote directory, if it exists and is empty.
+        Does nothing by default, for backends without directories.
+        '''
+
+    def flush(self, timeout: float = None) -> bool:
+        '''
+        Blocks until operations the backend carries out in the background are finished.
+        Returns False if the timeout expired first. Backends without background operations return True right away.
+        '''
+        return True
+
+
+class RangeReaderStream(io.RawIOBase):
+    '''
+    Seekable, read-only file object on top of a range reader, see TransferBackend.open_range_reader.
+    '''
+
+    def __init__(self, reader, size: int) -> None:
+        super().__init__()
+        self.reader = reader
+        self.size = size
+        self.position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.position
+        elif whence == io.SEEK_END:
+            offset += self.size
+        self.position = max(0, offset)
+        return self.position
+
+    def readinto(self, buffer):
+        size = min(len(buffer), self.size - self.position)
+        if size <= 0:
+            return 0
+        data = self.reader.read(self.position, size)
+        buffer[:len(data)] = data
+        self.position += len(data)
+        return len(data)
+
+    def close(self):
+        if not self.closed:
+            self.reader.close()
+        super().close()
+
+
+class _FileRanges:
+    '''
+    Range reads and writes on a local file descriptor, as returned by SharedBackend.open_range_reader/writer.
+    '''
+
+    def __init__(self, path, flags) -> None:
+        self.fd = os.open(path, flags, 0o644)
+
+    def read(self, offset, size):
+        return os.pread(self.fd, size, offset)
+
+    def write(self, offset, data):
+        written = 0
+        while written < len(data):
+            written += os.pwrite(self.fd, data[written:], offset + written)
+
+    def close(self):
+        os.close(self.fd)
+
+
+@register_backend("shared")
+class SharedBackend(TransferBackend):
+    '''
+    Backend for targets on a mounted file system. Remote paths are Paths.
+    Copies use the fastest path the file systems support, see transport.copy_file.
+    '''
+    capabilities = CAPABILITIES
+
+    def __init__(self) -> None:
+        self.last_copy_method = None
+
+    def _resolve(self, remote) -> Path:
+        return Path(remote)
+
+    def stat(self, remote):
+        try:
+            stat = os.stat(self._resolve(remote))
+        except (FileNotFoundError, NotADirectoryError):
+            return None
+        return RemoteStat(stat.st_size, stat.st_mtime)
+
+    def put(self, local, remote):
+        target = self._resolve(remote)
+        if target.is_dir():
+            target = target / Path(local).name
+        # replace the target atomically, so readers (e.g. memory maps of a direct restore) never see a partial file
+        tmp_target = target.with_name(f".{target.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            self.last_copy_method = copy_file(local, tmp_target)
+            os.replace(tmp_target, target)
+        finally:
+            tmp_target.unlink(missing_ok=True)
+
+    def get(self, remote, local):
+        self.last_copy_method = copy_file(self._resolve(remote), local)
+
+    def get_range(self, remote, offset, size):
+        with open(self._resolve(remote), "rb") as file:
+            return os.pread(file.fileno(), size, offset)
+
+    def open_range_reader(self, remote):
+        return _FileRanges(self._resolve(remote), os.O_RDONLY)
+
+    def open_range_writer(self, remote, truncate=True):
+        self._resolve(remote).parent.mkdir(parents=True, exist_ok=True)
+        return _FileRanges(self._resolve(remote), os.O_WRONLY | os.O_CREAT | (os.O_TRUNC if truncate else 0))
+
+    def move(self, remote_source, remote_target):
+        os.replace(self._resolve(remote_source), self._resolve(remote_target))
+
+    def direct_path(self, remote):
+        return self._resolve(remote)
+
+    def open_stream(self, remote):
+        return open(self._resolve(remote), "rb")
+
+    def delete(self, remote):
+        self._resolve(remote).unlink(missing_ok=True)
+
+    def list(self, remote):
+        return sorted(entry.name for entry in self._resolve(remote).iterdir())
+
+    def make_dir(self, remote):
+        self._resolve(remote).mkdir(parents=True, exist_ok=True)
+
+    def remove_dir(self, remote):
+        try:
+            self._resolve(remote).rmdir()
+        except OSError:  # does not exist or is not empty
+            pass
+
+
+@register_backend("local")
+class LocalDirectoryBackend(SharedBackend):
+    '''
+    Stand-in for remote storage in a local directory, e.g. for tests or offline development.
+    Remote paths are strings like in xrootd mode and are resolved relative to root.
+    '''
+
+    def __init__(self, root) -> None:
+        super().__init__()
+        self.root = Path(root)
+
+    def _resolve(self, remote) -> Path:
+        return self.root / str(remote).lstrip("/")
+
+    def put(self, local, remote):
+        self._resolve(remote).parent.mkdir(parents=True, exist_ok=True)
+        super().put(local, remote)
+
+
+class _XRootDRanges:
+    '''
+    Range reads and writes on an open XRootD client.File.
+    '''
+
+    def __init__(self, file, remote) -> None:
+        self.file = file
+        self.remote = remote  # path of the file, for error messages
+
+    def read(self, offset, size):
+        status, data = self.file.read(offset, size)
+        XRootDBackend._check(status, "read", self.remote)
+        return data
+
+    def write(self, offset, data):
+        status, _ = self.file.write(data, offset, len(data))
+        XRootDBackend._check(status, "write", self.remote)
+
+    def close(self):
+        self.file.close()
+
+
+@register_backend("xrootd")
+class XRootDBackend(TransferBackend):
+    '''
+    Backend for XRootD storage. Remote paths are strings relative to server_name.
+    The client.FileSystem of a server is shared by all backends of the process.
+    '''
+    capabilities = CAPABILITIES - {"direct_read"}
+
+    def __init__(self, server_name: str) -> None:
+        from XRootD import client
+        from XRootD.client.flags import MkDirFlags, OpenFlags
+        self.client = client
+        self.MkDirFlags = MkDirFlags
+        self.OpenFlags = OpenFlags
+        self.server_name = server_name
+        self.file_system = get_session(("xrootd", server_name), lambda: client.FileSystem(server_name))
+
+    def stat(self, remote):
+        status, info = self.file_system.stat(remote)
+        if not status.ok:
+            return None
+        return RemoteStat(info.size, info.modtime)
+
+    @staticmethod
+    def _check(status, action, remote):
+        if not status.ok:
+            raise OSError(f"xrootd {action} of {remote} failed: {status.message}")
+
+    def put(self, local, remote):
+        status, _ = self.file_system.copy(
+            'file://' + str(local), self.server_name + remote, force=True
+        )
+        self._check(status, "put", remote)
+
+    def get(self, remote, local):
+        status, _ = self.file_system.copy(self.server_name + remote, str(local), force=True)
+        self._check(status, "get", remote)
+
+    def get_range(self, remote, offset, size):
+        with self.client.File() as file:
+            status, _ = file.open(self.server_name + remote, self.OpenFlags.READ)
+            self._check(status, "open", remote)
+            status, data = file.read(offset, size)
+            self._check(status, "read", remote)
+            return data
+
+    def _open(self, remote, flags):
+        file = self.client.File()
+        status, _ = file.open(self.server_name + remote, flags)
+        self._check(status, "open", remote)
+        return _XRootDRanges(file, remote)
+
+    def open_range_reader(self, remote):
+        return self._open(remote, self.OpenFlags.READ)
+
+    def open_range_writer(self, remote, truncate=True):
+        if truncate:
+            return self._open(remote, self.OpenFlags.DELETE | self.OpenFlags.MAKEPATH)
+        return self._open(remote, self.OpenFlags.UPDATE)
+
+    def open_stream(self, remote):
+        size = self.stat(remote).size
+        return io.BufferedReader(RangeReaderStream(self.open_range_reader(remote), size), buffer_size=8 * 2**20)
+
+    def move(self, remote_source, remote_target):
+        # a single rename, so readers see either the old or the new file. Removing the target first
+        # would leave no checkpoint at all if the job is killed in between.
+        status, _ = self.file_system.mv(remote_source, remote_target)
+        self._check(status, "move", remote_target)
+
+    def delete(self, remote):
+        status, _ = self.file_system.rm(remote)
+        # deleting a file that does not exist is fine
+        if status.errno != XROOTD_NOT_FOUND:
+            self._check(status, "delete", remote)
+
+    def list(self, remote):
+        status, listing = self.file_system.dirlist(remote)
+        self._check(status, "list", remote)
+        return sorted(entry.name for entry in listing)
+
+    def make_dir(self, remote):
+        # fails if the directory exists already, which is fine
+        self.file_system.mkdir(remote, self.MkDirFlags.MAKEPATH)
+
+    def remove_dir(self, remote):
+        # fails if the directory does not exist or is not empty, which is fine
+        self.file_system.rmdir(remote)
+
+
+@register_backend("manual")
+class ManualBackend(TransferBackend):
+    '''
+    Backend calling a user-defined callback(source, destination, **callback_kwargs) for both directions.
+    '''
+    capabilities = frozenset(["put", "get"])
+
+    def __init__(self, callback: Callable, callback_kwargs: dict = None) -> None:
+        self.callback = callback
+        self.callback_kwargs = callback_kwargs if callback_kwargs else {}
+
+    def put(self, local, remote):
+        self.callback(local, remote, **self.callback_kwargs)
+
+    def get(self, remote, local):
+        self.callback(remote, local, **self.callback_kwargs)
@@ -0,0 +1,233 @@
+import os
+import threading
+import time
+from collections.abc import Mapping
+from pathlib import Path
+
+
+def parse_class_ad_value(text: str):
+    '''
+    Converts the text of a ClassAd attribute value to a Python value: quoted strings to str,
+    true and false to bool, numbers to int or float, and undefined to None.
+    Expressions are returned as their text.
+    '''
+    text = text.strip()
+    if len(text) >= 2 and text[0] == '"' and text[-1] == '"':
+        return text[1:-1].replace('\\"', '"').replace("\\\\", "\\")
+    lowered = text.lower()
+    if lowered == "true":
+        return True
+    if lowered == "false":
+        return False
+    if lowered == "undefined":
+        return None
+    for convert in (int, float):
+        try:
+            return convert(text)
+        except ValueError:
+            pass
+    return text
+
+
+class JobAd(Mapping):
+    '''
+    Mapping of the attributes of an HTCondor job ad file to typed values, see parse_class_ad_value.
+    The file is parsed once, and again only if its modification time changes, e.g. when HTCondor updates it.
+    '''
+
+    def __init__(self, path: Path) -> None:
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._raw = {}
+        self._values = {}
+
+    def _refresh(self) -> None:
+        mtime = self.path.stat().st_mtime_ns
+        with self._lock:
+            if mtime == self._mtime:
+                return
+            raw = {}
+            with open(self.path, "r") as file:
+                for line in file:
+                    name, separator, value = line.partition("=")
+                    if separator and name.strip():
+                        raw[name.strip()] = value.strip()
+            self._raw = raw
+            self._values = {name: parse_class_ad_value(value) for name, value in raw.items()}
+            self._mtime = mtime
+
+    def raw(self, name: str):
+        '''
+        Returns the unparsed text of the attribute, or None if it is not set.
+        '''
+        self._refresh()
+        return self._raw.get(name)
+
+    def __getitem__(self, name):
+        self._refresh()
+        return self._values[name]
+
+    def __iter__(self):
+        self._refresh()
+        return iter(self._values)
+
+    def __len__(self):
+        self._refresh()
+        return len(self._values)
+
+
+_job_ads = {}
+_job_ads_lock = threading.Lock()
+
+
+def get_job_ad(path: Path = None) -> JobAd:
+    '''
+    Returns the cached JobAd of path, by default of the file named by the _CONDOR_JOB_AD environment variable.
+    '''
+    if path is None:
+        path = os.environ.get("_CONDOR_JOB_AD")
+        assert path, "_CONDOR_JOB_AD is not set, not running in an HTCondor job?"
+    path = Path(path)
+    with _job_ads_lock:
+        if path not in _job_ads:
+            _job_ads[path] = JobAd(path)
+        return _job_ads[path]
+
+
+class BatchSystem:
+    '''
+    Settings of the batch system the job runs in, relevant for checkpointing.
+    Every property is None if the batch system does not provide it.
+    '''
+    name = None
+
+    @property
+    def checkpoint_exit_code(self):
+        '''
+        Exit code telling the batch system that the job checkpointed and wants to be rescheduled.
+        '''
+        return None
+
+    @property
+    def transfer_target(self):
+        '''
+        Where the batch system transfers the checkpoint to.
+        '''
+        return None
+
+    @property
+    def grace_time(self):
+        '''
+        Seconds between the signal to terminate and the job being killed.
+        '''
+        return None
+
+    @property
+    def retirement_time(self):
+        '''
+        Unix time at which the job has to be finished.
+        '''
+        return None
+
+    @property
+    def remaining_time(self):
+        '''
+        Seconds until the retirement_time.
+        '''
+        if self.retirement_time is None:
+            return None
+        return self.retirement_time - time.time()
+
+
+class HTCondor(BatchSystem):
+    '''
+    Settings from the HTCondor job ad.
+    '''
+    name = "htcondor"
+
+    def __init__(self, job_ad: JobAd = None) -> None:
+        self.job_ad = job_ad if job_ad is not None else get_job_ad()
+
+    def _number(self, *names):
+        for name in names:
+            value = self.job_ad.get(name)
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                return value
+        return None
+
+    @property
+    def checkpoint_exit_code(self):
+        # in some versions of HTCondor, this attribute was renamed
+        return self._number("CheckpointExitCode", "SuccessCheckpointExitCode")
+
+    @property
+    def transfer_target(self):
+        return self.job_ad.get("TransferCheckpoint")
+
+    @property
+    def grace_time(self):
+        '''
+        Seconds from JobMaxVacateTime. The MachineMaxVacateTime of the slot is not in the job ad.
+        '''
+        return self._number("JobMaxVacateTime")
+
+    @property
+    def runtime_limit(self):
+        '''
+        Seconds the job may run, from MaxRuntime, set in the submit file as +MaxRuntime.
+        MaxJobRetirementTime is not a runtime limit: it bounds how long a job may finish after the machine asked it to leave.
+        '''
+        return self._number("MaxRuntime")
+
+    @property
+    def retirement_time(self):
+        start = self._number("JobCurrentStartDate", "JobStartDate")
+        limit = self.runtime_limit
+        if start is None or limit is None:
+            return None
+        return start + limit
+
+
+class Slurm(BatchSystem):
+    '''
+    Settings from the environment variables of a SLURM job.
+    SLURM does not know checkpoint exit codes or transfers; grace_time is read from CHECKPOINTER_GRACE_TIME,
+    since SLURM's KillWait is not visible to the job.
+    '''
+    name = "slurm"
+
+    def __init__(self, environ: Mapping = None) -> None:
+        self.environ = environ if environ is not None else os.environ
+
+    def _number(self, name):
+        try:
+            return float(self.environ[name])
+        except (KeyError, ValueError):
+            return None
+
+    @property
+    def grace_time(self):
+        return self._number("CHECKPOINTER_GRACE_TIME")
+
+    @property
+    def retirement_time(self):
+        return self._number("SLURM_JOB_END_TIME")
+
+    @property
+    def runtime_limit(self):
+        start, end = self._number("SLURM_JOB_START_TIME"), self.retirement_time
+        if start is None or end is None:
+            return None
+        return end - start
+
+
+def detect_batch_system():
+    '''
+    Returns the BatchSystem the job runs in, or None if no supported batch system is detected.
+    '''
+    if os.environ.get("_CONDOR_JOB_AD"):
+        return HTCondor()
+    if "SLURM_JOB_ID" in os.environ:
+        return Slurm()
+    return None
@@ -0,0 +1,125 @@
+import hashlib
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+from .transport import copy_file
+
+
+def file_digest(path: Path) -> str:
+    '''
+    Returns the hex digest of the content of the file.
+    '''
+    digest = hashlib.blake2b(digest_size=20)
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(2**20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class LocalCheckpointCache:
+    '''
+    Node-local cache of checkpoint files, keyed by the key recorded next to the file on the target.
+    It survives the job, so a job rescheduled to the same node can reuse the checkpoint instead of downloading it.
+    Files are hard linked into the cache if possible, so adding a file does not copy it. As the linked file may be
+    rewritten in place later, every entry is named after its key and modification time, and an entry modified since
+    it was added is discarded instead of restored.
+    Entries are evicted least recently used first once the cache grows beyond max_size bytes.
+    Entries are added atomically, so several jobs on the node can share the cache directory.
+    '''
+
+    def __init__(self, directory: Path, max_size: int = 10 * 2**30) -> None:
+        self.directory = Path(directory)
+        self.max_size = max_size
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _entry(self, key: str):
+        '''
+        Returns the valid entry stored under key, or None if there is none.
+        '''
+        for entry in self.directory.glob(f"{key}.*"):
+            try:
+                if entry.stat().st_mtime_ns == int(entry.name.rsplit(".", 1)[1]):
+                    return entry
+            except (FileNotFoundError, ValueError):
+                continue
+            entry.unlink(missing_ok=True)  # the file was modified after it was added
+        return None
+
+    @staticmethod
+    def _touch(entry: Path) -> None:
+        # marks the entry as recently used, keeping its modification time
+        try:
+            os.utime(entry, ns=(time.time_ns(), entry.stat().st_mtime_ns))
+        except FileNotFoundError:  # evicted by another job
+            pass
+
+    def get(self, key: str, destination: Path) -> bool:
+        '''
+        Copies the entry stored under key to destination. Returns False if there is no such entry.
+        '''
+        entry = self._entry(key)
+        if entry is None:
+            self.misses += 1
+            return False
+        try:
+            copy_file(entry, destination)
+        except FileNotFoundError:  # evicted by another job
+            self.misses += 1
+            return False
+        except shutil.SameFileError:
+            pass  # destination is the file the entry was linked from, and unmodified
+        self._touch(entry)
+        self.hits += 1
+        return True
+
+    def put(self, path: Path, key: str) -> None:
+        '''
+        Links or copies the file into the cache under key and evicts old entries if the cache is too large.
+        '''
+        entry = self._entry(key)
+        if entry is not None:
+            self._touch(entry)
+            return
+        if Path(path).stat().st_size > self.max_size:
+            return
+        tmp_entry = self.directory / f".{key}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            try:
+                os.link(path, tmp_entry)
+            except OSError:  # e.g. the cache is on another file system
+                copy_file(path, tmp_entry)
+            entry = self.directory / f"{key}.{tmp_entry.stat().st_mtime_ns}"
+            os.replace(tmp_entry, entry)
+        finally:
+            tmp_entry.unlink(missing_ok=True)
+        self._touch(entry)
+        self.evict()
+
+    def evict(self) -> None:
+        '''
+        Removes the least recently used entries until the cache is not larger than max_size.
+        '''
+        with self._lock:
+            entries = []
+            for entry in self.directory.iterdir():
+                if entry.name.startswith("."):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:  # evicted by another job
+                    continue
+                if entry.name.rsplit(".", 1)[-1] != str(stat.st_mtime_ns):
+                    entry.unlink(missing_ok=True)  # modified after it was added, never restored
+                    continue
+                entries.append((stat.st_atime, stat.st_size, entry))
+            size = sum(entry_size for _, entry_size, _ in entries)
+            for _, entry_size, entry in sorted(entries, key=lambda item: item[0]):
+                if size <= self.max_size:
+                    break
+                entry.unlink(missing_ok=True)
+                size -= entry_size
@@ -1,11 +1,53 @@
-import shutil
-from typing import Callable, Union
-import os
+from typing import Callable, Union, List
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
+import atexit
+import json
+import os
+import posixpath
+import random
+import shutil
+import tempfile
 import signal
 import sys
+import threading
+import time
+import uuid
+import weakref
+from contextlib import contextmanager
 from multiprocessing import current_process
-from .checkpointing_utils import get_condor_job_ad_settings
+from .backends import available_backends, create_backend, remote_join, remote_parent, remote_with_suffix
+from .batch_system import HTCondor
+from .cache import LocalCheckpointCache, file_digest
+from .chunking import ChunkStore
+from .compression import AdaptiveCompression, FixedCompression, compress_file, compressed_codec, decompress_file
+from .distributed import ShardCoordinator, detect_rank_and_world_size
+from .instrumentation import CheckpointMetrics
+from .ranged import RangedTransfer
+from .throttling import TransferThrottle, put_throttled
+# not used here, importing the module registers the "tiered" transfer mode with register_backend
+from .tiering import TieredBackend  # noqa: F401
+from .transfer_worker import TransferWorker
+from .transport import copy_file
+
+
+# lists the files of a multi-file checkpoint on the target, written after all of them are transferred
+INDEX_FILE = ".checkpointer_index.json"
+# a changed file of a multi-file checkpoint is uploaded into the slot directory not holding its current copy,
+# so the files listed by the index on the target are never overwritten before a new index replaces it
+SLOT_DIRS = ("slot-0", "slot-1")
+# suffix of the record of the cache key stored next to each file on the target when a local cache is used
+VERSION_SUFFIX = ".version"
+# seconds a normal interpreter exit waits for background writes and transfers, unless a sigterm_time_budget is set
+EXIT_FLUSH_TIMEOUT = 300
+
+
+def _flush_at_exit(reference):
+    checkpointer = reference()
+    if checkpointer is None:
+        return
+    if not checkpointer.flush(checkpointer.sigterm_time_budget or EXIT_FLUSH_TIMEOUT):
+        print("Checkpointer: background writes or transfers failed or did not finish before the exit.")
 
 
 class Checkpointer:
@@ -21,11 +63,12 @@ class Checkpointer:
     def __init__(
         self,
         # Path or list of Paths of files defining the checkpoint
-        # file or list of files defining the checkpoint
-        local_checkpoint_file: Path,
+        # file, directory or list of files defining the checkpoint
+        local_checkpoint_file: Union[Path, List[Path]],
         checkpoint_function: Callable,  # function to call to create the checkpoints
         restore_function: Callable,  # function to call to restore the checkpoints
-        # how to trasfer the checkpoint files, currently None(default), shared, xrootd, manual and htcondor are supported
+        # how to trasfer the checkpoint files, currently None(default), shared, xrootd, manual, local and htcondor are supported,
+        # as well as backends registered with checkpointer.backends.register_backend
         checkpoint_transfer_mode: str = "None",
         # where to store the checkpoint files, if None, the current working directory is used
         checkpoint_transfer_target: Union[str, Path] = None,
@@ -35,58 +78,189 @@ class Checkpointer:
         checkpoint_transfer_callback: Callable = None,
         # kwargs to be used in in checkpoint_transfer
         checkpoint_transfer_callback_kwargs: dict = None,
+        # kwargs to create the transfer backend with, e.g. the root directory in local mode
+        checkpoint_transfer_backend_kwargs: dict = None,
         checkpoint_every: int = 10,  # how often to create checkpoints
+        # start the checkpoint_every cycle at a random step, so jobs started together do not checkpoint together
+        randomize_phase: bool = False,
+        # wall-clock schedule replacing checkpoint_every, e.g. a checkpointer.scheduling.AdaptiveSchedule
+        checkpoint_schedule=None,
         # function to call before exiting on SIGTERM
         on_SIGTERM_prehook: Callable = None,
         on_SIGTERM_prehook_kwargs: dict = None,  # kwargs to pass to on_SIGTERM_prehook
+        # seconds on_SIGTERM may take before exiting, in htcondor mode read from JobMaxVacateTime if None
+        sigterm_time_budget: float = None,
+        # transfer checkpoints in a background thread instead of blocking step()
+        async_transfer: bool = False,
+        # function to copy the value into host memory before it is persisted in the background
+        snapshot_function: Callable = None,
+        # upload only changed chunks of the checkpoint in shared, local and xrootd mode
+        deduplicate_transfers: bool = False,
+        chunk_size: int = 4 * 2**20,  # size of the chunks in bytes used with deduplicate_transfers
+        transfer_workers: int = 4,  # number of files of a multi-file checkpoint transferred concurrently
+        # split large files into ranges transferred over parallel streams, resuming after failures
+        ranged_transfers: bool = False,
+        range_size: int = 64 * 2**20,  # size of the ranges in bytes used with ranged_transfers
+        transfer_streams: int = 4,  # number of parallel streams per file used with ranged_transfers
+        transfer_retries: int = 5,  # how often a failed range is retried with ranged_transfers
+        # "copy" fetches the checkpoint before restoring, "direct" restores from the target without a local copy
+        restore_mode: str = "copy",
+        # node-local directory keeping copies of transferred checkpoints, reused by later jobs on the node
+        local_cache_dir: Path = None,
+        local_cache_size: int = 10 * 2**30,  # maximum size of the local_cache_dir in bytes
+        # write one shard per process of a multi-process (e.g. DDP) training, committed together
+        distributed: bool = False,
+        rank: int = None,  # rank of this process with distributed, read from the environment if None
+        world_size: int = None,  # number of processes with distributed, read from the environment if None
+        shard_commit_timeout: float = 600,  # how long rank 0 waits in the background for the shards of the other ranks in seconds
+        # collects timings and throughput of all phases, e.g. a checkpointer.instrumentation.CheckpointMetrics with exports
+        metrics: CheckpointMetrics = None,
+        # compress files before transferring them: "auto", a codec name, or a checkpointer.compression.AdaptiveCompression
+        compression=None,
+        compression_level: int = None,  # level of a fixed compression codec, the codec's default if None
+        # limits bandwidth and concurrency of the transfers, e.g. a checkpointer.throttling.TransferThrottle
+        transfer_throttle: TransferThrottle = None,
+        # start fetching the checkpoint in the background when the checkpointer is created, see prefetch()
+        prefetch: bool = False,
 
     ) -> None:
         '''
         Class to manage checkpoiniting in different contexts.
         parameters:
-            local_checkpoint_file: Path or list of Paths of files defining the checkpoint in the current enviroment
+            local_checkpoint_file: Path or list of Paths of files defining the checkpoint in the current enviroment.
+                If a list of Paths or a directory is given, checkpoint_transfer_target is used as directory holding the files.
             checkpoint_function: function to call to create the checkpoints
             restore_function: function to call to restore the checkpoints
-            checkpoint_transfer_mode: how to trasfer the checkpoint files, currently None(default), shared, xrootd, manual and htcondor are supported.
+            checkpoint_transfer_mode: how to trasfer the checkpoint files, currently None(default), shared, xrootd, manual, local and htcondor are supported,
+                as well as backends registered with checkpointer.backends.register_backend.
+                tiered writes to several tiers of storage, given as checkpoint_transfer_backend_kwargs={"tiers": [...]},
+                see checkpointer.tiering.TieredBackend.
             checkpoint_transfer_target: where to store the checkpoint files, if None, the current working directory is used
             xrootd_server_name: name of the xrootd server to use in xrootd mode
             checkpoint_transfer_callback: function to call when manual checkpoint_transfer_mode is used
             checkpoint_transfer_callback_kwargs: kwargs to be used in in checkpoint_transfer
+            checkpoint_transfer_backend_kwargs: kwargs to create the transfer backend with, e.g. {"root": ...} in local mode
             checkpoint_every: how often to create checkpoints when using the step function
+            randomize_phase: if True, the step function creates the first checkpoint after a random number of steps below checkpoint_every,
+                and every checkpoint_every steps from there, spreading the checkpoints of jobs started together
+            checkpoint_schedule: object deciding when the step function creates checkpoints instead of checkpoint_every,
+                e.g. a checkpointer.scheduling.AdaptiveSchedule
             on_SIGTERM_prehook: function to call before exiting on SIGTERM
             on_SIGTERM_prehook_kwargs: kwargs to pass to on_SIGTERM_prehook
+            sigterm_time_budget: seconds on_SIGTERM may take before the job is killed, should be below the grace time of the batch system.
+                If the last checkpoint and transfer took longer than the remaining budget, on_SIGTERM only transfers the last
+                checkpoint written, or skips the transfer if that does not fit either. Once the budget is used up,
+                the process exits with checkpoint_exit_code regardless. In htcondor mode, defaults to 90% of JobMaxVacateTime.
+            async_transfer: if True, step() hands the transfer to a background thread. Pending transfers are replaced by newer ones.
+                A failed background transfer is raised by the next step(), and flush() returns False.
+                At a normal interpreter exit, pending writes and transfers are waited for up to EXIT_FLUSH_TIMEOUT seconds.
+            snapshot_function: function receiving the value and returning a copy of it, e.g. a checkpointer.snapshot.StateSnapshot.
+                If set, checkpoint_function is called with the copy in a background thread.
+            deduplicate_transfers: if True, the checkpoint is stored in content-addressed chunks next to checkpoint_transfer_target
+                and only chunks that changed since the last checkpoint are uploaded. Supported in shared, local and xrootd mode.
+            chunk_size: size of the chunks in bytes used with deduplicate_transfers
+            transfer_workers: number of files of a multi-file checkpoint transferred concurrently
+            ranged_transfers: if True, files larger than range_size are transferred in ranges over transfer_streams parallel streams.
+                Failed ranges are retried transfer_retries times with exponential backoff, and interrupted transfers are resumed.
+                Supported in shared, local and xrootd mode.
+            range_size: size of the ranges in bytes used with ranged_transfers
+            transfer_streams: number of parallel streams per file used with ranged_transfers
+            transfer_retries: how often a failed range is retried with ranged_transfers
+            restore_mode: "copy" (default) fetches the checkpoint to local_checkpoint_file before calling restore_function.
+                "direct" passes restore_function the checkpoint on the target instead: a Path on mounted file systems (shared and local mode),
+                or a seekable binary file object streaming it (xrootd mode). Falls back to "copy" if the backend supports neither,
+                and for deduplicate_transfers.
+            local_cache_dir: node-local directory keeping links or copies of transferred checkpoint files, keyed by a random key per upload.
+                The key is recorded next to each file on the target, so get_checkpoint only fetches this small record
+                if the checkpoint is in the cache.
+            local_cache_size: maximum size of the local_cache_dir in bytes, least recently used files are evicted first
+            compression: compresses every file before it is transferred. "auto" chooses codec and level per file from their measured
+                speed and ratio and the observed transfer bandwidth (see checkpointer.compression.AdaptiveCompression, which can be passed
+                for tuning); "zstd", "lz4" or "zlib" always use that codec. Compressed files are framed with a header naming the codec,
+                and get_checkpoint decompresses them transparently. Can not be combined with deduplicate_transfers, and restore_mode
+                "direct" falls back to "copy".
+            compression_level: level of the codec, if compression names one
+            transfer_throttle: a checkpointer.throttling.TransferThrottle delaying transfers by a random jitter,
+                limiting the upload bandwidth and the number of jobs transferring to a shared storage at once
+            prefetch: if True, prefetch() is called at the end of the constructor, so the checkpoint is fetched
+                while the program sets up everything else
         '''
 
-        # if only one checkpoint path is given, convert to list
-        assert isinstance(
-            local_checkpoint_file, Path
-        ), "local_checkpoint_file must be a list of Paths"
+        if isinstance(local_checkpoint_file, (list, tuple)):
+            local_checkpoint_file = list(local_checkpoint_file)
+            assert all(
+                isinstance(path, Path) for path in local_checkpoint_file
+            ), "local_checkpoint_file must be a Path or a list of Paths"
+            assert len({path.name for path in local_checkpoint_file}) == len(
+                local_checkpoint_file
+            ), "the files in local_checkpoint_file must have unique names"
+        else:
+            assert isinstance(
+                local_checkpoint_file, Path
+            ), "local_checkpoint_file must be a Path or a list of Paths"
         # set parameters
         self.local_checkpoint_file = local_checkpoint_file
         self.checkpoint_function = checkpoint_function
         self.restore_function = restore_function
+        self.snapshot_function = snapshot_function
         self.checkpoint_transfer_mode = checkpoint_transfer_mode
         self.checkpoint_transfer_target = checkpoint_transfer_target
         self.checkpoint_transfer_callback = checkpoint_transfer_callback
         self.checkpoint_transfer_callback_kwargs = checkpoint_transfer_callback_kwargs
         self.checkpoint_every = checkpoint_every
+        self._phase = random.randrange(checkpoint_every) if randomize_phase else 0
+        self.checkpoint_schedule = checkpoint_schedule
+        self.transfer_workers = transfer_workers
+        assert restore_mode in ["copy", "direct"], "restore_mode must be one of copy, direct"
+        self.restore_mode = restore_mode
         self.on_SIGTERM_prehook = on_SIGTERM_prehook if on_SIGTERM_prehook else lambda: None
         self.on_SIGTERM_prehook_kwargs = on_SIGTERM_prehook_kwargs if on_SIGTERM_prehook_kwargs else {}
+        self.sigterm_time_budget = sigterm_time_budget
+        self.metrics = metrics if metrics is not None else CheckpointMetrics()
+        self.transfer_throttle = transfer_throttle
         self.checkpoint_exit_code = 85
 
         # initialize internal variables
         self.step_counter = 0
         self.checkpoint_value = None
+        self.last_transfer_duration = None
+        self.last_checkpoint_duration = None
+        # whether the local checkpoint files were transferred since they were last written
+        self._local_checkpoint_transferred = False
+        self.last_copy_method = None  # in shared mode, the copy path used by the last transfer
+        # target of the last multi-file transfer and the signatures, digests and slots of the files uploaded to it
+        self._uploaded_files = (None, {})
+        # guards local_checkpoint_file against being rewritten while it is staged for a transfer or fetched
+        self._local_file_lock = threading.RLock()
+        # serializes the transfers, which upload a staged copy of the files without holding the _local_file_lock
+        self._transfer_lock = threading.Lock()
+        self._staged_transfers = 0  # number of transfers reading hard links of the local files
+        self._writes = 0  # number of checkpoints written, to tell whether a transfer is still the newest
+        self._written_step = 0  # step_counter of the step the local checkpoint was written in, numbering its generation
+        self._sent_bytes = 0  # bytes uploaded, after skipping unchanged files, chunks and ranges and after compression
+        self._sent_bytes_lock = threading.Lock()
+        self._transfer_worker = TransferWorker() if async_transfer or snapshot_function else None
+        # writes snapshots in the background, while the _transfer_worker uploads the previous checkpoint
+        self._write_worker = None
+        if self._transfer_worker is not None:
+            self._write_worker = TransferWorker(name="checkpointer-write", description="checkpoint write")
+        # set while no background write reads the buffers of a snapshot
+        self._snapshot_released = threading.Event()
+        self._snapshot_released.set()
+        if self._transfer_worker is not None:
+            # the workers are daemon threads, which would be stopped in the middle of a transfer
+            atexit.register(_flush_at_exit, weakref.ref(self))
 
-        # register signal handlers only in the main process
-        if current_process().name == "MainProcess":
+        # register signal handlers only in the main process, or in the main thread of every rank with distributed
+        if (current_process().name == "MainProcess" or distributed) and \
+                threading.current_thread() is threading.main_thread():
             signal.signal(signal.SIGTERM, self.on_SIGTERM)
             signal.signal(signal.SIGINT, self.on_SIGTERM)
 
         # setup transfer mode
-        assert self.checkpoint_transfer_mode in [
-            "None", "shared", "xrootd", "manual", "htcondor"
-        ], "checkpoint_transfer_mode must be one of None, shared, xrootd, manual, htcondor"
+        backend_kwargs = dict(checkpoint_transfer_backend_kwargs) if checkpoint_transfer_backend_kwargs else {}
+        assert self.checkpoint_transfer_mode in ["None", "htcondor"] + available_backends(), \
+            "checkpoint_transfer_mode must be one of None, htcondor, " + ", ".join(available_backends())
 
         if self.checkpoint_transfer_mode == "shared":
             assert isinstance(
@@ -97,57 +271,213 @@ class Checkpointer:
             assert isinstance(
                 checkpoint_transfer_target, str
             ), "checkpoint_transfer_target must be a string in xrootd mode"
-            assert local_checkpoint_file.is_absolute(
+            assert all(
+                path.is_absolute() for path in self._local_paths
             ), "local_checkpoint_file must be absolute paths in xrootd mode"
             assert xrootd_server_name is not None, "xrootd_server_name not set"
-            from XRootD import client
-            from XRootD.client.flags import DirListFlags
-            self.DirListFlags = DirListFlags  # need this later for the exists check
             self.xrootd_server_name = xrootd_server_name
-            self.xrootd_client = client.FileSystem(xrootd_server_name)
+            backend_kwargs["server_name"] = xrootd_server_name
 
         elif self.checkpoint_transfer_mode == "manual":
             assert self.checkpoint_transfer_callback is not None, "checkpoint_transfer_callback not set"
             assert self.checkpoint_transfer_callback_kwargs is not None, "checkpoint_transfer_callback_kwargs not set"
+            backend_kwargs["callback"] = self.checkpoint_transfer_callback
+            backend_kwargs["callback_kwargs"] = self.checkpoint_transfer_callback_kwargs
 
         elif self.checkpoint_transfer_mode == "htcondor":
-            self.checkpoint_transfer_target = Path(
-                get_condor_job_ad_settings("TransferCheckpoint")
-            )
-            assert self.checkpoint_transfer_target != "", "transfer_checkpoint_files not set in condor job ad"
+            batch_system = HTCondor()
+            assert batch_system.transfer_target, "TransferCheckpoint not set in condor job ad"
+            self.checkpoint_transfer_target = Path(batch_system.transfer_target)
             # Warning! This overwrites the checkpoint_exit_code set above
-            try:
-                self.checkpoint_exit_code = int(  
-                    get_condor_job_ad_settings("CheckpointExitCode")
-                )
-            except TypeError: # in some version of HTcondor, this classAdd was renamed
-                self.checkpoint_exit_code = int(  
-                    get_condor_job_ad_settings("SuccessCheckpointExitCode")
-                )
+            assert batch_system.checkpoint_exit_code is not None, "CheckpointExitCode not set in condor job ad"
+            self.checkpoint_exit_code = int(batch_system.checkpoint_exit_code)
+            if self.sigterm_time_budget is None and batch_system.grace_time is not None:
+                # leave some of the grace time for exiting
+                self.sigterm_time_budget = 0.9 * batch_system.grace_time
+
+        # None and htcondor mode do not transfer anything themselves
+        self.backend = None
+        if self.checkpoint_transfer_mode not in ["None", "htcondor"]:
+            self.backend = create_backend(self.checkpoint_transfer_mode, **backend_kwargs)
+
+        self._ranged_transfer = None
+        if ranged_transfers:
+            assert self.backend is not None, "ranged_transfers needs a transfer backend"
+            self._ranged_transfer = RangedTransfer(
+                self.backend, range_size=range_size, streams=transfer_streams, retries=transfer_retries,
+                throttle=transfer_throttle.consume if transfer_throttle is not None else None,
+                # next to the checkpoint, but outside of a directory checkpoint
+                state_dir=self._local_paths[0].parent / ".checkpointer-ranged",
+            )
+
+        self._cache = None
+        if local_cache_dir is not None:
+            assert self.backend is not None and self.backend.supports("stat"), "local_cache_dir needs a transfer backend supporting stat"
+            self._cache = LocalCheckpointCache(local_cache_dir, local_cache_size)
+
+        self._chunk_store = None
+        if deduplicate_transfers:
+            assert self.backend is not None and self.backend.supports(
+                "stat", "put", "get", "delete"
+            ), "deduplicate_transfers needs a transfer backend supporting stat, put, get and delete"
+            self._chunk_store = ChunkStore(
+                put=self._put_file,
+                get=self._get_file,
+                stat=self.backend.stat,
+                remove=self.backend.delete,
+                make_dir=self.backend.make_dir,
+                chunk_size=chunk_size,
+                move=self.backend.move if self.backend.supports("move") else None,
+            )
+
+        self._compression = None
+        if compression is not None:
+            assert self.backend is not None, "compression needs a transfer backend"
+            assert self._chunk_store is None, "compression can not be combined with deduplicate_transfers"
+            if compression == "auto":
+                compression = AdaptiveCompression()
+            elif isinstance(compression, str):
+                compression = FixedCompression(compression, compression_level)
+            self._compression = compression
+
+        self._coordinator = None
+        self._generation_base = None  # generation committed before the first shard of this process was transferred
+        self._shard_files = []  # files transferred for the current shard, relative to its generation directory
+        if distributed:
+            assert self.backend is not None, "distributed needs a transfer backend"
+            assert self._chunk_store is None, "distributed can not be combined with deduplicate_transfers"
+            if rank is None or world_size is None:
+                detected_rank, detected_world_size = detect_rank_and_world_size()
+                rank = detected_rank if rank is None else rank
+                world_size = detected_world_size if world_size is None else world_size
+            self._coordinator = ShardCoordinator(
+                self.backend, checkpoint_transfer_target, rank, world_size, timeout=shard_commit_timeout
+            )
+
+        self._prefetch = None  # Future of the background fetch started by prefetch()
+        if prefetch:
+            self.prefetch()
 
     def on_SIGTERM(self, signalNumber, frame):
         '''
         Function to call when SIGTERM is received. Calls on_SIGTERM_prehook and exits with checkpoint_exit_code.
         Arguments are only used to match the signal handler signature.
+        With a sigterm_time_budget, a cheaper strategy is used if the full checkpoint is not expected to finish in time.
         '''
-        self.on_SIGTERM_prehook(**self.on_SIGTERM_prehook_kwargs)
-        if self.checkpoint_value is None:
-            print(
-                "Checkpointer: no checkpoint value available on SIGTERM, skipping checkpoint."
-            )
-        else:
-            self.checkpoint()
-            self.transfer_checkpoint_files()
+        deadline, watchdog = None, None
+        if self.sigterm_time_budget is not None:
+            deadline = time.monotonic() + self.sigterm_time_budget
+            # exit with checkpoint_exit_code even if a transfer hangs, instead of being killed later
+            watchdog = threading.Timer(self.sigterm_time_budget, os._exit, args=[self.checkpoint_exit_code])
+            watchdog.daemon = True
+            watchdog.start()
+            if self.transfer_throttle is not None:
+                # waiting for a slot or bandwidth must leave enough of the budget for the transfer itself
+                self.transfer_throttle.deadline = deadline - (self.last_transfer_duration or 0.0)
+        try:
+            self.on_SIGTERM_prehook(**self.on_SIGTERM_prehook_kwargs)
+            if self.checkpoint_value is None:
+                print(
+                    "Checkpointer: no checkpoint value available on SIGTERM, skipping checkpoint."
+                )
+                self.flush(self._remaining_time(deadline))
+            else:
+                # pending background writes and transfers are superseded by the final checkpoint
+                if self._transfer_worker is not None:
+                    if self._write_worker.discard_pending():
+                        self._snapshot_released.set()  # the discarded write would have read the buffers
+                    self._write_worker.wait(self._remaining_time(deadline))
+                    self._transfer_worker.discard_pending()
+                    self._transfer_worker.wait(self._remaining_time(deadline))
+                strategy = self._emergency_strategy(self._remaining_time(deadline))
+                if strategy == "full":
+                    self.checkpoint()
+                    self.flush(self._remaining_time(deadline))  # with a snapshot_function, the checkpoint is persisted in the background
+                    self.transfer_checkpoint_files()
+                elif strategy == "transfer":
+                    print("Checkpointer: not enough time left on SIGTERM for a new checkpoint, transferring the last one.")
+                    self.transfer_checkpoint_files()
+                else:
+                    print("Checkpointer: not enough time left on SIGTERM, skipping checkpoint.")
+                    self.metrics.count("skipped")
+                # e.g. the slower tiers in tiered mode
+                self.flush(self._remaining_time(deadline))
+            self._raise_background_error()
+            self._export_metrics()
+        finally:
+            if watchdog is not None:
+                watchdog.cancel()
         self.clean_up_local_checkpoint_files()
         sys.exit(self.checkpoint_exit_code)
 
+    def _export_metrics(self):
+        if self._transfer_worker is not None:
+            self.metrics.set_count("coalesced", self._transfer_worker.dropped)
+        self.metrics.export()
+
+    def _remaining_time(self, deadline):
+        if deadline is None:
+            return None
+        return max(0.0, deadline - time.monotonic())
+
+    def _emergency_strategy(self, remaining):
+        '''
+        Returns "full" if a new checkpoint can be created and transferred in the remaining time,
+        "transfer" if only the last checkpoint written can be transferred, and "skip" otherwise.
+        Durations not measured yet are assumed to fit.
+        '''
+        checkpoint_duration = self.last_checkpoint_duration or 0.0
+        transfer_duration = self.last_transfer_duration or 0.0
+        if self.backend is None:  # nothing to transfer
+            transfer_duration = 0.0
+        if remaining is None or checkpoint_duration + transfer_duration <= remaining:
+            return "full"
+        if not self._local_checkpoint_exists() or self._local_checkpoint_transferred:
+            # the last checkpoint is already on the target, or there is none
+            return "skip"
+        if transfer_duration <= remaining:
+            return "transfer"
+        return "skip"
+
+    def flush(self, timeout: float = None) -> bool:
+        '''
+        Blocks until all background transfers are finished. Returns False if the timeout expired first
+        or a background write or transfer failed since the last step().
+        Without async_transfer, there is nothing to wait for, except for the background tiers in tiered mode
+        and, with distributed, the commit of the newest complete generation on rank 0.
+        '''
+        deadline = None if timeout is None else time.monotonic() + timeout
+        # a background write hands its checkpoint to the transfer worker once it is written
+        for worker in (self._write_worker, self._transfer_worker):
+            if worker is not None and not worker.wait(self._remaining_time(deadline)):
+                return False
+        if any(worker is not None and worker.failed for worker in (self._write_worker, self._transfer_worker)):
+            return False
+        if self._coordinator is not None and not self._coordinator.flush(self._remaining_time(deadline)):
+            return False
+        if self.backend is None:
+            return True
+        return self.backend.flush(self._remaining_time(deadline))
+
+    def _raise_background_error(self):
+        '''
+        Raises the exception of a background write or transfer that failed since the last call, if any.
+        '''
+        for worker in (self._write_worker, self._transfer_worker):
+            if worker is not None:
+                worker.raise_error()
+
     def clean_up_local_checkpoint_files(self):
         '''
         Removes local checkpoint files if transfer mode is not None.
         '''
         if self.checkpoint_transfer_mode == "None" or self.checkpoint_transfer_mode == "htcondor":
             return
-        self.local_checkpoint_file.unlink()
+        for path in self._local_paths:
+            if path.is_dir():
+                shutil.rmtree(path)
+            else:
+                path.unlink(missing_ok=True)
 
     def checkpoint(self, value=None):
         '''
@@ -155,49 +485,529 @@ class Checkpointer:
         The checkpoint_function should store the checkpoint in the files given in local_checkpoint_file.
         The checkpoint_function receives the local_checkpoint_file and the value as arguments.
         If value is None, the last checkpoint_value is used.
+        With a snapshot_function, only the snapshot is taken here and checkpoint_function runs in the background.
         '''
         if value is None:
             value = self.checkpoint_value
-        self.checkpoint_function(self.local_checkpoint_file, value)
+        if self.snapshot_function is not None:
+            self._snapshot_and_persist(value, transfer=False)
+        else:
+            self._write_checkpoint(value)
         self.checkpoint_value = value
 
+    def _write_checkpoint(self, value, step=None):
+        with self._writing_local_files(step):
+            start = time.perf_counter()
+            self.checkpoint_function(self.local_checkpoint_file, value)
+            self.last_checkpoint_duration = time.perf_counter() - start
+            self.metrics.record("write", self.last_checkpoint_duration, self._local_size())
+
+    @contextmanager
+    def _writing_local_files(self, step=None):
+        '''
+        Context manager around rewriting the local checkpoint files, e.g. by the checkpoint_function,
+        with the state of step, by default the current step_counter.
+        '''
+        with self._local_file_lock:
+            self._detach_staged_files()
+            yield
+            self._writes += 1
+            self._written_step = self.step_counter if step is None else step
+            self._local_checkpoint_transferred = False
+
+    def _detach_staged_files(self):
+        '''
+        Replaces local files sharing their data with the staged copy of a running transfer by private copies,
+        so a checkpoint_function writing into the existing files does not change what the transfer reads.
+        '''
+        if not self._staged_transfers or not self._local_checkpoint_exists():
+            return
+        files = self._local_files().values() if self._is_multi_file else [self.local_checkpoint_file]
+        for path in files:
+            if path.stat().st_nlink > 1:
+                tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+                copy_file(path, tmp_path)
+                os.replace(tmp_path, path)
+
+    def _stage_local_files(self, staging_dir):
+        '''
+        Hard links the local checkpoint files into staging_dir, copying those that can not be linked.
+        Returns the staged counterpart of local_checkpoint_file.
+        '''
+        def stage(path, staged):
+            staged.parent.mkdir(parents=True, exist_ok=True)
+            try:
+                os.link(path, staged)
+            except OSError:  # e.g. on another file system
+                copy_file(path, staged)
+
+        staged_paths = []
+        for path in self._local_paths:
+            staged_path = staging_dir / path.name
+            if path.is_dir():
+                staged_path.mkdir()
+                for file in path.rglob("*"):
+                    if file.is_file():
+                        stage(file, staged_path / file.relative_to(path))
+            else:
+                stage(path, staged_path)
+            staged_paths.append(staged_path)
+        return staged_paths if isinstance(self.local_checkpoint_file, list) else staged_paths[0]
+
+    def _snapshot_and_persist(self, value, transfer):
+        self._persist_in_background(lambda: self.snapshot_function(value), self._write_checkpoint, transfer)
+
+    def _persist_in_background(self, take_snapshot, write, transfer):
+        '''
+        Calls write with the result of take_snapshot and the current step_counter in the background,
+        and transfers the checkpoint afterwards if transfer is True.
+        Only waits for the previous write to release the snapshot buffers, not for its transfer.
+        '''
+        step = self.step_counter
+        self._snapshot_released.wait()
+        self._snapshot_released.clear()
+        try:
+            with self.metrics.measure("snapshot"):
+                snapshot = take_snapshot()
+        except BaseException:
+            self._snapshot_released.set()
+            raise
+
+        def persist():
+            try:
+                write(snapshot, step)
+            finally:
+                self._snapshot_released.set()
+            if transfer:
+                self._transfer_worker.submit(self.transfer_checkpoint_files)
+
+        self._write_worker.submit(persist)
+
     def restore(self, default):
         '''
         Function to restore a checkpoint. Calls restore_function with local_checkpoint_file as argument.
+        With restore_mode "direct", restore_function receives the checkpoint on the target instead.
         If no checkpoint exists, default is returned.
         '''
-        self.get_checkpoint()
-        if self.restore_function and self.local_checkpoint_file.exists():
-            return self.restore_function(self.local_checkpoint_file)
-        return default
+        self.flush()
+        if self._prefetch is None and self.restore_mode == "direct" and self._can_restore_directly():
+            restored = self._restore_directly(default)
+        else:
+            restored = default
+            self.get_checkpoint()
+            if self.restore_function and self._local_checkpoint_exists():
+                with self.metrics.measure("restore", self._local_size):
+                    restored = self.restore_function(self.local_checkpoint_file)
+        self._export_metrics()
+        return restored
+
+    def _can_restore_directly(self):
+        if self.backend is None or self._chunk_store is not None or not self.restore_function:
+            return False
+        if self._compression is not None:
+            return False
+        if not (self.backend.supports("direct_read") or self.backend.supports("stream_read")):
+            return False
+        target = self._restore_target()
+        if target is None:
+            return False
+        if isinstance(self.local_checkpoint_file, list):
+            return True
+        # the files of a directory checkpoint are spread over the slot directories on the target,
+        # which cannot be told from a single file without probing for the index
+        if not self.backend.supports("stat"):
+            return False
+        return not self._remote_is_multi_file(target)
+
+    def _restore_directly(self, default):
+        if not self.checkpoint_exists:
+            return default
+        target = self._restore_target()
+        if self.backend.supports("direct_read"):
+            open_source = self.backend.direct_path
+        else:
+            open_source = self.backend.open_stream
+        if isinstance(self.local_checkpoint_file, list):
+            slots = self._read_index(target).get("slots", {})
+            sources = [
+                open_source(self._remote_file(path.name, slots.get(path.name), target))
+                for path in self.local_checkpoint_file
+            ]
+        else:
+            sources = open_source(target)
+        try:
+            with self.metrics.measure("restore"):
+                return self.restore_function(sources)
+        finally:
+            for source in sources if isinstance(sources, list) else [sources]:
+                if hasattr(source, "close"):
+                    source.close()
 
     def transfer_checkpoint_files(self):
         '''
         Function to transfer checkpoint files to a remote location. Used in shared, xrootd and manual mode.
         In manual mode, the checkpoint_transfer_callback is called with local_checkpoint_file, checkpoint_transfer_target and checkpoint_transfer_callback_kwargs as arguments.
+        The files of a multi-file checkpoint are transferred concurrently into the checkpoint_transfer_target directory,
+        followed by an index listing them, which replaces the previous checkpoint at once.
         '''
-        if self.checkpoint_transfer_mode == "None" or not self.local_checkpoint_file.exists():
+        if self.checkpoint_transfer_mode == "None" or not self._local_checkpoint_exists():
+            return
+        if self.transfer_throttle is None:
+            self._timed_transfer()
             return
+        waited = self.transfer_throttle.waited
+        with self.transfer_throttle.transfer_slot():
+            self.metrics.record("throttle", self.transfer_throttle.waited - waited)
+            self._timed_transfer()
 
-        if self.checkpoint_transfer_mode == "shared":
-            shutil.copy(self.local_checkpoint_file, self.checkpoint_transfer_target)
+    def _timed_transfer(self):
+        start = time.perf_counter()
+        with self._transfer_lock:
+            if self.backend is None:  # htcondor transfers the checkpoint itself
+                self._local_checkpoint_transferred = True
+                nbytes = self._local_size()
+            else:
+                sent_bytes = self._sent_bytes
+                self._transfer_staged()
+                nbytes = self._sent_bytes - sent_bytes
+        self.last_transfer_duration = time.perf_counter() - start
+        self.metrics.record("transfer", self.last_transfer_duration, nbytes)
 
-        elif self.checkpoint_transfer_mode == "xrootd":
-            status, _ = self.xrootd_client.copy(
-                'file://' + str(self.local_checkpoint_file),
-                self.xrootd_server_name + self.checkpoint_transfer_target, force=True
-            )
-            if not status.ok:
-                print(status.message)
+    def _transfer_staged(self):
+        '''
+        Transfers a hard-linked copy of the local checkpoint files, so the _local_file_lock is only held while
+        the links are created and the next checkpoint can be written during the upload.
+        '''
+        # next to the checkpoint, so its files can be hard linked, but outside of a directory checkpoint
+        staging_dir = Path(tempfile.mkdtemp(prefix=".checkpointer-staging-", dir=self._local_paths[0].parent))
+        staged = False
+        try:
+            with self._local_file_lock:
+                if not self._local_checkpoint_exists():
+                    return
+                source = self._stage_local_files(staging_dir)
+                writes, step = self._writes, self._written_step
+                self._staged_transfers += 1
+                staged = True
+            self._transfer_checkpoint_files(source, step)
+        finally:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+            if staged:
+                with self._local_file_lock:
+                    self._staged_transfers -= 1
+        # a checkpoint written during the upload still has to be transferred
+        self._local_checkpoint_transferred = self._writes == writes
 
-        elif self.checkpoint_transfer_mode == "manual":
-            self.checkpoint_transfer_callback(
-                self.local_checkpoint_file,
-                self.checkpoint_transfer_target,
-                **self.checkpoint_transfer_callback_kwargs)
+    def _transfer_checkpoint_files(self, source, step):
+        if self._coordinator is not None:
+            self._transfer_shard(source, self._generation_of(step))
+            return
+        if not self._is_multi_file:
+            self._upload_file(source, self.checkpoint_transfer_target, self.local_checkpoint_file.name)
+            return
+        self._transfer_multiple_files(self._local_files(source))
 
-        elif self.checkpoint_transfer_mode == "htcondor":
-            pass
+    def _transfer_multiple_files(self, files, target=None):
+        # files already on the target with the same content are skipped: those this process uploaded
+        # and did not change since, and those matching the digests of the index on the target
+        target = self.checkpoint_transfer_target if target is None else target
+        uploaded_target, uploaded = self._uploaded_files
+        if uploaded_target != str(target):
+            uploaded = self._remote_manifest(target)
+        manifest, changed = {}, []
+        for name, path in files.items():
+            signature = self._file_signature(path)
+            known_signature, known_digest, slot = uploaded.get(name, (None, None, None))
+            digest = known_digest if signature == known_signature else file_digest(path)
+            if digest != known_digest:
+                changed.append(name)
+                slot = SLOT_DIRS[1] if slot == SLOT_DIRS[0] else SLOT_DIRS[0]
+            manifest[name] = (signature, digest, slot)
+        for remote_dir in {remote_parent(self._remote_file(name, manifest[name][2], target)) for name in changed}:
+            self.backend.make_dir(remote_dir)
+        self._map_files(lambda name: self._upload_file(files[name], self._remote_file(name, manifest[name][2], target), name), changed)
+        # the index is written last and replaces the previous one at once, so it only lists complete checkpoints
+        index = {
+            "files": {name: signature[0] for name, (signature, _, _) in manifest.items()},
+            "mtimes": {name: signature[1] for name, (signature, _, _) in manifest.items()},
+            "digests": {name: digest for name, (_, digest, _) in manifest.items()},
+            "slots": {name: slot for name, (_, _, slot) in manifest.items()},
+        }
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            local_index = Path(tmp_dir) / INDEX_FILE
+            local_index.write_text(json.dumps(index))
+            self._replace_file(local_index, self._index_target(target))
+        self._uploaded_files = (str(target), manifest)
+        # the copies of changed files listed by the previous index, and files removed from the checkpoint since
+        if self.backend.supports("delete"):
+            for name, (_, _, slot) in uploaded.items():
+                if name in files and name not in changed:
+                    continue
+                remote_file = self._remote_file(name, slot, target)
+                self.backend.delete(remote_file)
+                if self._cache is not None:
+                    self.backend.delete(remote_with_suffix(remote_file, VERSION_SUFFIX))
+        self.metrics.count("unchanged_files", len(files) - len(changed))
+
+    def _remote_file(self, name, slot, target=None):
+        '''
+        Returns the remote path of the file name of a multi-file checkpoint stored in slot of target,
+        by default of the checkpoint_transfer_target.
+        '''
+        target = self.checkpoint_transfer_target if target is None else target
+        if slot is None:  # written before slots were used
+            return remote_join(target, name)
+        return remote_join(remote_join(target, slot), name)
+
+    def _read_index(self, target=None):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            local_index = Path(tmp_dir) / INDEX_FILE
+            self._get_file(self._index_target(target), local_index)
+            return json.loads(local_index.read_text())
+
+    def _remote_manifest(self, target=None):
+        '''
+        Returns the digests and slots of the files listed in the index on the target, if there is one.
+        '''
+        if not self.backend.supports("stat", "get") or not self.backend.exists(self._index_target(target)):
+            return {}
+        index = self._read_index(target)
+        slots = index.get("slots", {})
+        return {name: (None, digest, slots.get(name)) for name, digest in index.get("digests", {}).items()}
+
+    @staticmethod
+    def _file_signature(path):
+        stat = path.stat()
+        return [stat.st_size, stat.st_mtime_ns, stat.st_ino]
+
+    def _generation_of(self, step):
+        '''
+        Returns the generation of the shard of the checkpoint written in step of this process.
+        As all ranks step together, every rank derives the same generation for it, counting from the generation
+        committed before the first shard was transferred, even if a rank writes an extra checkpoint, e.g. on SIGTERM.
+        '''
+        if self._generation_base is None:
+            committed = self._coordinator.committed_generation() or 0
+            # shards of this rank left over from an earlier job must not complete the generations of this one
+            self._coordinator.discard_uncommitted(committed)
+            self._generation_base = committed
+        return self._generation_base + step + 1
+
+    def _transfer_shard(self, source, generation):
+        shard_dir = self._coordinator.shard_dir(generation)
+        self._shard_files = []
+        if self._is_multi_file:
+            self._transfer_multiple_files(self._local_files(source), shard_dir)
+        else:
+            self.backend.make_dir(shard_dir)
+            self._upload_file(source, remote_join(shard_dir, self.local_checkpoint_file.name), self.local_checkpoint_file.name)
+        generation_dir = self._coordinator.generation_dir(generation)
+        self._coordinator.shard_done(
+            generation, [posixpath.relpath(str(remote), str(generation_dir)) for remote in self._shard_files]
+        )
+
+    def _restore_target(self):
+        '''
+        Returns the target holding the checkpoint to restore: the checkpoint_transfer_target, or with distributed,
+        the shard of this rank in the last committed generation, or None if no generation is committed yet.
+        '''
+        if self._coordinator is None:
+            return self.checkpoint_transfer_target
+        generation = self._coordinator.committed_generation()
+        if generation is None:
+            return None
+        shard_dir = self._coordinator.shard_dir(generation)
+        if self._remote_is_multi_file(shard_dir):
+            return shard_dir
+        return remote_join(shard_dir, self.local_checkpoint_file.name)
+
+    def _upload_file(self, local_file, remote_file, name):
+        '''
+        Uploads local_file, the file name of the checkpoint, to remote_file.
+        '''
+        if self._chunk_store is not None:
+            self._chunk_store.upload(local_file, remote_file)
+        elif self._compression is not None:
+            self._upload_compressed(local_file, remote_file, name)
+        else:
+            self._put_file(local_file, remote_file)
+        if self._cache is not None:
+            key = uuid.uuid4().hex
+            self._cache.put(local_file, key)
+            # the record describes the remote file it was written for, so a stale record left next to a
+            # newer file, e.g. by a job evicted between both puts, does not match it
+            stat = self.backend.stat(remote_file)
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                local_version = Path(tmp_dir) / "version"
+                local_version.write_text(json.dumps({"key": key, "size": stat.size, "mtime": stat.mtime}))
+                self._replace_file(local_version, remote_with_suffix(remote_file, VERSION_SUFFIX))
+
+    def _download_file(self, remote_file, local_file):
+        key = self._remote_version(remote_file) if self._cache is not None else None
+        if key is not None and self._cache.get(key, local_file):
+            return
+        if self._chunk_store is not None:
+            self._chunk_store.download(remote_file, local_file)
+        else:
+            self._get_file(remote_file, local_file)
+            # compressed files are recognized by their header, also if compression is not set (anymore)
+            if compressed_codec(local_file) is not None:
+                self._decompress(local_file)
+        if key is not None:
+            self._cache.put(local_file, key)
+
+    def _upload_compressed(self, local_file, remote_file, name):
+        # local_file is a new staged copy on every transfer, remote_file changes with slots and generations
+        codec, level = self._compression.choose(local_file, name)
+        if codec == "none":
+            upload_file = local_file
+            tmp_dir = None
+        else:
+            # next to the checkpoint like the staging directory, not on a possibly small /tmp
+            tmp_dir = tempfile.TemporaryDirectory(prefix=".checkpointer-compress-", dir=self._local_paths[0].parent)
+            upload_file = Path(tmp_dir.name) / local_file.name
+            with self.metrics.measure("compress", lambda: local_file.stat().st_size):
+                compress_file(local_file, upload_file, codec, level)
+        try:
+            start = time.perf_counter()
+            self._put_file(upload_file, remote_file)
+            self._compression.observe(upload_file.stat().st_size, time.perf_counter() - start)
+        finally:
+            if tmp_dir is not None:
+                tmp_dir.cleanup()
+
+    def _decompress(self, local_file):
+        tmp_file = local_file.with_name(f".{local_file.name}.{os.getpid()}.tmp")
+        try:
+            with self.metrics.measure("decompress", lambda: tmp_file.stat().st_size):
+                decompress_file(local_file, tmp_file)
+            os.replace(tmp_file, local_file)
+        finally:
+            if tmp_file.exists():
+                tmp_file.unlink()
+
+    def _remote_version(self, remote_file):
+        '''
+        Returns the cache key recorded next to the remote file on upload, or None if there is none
+        or the record was written for another version of the file.
+        '''
+        remote_version = remote_with_suffix(remote_file, VERSION_SUFFIX)
+        stat = self.backend.stat(remote_file)
+        if stat is None or not self.backend.exists(remote_version):
+            return None
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            local_version = Path(tmp_dir) / "version"
+            try:
+                self.backend.get(remote_version, local_version)
+                record = json.loads(local_version.read_text())
+            except (OSError, ValueError):
+                return None
+        if record.get("size") != stat.size or record.get("mtime") != stat.mtime:
+            return None
+        return record.get("key")
+
+    def _map_files(self, function, names):
+        if len(names) <= 1 or self.transfer_workers <= 1:
+            for name in names:
+                function(name)
+            return
+        with ThreadPoolExecutor(max_workers=min(self.transfer_workers, len(names))) as executor:
+            # list() propagates the first exception of the transfers
+            list(executor.map(function, names))
+
+    @property
+    def _local_paths(self):
+        if isinstance(self.local_checkpoint_file, list):
+            return self.local_checkpoint_file
+        return [self.local_checkpoint_file]
+
+    @property
+    def _is_multi_file(self):
+        return isinstance(self.local_checkpoint_file, list) or self.local_checkpoint_file.is_dir()
+
+    def _index_target(self, target=None):
+        return remote_join(self.checkpoint_transfer_target if target is None else target, INDEX_FILE)
+
+    def _local_checkpoint_exists(self):
+        return all(path.exists() for path in self._local_paths)
+
+    def _local_size(self, local_checkpoint_file=None):
+        '''
+        Returns the size of the local checkpoint files, or of the files of local_checkpoint_file, in bytes.
+        '''
+        if local_checkpoint_file is None:
+            local_checkpoint_file = self.local_checkpoint_file
+        size = 0
+        for path in local_checkpoint_file if isinstance(local_checkpoint_file, list) else [local_checkpoint_file]:
+            if path.is_dir():
+                size += sum(file.stat().st_size for file in path.rglob("*") if file.is_file())
+            elif path.exists():
+                size += path.stat().st_size
+        return size
+
+    def _local_files(self, local_checkpoint_file=None):
+        '''
+        Returns a dict from the names of the files of a multi-file checkpoint, relative to the target, to their local Paths.
+        The files are those of local_checkpoint_file, or of its staged counterpart if given.
+        '''
+        if local_checkpoint_file is None:
+            local_checkpoint_file = self.local_checkpoint_file
+        if isinstance(local_checkpoint_file, list):
+            return {path.name: path for path in local_checkpoint_file}
+        return {
+            path.relative_to(local_checkpoint_file).as_posix(): path
+            for path in sorted(local_checkpoint_file.rglob("*")) if path.is_file()
+        }
+
+    def _local_path_of(self, name):
+        if isinstance(self.local_checkpoint_file, list):
+            return {path.name: path for path in self.local_checkpoint_file}[name]
+        return self.local_checkpoint_file / name
+
+    def _remote_is_multi_file(self, target=None):
+        if self._is_multi_file:
+            return True
+        # a directory checkpoint that does not exist locally yet, e.g. before the first restore
+        return self.backend.exists(self._index_target(target))
+
+    def _put_file(self, local_file, remote_file):
+        if self._ranged_transfer is not None:
+            nbytes = self._ranged_transfer.upload(local_file, remote_file)
+        else:
+            nbytes = Path(local_file).stat().st_size
+            if self.transfer_throttle is None:
+                self.backend.put(local_file, remote_file)
+            elif self.transfer_throttle.bandwidth is not None and self.backend.supports("ranged_put", "move"):
+                put_throttled(self.backend, local_file, remote_file, self.transfer_throttle.consume)
+            else:
+                self.transfer_throttle.consume(nbytes)
+                self.backend.put(local_file, remote_file)
+        with self._sent_bytes_lock:
+            self._sent_bytes += nbytes
+        self.last_copy_method = getattr(self.backend, "last_copy_method", None)
+        if self._coordinator is not None:
+            self._shard_files.append(remote_file)
+
+    def _replace_file(self, local_file, remote_file):
+        '''
+        Puts local_file to remote_file under a temporary name first and moves it into place, if the backend supports moves,
+        so remote_file is never seen partially written.
+        '''
+        if not self.backend.supports("move"):
+            self._put_file(local_file, remote_file)
+            return
+        tmp_file = remote_with_suffix(remote_file, f".{os.getpid()}.tmp")
+        self._put_file(local_file, tmp_file)
+        self.backend.move(tmp_file, remote_file)
+        if self._coordinator is not None:
+            self._shard_files[self._shard_files.index(tmp_file)] = remote_file
+
+    def _get_file(self, remote_file, local_file):
+        if self._ranged_transfer is not None:
+            self._ranged_transfer.download(remote_file, local_file)
+        else:
+            self.backend.get(remote_file, local_file)
+        self.last_copy_method = getattr(self.backend, "last_copy_method", None)
 
     @property
     def checkpoint_exists(self):
@@ -205,57 +1015,159 @@ class Checkpointer:
         Property to check if a previous checkpoint exists.
         Without transfer, this is just a check if the local_checkpoint_file exist.
         In shared and xrootd mode, this is a check if the checkpoint_transfer_target exists.
+        For multi-file checkpoints, this is a check if the index of the files exists.
+        With distributed, this is a check if the shard of this rank exists in the last committed generation.
         '''
-        if self.checkpoint_transfer_mode == "None":
-            return self.local_checkpoint_file.exists()
+        with self.metrics.measure("exists"):
+            return self._checkpoint_exists()
 
-        elif self.checkpoint_transfer_mode == "shared":
-            return self.checkpoint_transfer_target.exists()
-
-        elif self.checkpoint_transfer_mode == "xrootd":
-
-            status, listing = self.xrootd_client.stat(
-                self.checkpoint_transfer_target, self.DirListFlags.STAT
-            )
-            return status.ok
+    def _checkpoint_exists(self):
+        if self.checkpoint_transfer_mode == "None":
+            return self._local_checkpoint_exists()
+        if self.backend is None or not self.backend.supports("stat"):
+            return None
+        target = self._restore_target()
+        if target is None:
+            return False
+        if self._remote_is_multi_file(target):
+            return self.backend.exists(self._index_target(target))
+        return self.backend.exists(target)
 
     def get_checkpoint(self):
         '''
         Function to get the checkpoint files from a remote location. Used in shared and xrootd mode.
+        With deduplicate_transfers, the checkpoint is reassembled from its chunks.
         '''
         # TODO: implement manual mode
 
-        if self.checkpoint_exists:
-            if self.checkpoint_transfer_mode == "shared":
-                os.system(
-                    "cp {} {}".format(
-                        self.checkpoint_transfer_target._str,
-                        str(self.local_checkpoint_file)
-                    )
-                )
+        if self._wait_for_prefetch():
+            return
+        self._get_checkpoint()
 
-            elif self.checkpoint_transfer_mode == "xrootd":
-                status, _ = self.xrootd_client.copy(
-                    self.xrootd_server_name +
-                    self.checkpoint_transfer_target,
-                    str(self.local_checkpoint_file),
-                )
-                if not status.ok:
-                    print(status.message)
-            elif self.checkpoint_transfer_mode == "manual":
-                self.checkpoint_transfer_callback(
-                    self.checkpoint_transfer_target,
-                    self.local_checkpoint_file,
-                    **self.checkpoint_transfer_callback_kwargs
-                )
+    def _get_checkpoint(self):
+        if self.backend is None or not self.checkpoint_exists:
+            return
+        with self.metrics.measure("fetch", self._local_size):
+            self._fetch_checkpoint()
+
+    def prefetch(self) -> Future:
+        '''
+        Starts get_checkpoint in a background thread and returns its Future, so the download overlaps with
+        the rest of the program's startup, e.g. loading data and building the model.
+        The next restore or get_checkpoint waits for it instead of fetching the checkpoint again.
+        With restore_mode "direct", the prefetched copy is restored instead of the target.
+        '''
+        if self._prefetch is not None:
+            return self._prefetch
+
+        def fetch():
+            # steps writing a new checkpoint meanwhile wait until the fetched one is complete
+            with self._local_file_lock:
+                self._get_checkpoint()
+
+        executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="checkpointer-prefetch")
+        self._prefetch = executor.submit(fetch)
+        executor.shutdown(wait=False)
+        return self._prefetch
+
+    def _wait_for_prefetch(self):
+        '''
+        Waits for a running prefetch. Returns True if it fetched the checkpoint, False if there is none
+        or it failed, in which case the checkpoint is fetched again.
+        '''
+        prefetch, self._prefetch = self._prefetch, None
+        if prefetch is None:
+            return False
+        with self.metrics.measure("prefetch_wait"):
+            error = prefetch.exception()
+        if error is not None:
+            print(f"Checkpointer: prefetching the checkpoint failed ({error}), fetching it again.")
+            return False
+        return True
+
+    def _fetch_checkpoint(self):
+        target = self._restore_target()
+        if not self._remote_is_multi_file(target):
+            self._download_file(target, self.local_checkpoint_file)
+            return
+
+        index = self._read_index(target)
+        names = list(index["files"])
+        digests = index.get("digests", {})
+        slots = index.get("slots", {})
+        manifest = {}
+        for name in names:
+            path = self._local_path_of(name)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # files that are already present with the same content are not fetched again
+            if name in digests and path.is_file() and path.stat().st_size == index["files"][name] \
+                    and file_digest(path) == digests[name]:
+                manifest[name] = (self._file_signature(path), digests[name], slots.get(name))
+
+        def fetch(name):
+            path = self._local_path_of(name)
+            self._download_file(self._remote_file(name, slots.get(name), target), path)
+            assert name not in digests or file_digest(path) == digests[name], \
+                f"{name} fetched from {target} does not match the index of the checkpoint"
+
+        missing = [name for name in names if name not in manifest]
+        self._map_files(fetch, missing)
+        for name in missing:
+            manifest[name] = (self._file_signature(self._local_path_of(name)), digests.get(name), slots.get(name))
+        if not isinstance(self.local_checkpoint_file, list):
+            # files of the directory that are not part of the checkpoint are left over from elsewhere
+            for name in set(self._local_files()) - set(names):
+                self._local_path_of(name).unlink()
+        # the fetched files do not need to be uploaded again until they change
+        self._uploaded_files = (str(target), manifest)
 
     def step(self, value):
         '''
-        Function to call to create a checkpoint every checkpoint_every steps.
+        Function to call to create a checkpoint every checkpoint_every steps, or when the checkpoint_schedule says so.
         Used for compatiblity with pytorch-lightning, tensorflow and other frameworks.
+        With async_transfer, the transfer runs in the background and step() returns after the checkpoint is written.
+        With a snapshot_function, step() returns after the snapshot is taken.
         '''
-        self.checkpoint_value = value
-        if self.step_counter % self.checkpoint_every == 0:
+        self._step(value, lambda: self._checkpoint_and_transfer(value))
+
+    def _checkpoint_and_transfer(self, value):
+        if self.snapshot_function is not None:
+            self._snapshot_and_persist(value, transfer=True)
+        elif self._transfer_worker is not None:
+            self.checkpoint(value)
+            self._transfer_worker.submit(self.transfer_checkpoint_files)
+        else:
             self.checkpoint(value)
             self.transfer_checkpoint_files()
+
+    def _checkpoint_due(self):
+        '''
+        Returns True if a checkpoint is due in the current step: every checkpoint_every steps, starting after the
+        random phase with randomize_phase, or when the checkpoint_schedule says so.
+        '''
+        if self.checkpoint_schedule is not None:
+            return self.checkpoint_schedule.due()
+        return (self.step_counter + self._phase) % self.checkpoint_every == 0
+
+    def _step(self, value, create_checkpoint):
+        '''
+        Counts a step of step(), calling create_checkpoint without arguments if a checkpoint is due.
+        Integrations creating the checkpoint themselves, e.g. through the trainer, pass their own create_checkpoint.
+        '''
+        self._raise_background_error()
+        step_start = time.perf_counter()
+        self.checkpoint_value = value
+        if self._checkpoint_due():
+            start = time.perf_counter()
+            create_checkpoint()
+            if self.checkpoint_schedule is not None:
+                # background transfers do not stall the training, but bound the useful checkpoint rate
+                background = self._transfer_worker is not None
+                self.checkpoint_schedule.checkpoint_done(
+                    time.perf_counter() - start,
+                    self.last_transfer_duration if background else None,
+                )
+            self.metrics.count("checkpoints")
+            self._export_metrics()
+        self.metrics.record("step", time.perf_counter() - step_start)
         self.step_counter += 1
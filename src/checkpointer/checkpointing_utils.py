@@ -1,13 +1,9 @@
-import os
+from .batch_system import get_job_ad
 
 
 def get_condor_job_ad_settings(variable):
-    file_path = os.environ.get('_CONDOR_JOB_AD')
-    with open(file_path, 'r') as file:
-        for line in file:
-            line = line.strip()
-            print(line)
-            if line.startswith(variable + ' = '):
-                value = line.split('=')[1].strip()
-                return value
-    return None
+    '''
+    Returns the unparsed value of the attribute of the HTCondor job ad, or None if it is not set.
+    Kept for compatibility, checkpointer.batch_system provides typed and cached access.
+    '''
+    return get_job_ad().raw(variable)
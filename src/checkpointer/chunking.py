@@ -0,0 +1,191 @@
+import hashlib
+import json
+import os
+import tempfile
+from pathlib import Path
+from typing import Callable, List
+from .backends import remote_join, remote_with_suffix
+
+MANIFEST_FORMAT = "checkpointer-chunks"
+
+
+def chunk_digests(path: Path, chunk_size: int) -> List[str]:
+    '''
+    Splits the file into chunks of chunk_size bytes and returns their hex digests in order.
+    '''
+    digests = []
+    with open(path, "rb") as file:
+        while True:
+            chunk = file.read(chunk_size)
+            if not chunk:
+                break
+            digests.append(hashlib.blake2b(chunk, digest_size=20).hexdigest())
+    return digests
+
+
+def read_manifest(path: Path):
+    '''
+    Returns the manifest stored in path, or None if path holds a plain checkpoint file.
+    '''
+    try:
+        with open(path, "rb") as file:
+            if file.read(1) != b"{":
+                return None
+            file.seek(0)
+            manifest = json.load(file)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(manifest, dict) or manifest.get("format") != MANIFEST_FORMAT:
+        return None
+    return manifest
+
+
+class ChunkStore:
+    '''
+    Content-addressed storage of checkpoint files on a remote target.
+    The file is split into fixed-size chunks that are stored by their hash next to the target,
+    in a directory named after the target with a `.chunks` suffix. The target itself holds a small JSON manifest
+    listing the chunks of the current checkpoint generation. Only chunks the target does not hold yet are uploaded,
+    and chunks no longer referenced are removed after the new manifest is written.
+    Chunks are uploaded under a temporary name and moved into place if the target supports moves, and a chunk found
+    on the target is only reused if it has the expected size, so an interrupted upload never leaves a truncated chunk behind.
+    The remote operations are given as functions, so the store works with any transfer mode.
+    '''
+
+    def __init__(
+        self,
+        put: Callable,  # put(local_path, remote_path)
+        get: Callable,  # get(remote_path, local_path)
+        stat: Callable,  # stat(remote_path) -> RemoteStat, or None if it does not exist
+        remove: Callable,  # remove(remote_path)
+        make_dir: Callable,  # make_dir(remote_path)
+        chunk_size: int = 4 * 2**20,
+        move: Callable = None,  # move(remote_source, remote_target), replacing the target
+    ) -> None:
+        self.put = put
+        self.get = get
+        self.stat = stat
+        self.move = move
+        self.remove = remove
+        self.make_dir = make_dir
+        self.chunk_size = chunk_size
+        # remote target -> chunks referenced by its current manifest, as far as known to this process
+        self._known_chunks = {}
+        self._generations = {}
+        self.uploaded_bytes = 0
+        self.skipped_bytes = 0
+
+    @staticmethod
+    def chunk_dir(target):
+        return remote_with_suffix(target, ".chunks")
+
+    def _remote_manifest(self, target, tmp_dir: str):
+        if self.stat(target) is None:
+            return None
+        local = Path(tmp_dir) / "manifest"
+        self.get(target, local)
+        return read_manifest(local)
+
+    def upload(self, local_file: Path, target) -> None:
+        '''
+        Stores local_file at target, uploading only chunks the target does not hold yet.
+        '''
+        chunk_dir = self.chunk_dir(target)
+        size = local_file.stat().st_size
+        digests = chunk_digests(local_file, self.chunk_size)
+        with tempfile.TemporaryDirectory(dir=local_file.parent) as tmp_dir:
+            if target not in self._known_chunks:
+                previous = self._remote_manifest(target, tmp_dir)
+                self._known_chunks[target] = set(previous["chunks"]) if previous else set()
+                self._generations[target] = previous["generation"] if previous else 0
+                self.make_dir(chunk_dir)
+            known = self._known_chunks[target]
+
+            with open(local_file, "rb") as file:
+                for index, digest in enumerate(digests):
+                    length = min(self.chunk_size, size - index * self.chunk_size)
+                    remote_chunk = remote_join(chunk_dir, digest)
+                    if digest in known or self._has_chunk(remote_chunk, length):
+                        self.skipped_bytes += length
+                        known.add(digest)
+                        continue
+                    file.seek(index * self.chunk_size)
+                    local_chunk = Path(tmp_dir) / digest
+                    local_chunk.write_bytes(file.read(length))
+                    self._put_chunk(local_chunk, remote_chunk)
+                    local_chunk.unlink()
+                    self.uploaded_bytes += length
+                    known.add(digest)
+
+            generation = self._generations[target] + 1
+            manifest = {
+                "format": MANIFEST_FORMAT,
+                "generation": generation,
+                "size": size,
+                "chunk_size": self.chunk_size,
+                "chunks": digests,
+            }
+            local_manifest = Path(tmp_dir) / "manifest"
+            local_manifest.write_text(json.dumps(manifest))
+            self.put(local_manifest, target)
+            self._generations[target] = generation
+
+        # the old generation is replaced, remove chunks only it referenced
+        current = set(digests)
+        for digest in known - current:
+            self.remove(remote_join(chunk_dir, digest))
+        self._known_chunks[target] = current
+
+    def _has_chunk(self, remote_chunk, length: int) -> bool:
+        stat = self.stat(remote_chunk)
+        # a shorter chunk is left over from an interrupted upload
+        return stat is not None and stat.size == length
+
+    def _put_chunk(self, local_chunk: Path, remote_chunk) -> None:
+        if self.move is None:
+            self.put(local_chunk, remote_chunk)
+            return
+        tmp_chunk = remote_with_suffix(remote_chunk, f".{os.getpid()}.tmp")
+        self.put(local_chunk, tmp_chunk)
+        self.move(tmp_chunk, remote_chunk)
+
+    def download(self, target, local_file: Path) -> None:
+        '''
+        Reassembles the checkpoint stored at target into local_file.
+        Chunks that are already part of an existing local_file are reused instead of downloaded.
+        Plain files stored at target without a manifest are copied as they are.
+        '''
+        local_file.parent.mkdir(parents=True, exist_ok=True)
+        with tempfile.TemporaryDirectory(dir=local_file.parent) as tmp_dir:
+            fetched = Path(tmp_dir) / "manifest"
+            self.get(target, fetched)
+            manifest = read_manifest(fetched)
+            if manifest is None:
+                os.replace(fetched, local_file)
+                return
+
+            local_chunks = {}
+            if local_file.exists():
+                local_chunk_size = manifest["chunk_size"]
+                for index, digest in enumerate(chunk_digests(local_file, local_chunk_size)):
+                    local_chunks.setdefault(digest, index * local_chunk_size)
+
+            chunk_dir = self.chunk_dir(target)
+            assembled = Path(tmp_dir) / "assembled"
+            with open(assembled, "wb") as output:
+                for digest in manifest["chunks"]:
+                    if digest in local_chunks:
+                        with open(local_file, "rb") as existing:
+                            existing.seek(local_chunks[digest])
+                            data = existing.read(manifest["chunk_size"])
+                    else:
+                        local_chunk = Path(tmp_dir) / digest
+                        self.get(remote_join(chunk_dir, digest), local_chunk)
+                        data = local_chunk.read_bytes()
+                        local_chunk.unlink()
+                    assert hashlib.blake2b(data, digest_size=20).hexdigest() == digest, \
+                        f"checkpoint chunk {digest} is corrupted"
+                    output.write(data)
+            os.replace(assembled, local_file)
+        self._known_chunks[target] = set(manifest["chunks"])
+        self._generations[target] = manifest["generation"]
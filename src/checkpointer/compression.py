@@ -0,0 +1,249 @@
+import importlib
+import os
+import struct
+import time
+import zlib
+from collections import OrderedDict
+from pathlib import Path
+from typing import List, Tuple
+
+# compressed files start with MAGIC, the name of the codec and the size of the uncompressed data
+MAGIC = b"CKPTCMP\x01"
+_HEADER = struct.Struct("<8s8sQ")
+BLOCK_SIZE = 4 * 2**20
+# files AdaptiveCompression keeps estimates for, the least recently transferred ones are forgotten first
+MAX_ESTIMATES = 1024
+
+
+class _Lz4Compressor:
+    def __init__(self, level) -> None:
+        import lz4.frame
+        self._compressor = lz4.frame.LZ4FrameCompressor(compression_level=level or 0)
+        self._started = False
+
+    def compress(self, data):
+        prefix = b""
+        if not self._started:
+            prefix, self._started = self._compressor.begin(), True
+        return prefix + self._compressor.compress(data)
+
+    def flush(self):
+        prefix = b"" if self._started else self._compressor.begin()
+        return prefix + self._compressor.flush()
+
+
+class Codec:
+    '''
+    Streaming compression codec. compressor(level) and decompressor() return objects with
+    compress(data)/flush() and decompress(data) methods, like those of zlib.
+    '''
+
+    def __init__(self, name: str, module: str, levels: List[int]) -> None:
+        self.name = name
+        self.module = module  # module the codec needs, None if it is always available
+        self.levels = levels  # levels tried by AdaptiveCompression, fastest first
+
+    @property
+    def available(self) -> bool:
+        if self.module is None:
+            return True
+        try:
+            importlib.import_module(self.module)
+            return True
+        except ImportError:
+            return False
+
+    def compressor(self, level: int = None):
+        if self.name == "zlib":
+            return zlib.compressobj(6 if level is None else level)
+        if self.name == "zstd":
+            import zstandard
+            return zstandard.ZstdCompressor(level=3 if level is None else level).compressobj()
+        if self.name == "lz4":
+            return _Lz4Compressor(level)
+        raise ValueError(f"unknown codec {self.name}")
+
+    def decompressor(self):
+        if self.name == "zlib":
+            return zlib.decompressobj()
+        if self.name == "zstd":
+            import zstandard
+            return zstandard.ZstdDecompressor().decompressobj()
+        if self.name == "lz4":
+            import lz4.frame
+            return lz4.frame.LZ4FrameDecompressor()
+        raise ValueError(f"unknown codec {self.name}")
+
+
+CODECS = {
+    "lz4": Codec("lz4", "lz4.frame", [0]),
+    "zstd": Codec("zstd", "zstandard", [1, 3]),
+    "zlib": Codec("zlib", None, [1, 6]),
+}
+
+
+def available_codecs() -> List[str]:
+    '''
+    Returns the names of the codecs whose modules are installed, and "none".
+    '''
+    return [name for name, codec in CODECS.items() if codec.available] + ["none"]
+
+
+def compress_file(source: Path, destination: Path, codec: str, level: int = None) -> None:
+    '''
+    Writes source compressed with codec to destination, framed by a header naming the codec,
+    so decompress_file does not need to know it.
+    '''
+    compressor = CODECS[codec].compressor(level)
+    with open(source, "rb") as input_file, open(destination, "wb") as output_file:
+        output_file.write(_HEADER.pack(MAGIC, codec.encode().ljust(8, b"\0"), os.fstat(input_file.fileno()).st_size))
+        while True:
+            block = input_file.read(BLOCK_SIZE)
+            if not block:
+                break
+            output_file.write(compressor.compress(block))
+        output_file.write(compressor.flush())
+
+
+def compressed_codec(path: Path):
+    '''
+    Returns the codec path was compressed with by compress_file, or None if it is not compressed.
+    '''
+    with open(path, "rb") as file:
+        header = file.read(_HEADER.size)
+    if len(header) < _HEADER.size or not header.startswith(MAGIC):
+        return None
+    return _HEADER.unpack(header)[1].rstrip(b"\0").decode()
+
+
+def decompress_file(source: Path, destination: Path) -> None:
+    '''
+    Writes the content of source, written by compress_file, uncompressed to destination.
+    '''
+    with open(source, "rb") as input_file, open(destination, "wb") as output_file:
+        _, codec, size = _HEADER.unpack(input_file.read(_HEADER.size))
+        decompressor = CODECS[codec.rstrip(b"\0").decode()].decompressor()
+        while True:
+            block = input_file.read(BLOCK_SIZE)
+            if not block:
+                break
+            output_file.write(decompressor.decompress(block))
+        written = output_file.tell()
+    assert written == size, f"{source} is truncated: {written} of {size} bytes decompressed"
+
+
+class FixedCompression:
+    '''
+    Compresses every file with the same codec and level.
+    '''
+
+    def __init__(self, codec: str, level: int = None) -> None:
+        assert codec in CODECS or codec == "none", f"codec must be one of {', '.join(list(CODECS) + ['none'])}"
+        assert codec == "none" or CODECS[codec].available, f"codec {codec} needs the {CODECS[codec].module} module"
+        self.codec = codec
+        self.level = level
+        self.last_choice = None
+
+    def choose(self, path: Path, name: str = None) -> Tuple[str, int]:
+        self.last_choice = (self.codec, self.level)
+        return self.last_choice
+
+    def observe(self, nbytes: int, duration: float) -> None:
+        pass
+
+
+class AdaptiveCompression:
+    '''
+    Chooses codec and level of every file so that compressing and transferring it takes the least time.
+    A sample of the file is compressed with every candidate to measure speed and ratio, which are compared to
+    the bandwidth of the transfers so far: fast links favour sending the raw file, slow links strong compression.
+    Until a transfer was observed, and for files smaller than min_size, files are sent uncompressed.
+    '''
+
+    def __init__(
+        self,
+        # (codec, level) pairs to choose from, by default all levels of all installed codecs
+        candidates: List[Tuple[str, int]] = None,
+        sample_size: int = 2**20,  # bytes of the file compressed to estimate speed and ratio
+        min_size: int = 2**20,  # files smaller than this are not compressed
+        bandwidth: float = None,  # transfer bandwidth in bytes per second, measured from the transfers if None
+        reestimate_every: int = 10,  # how often speed and ratio of a file are measured again, in transfers of the file
+    ) -> None:
+        '''
+        parameters:
+            candidates: (codec, level) pairs to choose from, by default all levels of the installed codecs of zstd, lz4 and zlib
+            sample_size: bytes of the file, taken from four places, compressed to estimate speed and ratio of the candidates
+            min_size: files smaller than min_size are sent uncompressed
+            bandwidth: transfer bandwidth in bytes per second. If None, it is measured as moving average of the transfers.
+            reestimate_every: speed and ratio are estimated once per file and again every reestimate_every transfers of it
+        '''
+        if candidates is None:
+            candidates = [(name, level) for name, codec in CODECS.items() if codec.available for level in codec.levels]
+        self.candidates = [(codec, level) for codec, level in candidates if codec != "none"]
+        assert all(CODECS[codec].available for codec, _ in self.candidates), "a codec of candidates is not installed"
+        self.sample_size = sample_size
+        self.min_size = min_size
+        self.bandwidth = bandwidth
+        self._measure_bandwidth = bandwidth is None
+        self.reestimate_every = reestimate_every
+        # name -> (transfers since the estimate, {candidate: (seconds per byte, ratio)}), least recently used first
+        self._estimates = OrderedDict()
+        self.last_choice = None
+
+    def observe(self, nbytes: int, duration: float) -> None:
+        '''
+        Records a transfer of nbytes that took duration seconds.
+        '''
+        # small transfers are dominated by latency
+        if not self._measure_bandwidth or nbytes < 64 * 2**10 or duration <= 0:
+            return
+        bandwidth = nbytes / duration
+        self.bandwidth = bandwidth if self.bandwidth is None else 0.7 * self.bandwidth + 0.3 * bandwidth
+
+    def _sample(self, path: Path, size: int) -> bytes:
+        if size <= self.sample_size:
+            return Path(path).read_bytes()
+        piece = self.sample_size // 4
+        with open(path, "rb") as file:
+            parts = []
+            for i in range(4):
+                file.seek((size - piece) * i // 3)
+                parts.append(file.read(piece))
+        return b"".join(parts)
+
+    def estimate(self, path: Path) -> dict:
+        '''
+        Returns the seconds per byte and the compression ratio of every candidate on a sample of path.
+        '''
+        size = Path(path).stat().st_size
+        sample = self._sample(path, size)
+        estimates = {}
+        for codec, level in self.candidates:
+            compressor = CODECS[codec].compressor(level)
+            start = time.perf_counter()
+            compressed = len(compressor.compress(sample)) + len(compressor.flush())
+            estimates[(codec, level)] = ((time.perf_counter() - start) / len(sample), compressed / len(sample))
+        return estimates
+
+    def choose(self, path: Path, name: str = None) -> Tuple[str, int]:
+        '''
+        Returns the (codec, level) with which path is compressed and transferred fastest, ("none", None) to send it raw.
+        The estimates are kept under name, e.g. the remote file, as path may be a new staged copy on every transfer.
+        '''
+        size = Path(path).stat().st_size
+        choice = ("none", None)
+        if size and size >= self.min_size and self.bandwidth and self.candidates:
+            key = str(path) if name is None else name
+            transfers, estimates = self._estimates.pop(key, (self.reestimate_every, None))
+            if transfers >= self.reestimate_every:
+                transfers, estimates = 0, self.estimate(path)
+            self._estimates[key] = (transfers + 1, estimates)
+            while len(self._estimates) > MAX_ESTIMATES:
+                self._estimates.popitem(last=False)
+            best = size / self.bandwidth
+            for candidate, (seconds_per_byte, ratio) in estimates.items():
+                duration = size * seconds_per_byte + size * ratio / self.bandwidth
+                if duration < best:
+                    choice, best = candidate, duration
+        self.last_choice = choice
+        return choice
@@ -0,0 +1,174 @@
+import hashlib
+import json
+import os
+import pickle
+import sys
+from pathlib import Path
+from typing import List
+
+INDEX_FILE = "index.json"
+
+
+def _flatten(value, key, entries):
+    if hasattr(value, "state_dict") and callable(value.state_dict):
+        value = value.state_dict()
+    if isinstance(value, dict) and value:
+        for k, v in value.items():
+            _flatten(v, key + (k,), entries)
+    else:
+        entries[key] = value
+    return entries
+
+
+def _unflatten(entries):
+    state = {}
+    for key, value in entries.items():
+        if key == ():
+            return value
+        node = state
+        for k in key[:-1]:
+            node = node.setdefault(k, {})
+        node[key[-1]] = value
+    return state
+
+
+def entry_digest(value) -> str:
+    '''
+    Returns a digest of the content of a tensor, array or picklable value.
+    '''
+    torch = sys.modules.get("torch")
+    numpy = sys.modules.get("numpy")
+    digest = hashlib.blake2b(digest_size=20)
+    if torch is not None and isinstance(value, torch.Tensor):
+        tensor = value.detach().cpu().contiguous()
+        digest.update(f"{tensor.dtype}{tuple(tensor.shape)}".encode())
+        digest.update(memoryview(tensor.reshape(-1).view(torch.uint8).numpy()))
+    elif numpy is not None and isinstance(value, numpy.ndarray) and value.dtype != object:
+        array = numpy.ascontiguousarray(value)
+        digest.update(f"{array.dtype}{array.shape}".encode())
+        digest.update(memoryview(array).cast("B"))
+    else:
+        digest.update(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+    return digest.hexdigest()
+
+
+class DifferentialCheckpoint:
+    '''
+    checkpoint_function and restore_function pair for (nested) dicts of tensors and arrays, e.g. state_dicts.
+    Instead of serializing the whole state every time, a full base is written every base_every checkpoints,
+    and in between only a delta holding the entries whose content changed since the previous checkpoint.
+    Use it with a directory as local_checkpoint_file, so only the new delta and the index are transferred:
+
+        differential = DifferentialCheckpoint(base_every=20, slow_keys=["optimizer"], slow_every=5)
+        Checkpointer(Path("checkpoint"), differential.checkpoint, differential.restore, ...)
+
+    The directory holds the base, the deltas since, and index.json listing them, which is replaced last.
+    Objects with a `state_dict` method are replaced by their state_dict, and restore() returns plain dicts.
+    '''
+
+    def __init__(
+        self,
+        base_every: int = 10,  # how often a full base is written, in checkpoints
+        # top-level keys whose entries are only compared and stored every slow_every checkpoints, e.g. ["optimizer"]
+        slow_keys: List = None,
+        slow_every: int = 1,
+    ) -> None:
+        '''
+        parameters:
+            base_every: how often a full base is written, in checkpoints. A base is also written once the deltas outgrow it.
+            slow_keys: top-level keys of the state, e.g. the optimizer state, whose changes are only stored every slow_every checkpoints.
+                In between, a restore returns their state of the last checkpoint storing them.
+            slow_every: how often the entries under slow_keys are compared and stored, in checkpoints
+        '''
+        assert base_every >= 1 and slow_every >= 1, "base_every and slow_every must be at least 1"
+        self.base_every = base_every
+        self.slow_keys = set(slow_keys) if slow_keys else set()
+        self.slow_every = slow_every
+        self._digests = {}  # digest of every entry as stored in the chain of base and deltas
+        self._chain = []  # files of the current base and its deltas
+        self._counter = 0  # checkpoints written since the last base
+        self._chain_size = 0  # bytes of the deltas since the last base
+        self._base_size = 0
+        self.last_written_entries = 0  # number of entries serialized by the last checkpoint
+
+    def checkpoint(self, directory: Path, value) -> None:
+        '''
+        checkpoint_function writing value to directory as base or delta.
+        '''
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        entries = _flatten(value, (), {})
+        write_base = (
+            not self._chain
+            or self._counter % self.base_every == 0
+            or self._chain_size > self._base_size
+        )
+        include_slow = write_base or self._counter % self.slow_every == 0
+
+        if write_base:
+            changed = entries
+            removed = []
+            digests = {key: entry_digest(entry) for key, entry in entries.items()}
+        else:
+            changed, digests = {}, dict(self._digests)
+            for key, entry in entries.items():
+                if not include_slow and key[:1] and key[0] in self.slow_keys:
+                    continue
+                digest = entry_digest(entry)
+                if digests.get(key) != digest:
+                    changed[key] = entry
+                    digests[key] = digest
+            removed = [key for key in self._digests if key not in entries]
+            for key in removed:
+                del digests[key]
+
+        name = f"{'base' if write_base else 'delta'}-{self._sequence():08d}.pkl"
+        size = self._write(directory / name, {"entries": changed, "removed": removed})
+        old_chain = self._chain
+        if write_base:
+            self._chain, self._counter, self._chain_size, self._base_size = [name], 1, 0, size
+        else:
+            self._chain = self._chain + [name]
+            self._chain_size += size
+            self._counter += 1
+        self._write_index(directory)
+        self._digests = digests
+        self.last_written_entries = len(changed)
+        if write_base:
+            for old_name in old_chain:
+                (directory / old_name).unlink(missing_ok=True)
+
+    def restore(self, directory: Path):
+        '''
+        restore_function replaying the base and deltas in directory. Continues the chain on the next checkpoint.
+        '''
+        directory = Path(directory)
+        index = json.loads((directory / INDEX_FILE).read_text())
+        entries = {}
+        for name in index["chain"]:
+            with open(directory / name, "rb") as file:
+                content = pickle.load(file)
+            entries.update(content["entries"])
+            for key in content["removed"]:
+                entries.pop(key, None)
+        self._chain = list(index["chain"])
+        self._counter = index["counter"]
+        self._base_size = (directory / self._chain[0]).stat().st_size
+        self._chain_size = sum((directory / name).stat().st_size for name in self._chain[1:])
+        self._digests = {key: entry_digest(entry) for key, entry in entries.items()}
+        return _unflatten(entries)
+
+    def _sequence(self) -> int:
+        if not self._chain:
+            return 0
+        return int(self._chain[-1].split("-")[1].split(".")[0]) + 1
+
+    def _write(self, path: Path, content) -> int:
+        with open(path, "wb") as file:
+            pickle.dump(content, file, protocol=pickle.HIGHEST_PROTOCOL)
+        return path.stat().st_size
+
+    def _write_index(self, directory: Path) -> None:
+        tmp_index = directory / f".{INDEX_FILE}.tmp"
+        tmp_index.write_text(json.dumps({"chain": self._chain, "counter": self._counter}))
+        os.replace(tmp_index, directory / INDEX_FILE)
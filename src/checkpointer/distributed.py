@@ -0,0 +1,229 @@
+import json
+import os
+import posixpath
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import List, Tuple
+from .backends import remote_join
+from .transfer_worker import TransferWorker
+
+MANIFEST_FILE = "MANIFEST.json"
+
+# environment variables holding rank and world size, as set by torchrun, SLURM, Open MPI and MPICH
+_RANK_VARIABLES = [
+    ("RANK", "WORLD_SIZE"),
+    ("SLURM_PROCID", "SLURM_NTASKS"),
+    ("OMPI_COMM_WORLD_RANK", "OMPI_COMM_WORLD_SIZE"),
+    ("PMI_RANK", "PMI_SIZE"),
+]
+
+
+def detect_rank_and_world_size() -> Tuple[int, int]:
+    '''
+    Returns the rank of this process and the number of processes from the environment, or (0, 1) if not set.
+    '''
+    for rank_variable, size_variable in _RANK_VARIABLES:
+        if rank_variable in os.environ and size_variable in os.environ:
+            return int(os.environ[rank_variable]), int(os.environ[size_variable])
+    return 0, 1
+
+
+class ShardCoordinator:
+    '''
+    Two-phase commit of sharded checkpoints written by several processes (ranks) in parallel.
+    Every generation of the checkpoint is stored in its own directory on the target, each rank in its own shard:
+        target/gen-00000001/shard-00000/...
+    After transferring its shard, a rank writes a marker listing the files of the shard. The coordinator (rank 0)
+    commits in a background thread: after each of its own shards, it waits up to timeout seconds for the markers
+    of the other ranks and commits the newest complete generation by writing target/MANIFEST.json, so a generation
+    completed late is committed by a later pass. Generations older than the committed one are removed afterwards,
+    committed or not, including their directories. Shards of uncommitted generations left over by an earlier job
+    only count once their rank wrote them again. Restores only use committed generations.
+    '''
+
+    def __init__(self, backend, target, rank: int, world_size: int, timeout: float = 600, poll_interval: float = 1.0) -> None:
+        assert backend.supports("stat", "put", "get", "delete"), \
+            "distributed checkpoints need a transfer backend supporting stat, put, get and delete"
+        assert 0 <= rank < world_size, f"rank {rank} must be between 0 and world_size {world_size}"
+        self.backend = backend
+        self.target = target
+        self.rank = rank
+        self.world_size = world_size
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._uncommitted = set()  # generations the coordinator transferred its shard of, but did not commit yet
+        self._worker = None
+        self._leftover_markers = {}  # (generation, rank) -> RemoteStat of markers of generations an earlier job did not commit
+        if rank == 0:
+            self._worker = TransferWorker(name="checkpointer-commit", description="commit of a generation")
+            self._leftover_markers = self._find_leftover_markers()
+
+    def generation_dir(self, generation: int):
+        return remote_join(self.target, f"gen-{generation:08d}")
+
+    def shard_dir(self, generation: int, rank: int = None):
+        rank = self.rank if rank is None else rank
+        return remote_join(self.generation_dir(generation), f"shard-{rank:05d}")
+
+    def _marker(self, generation: int, rank: int):
+        return remote_join(self.generation_dir(generation), f"shard-{rank:05d}.done")
+
+    def _read_json(self, remote):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            local = Path(tmp_dir) / "content.json"
+            self.backend.get(remote, local)
+            return json.loads(local.read_text())
+
+    def _write_json(self, remote, content) -> None:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            local = Path(tmp_dir) / "content.json"
+            local.write_text(json.dumps(content))
+            self.backend.put(local, remote)
+
+    def committed_generation(self):
+        '''
+        Returns the generation of the last committed checkpoint, or None if there is none.
+        '''
+        manifest = remote_join(self.target, MANIFEST_FILE)
+        if not self.backend.exists(manifest):
+            return None
+        content = self._read_json(manifest)
+        assert content["world_size"] == self.world_size, \
+            f"checkpoint was written by {content['world_size']} ranks, but world_size is {self.world_size}"
+        return content["generation"]
+
+    def shard_done(self, generation: int, files: List[str]) -> None:
+        '''
+        Records that this rank transferred its shard of generation, consisting of files relative to the generation directory.
+        On the coordinator, starts a commit pass in the background.
+        '''
+        self.backend.make_dir(self.generation_dir(generation))
+        self._write_json(self._marker(generation, self.rank), {"files": files})
+        if self._worker is None:
+            return
+        with self._lock:
+            self._uncommitted.add(generation)
+        self._worker.submit(self._commit_pass)
+
+    def flush(self, timeout: float = None) -> bool:
+        '''
+        Commits the newest complete generation, if it is not committed yet, and waits for the background commits.
+        Returns False if the timeout expired first.
+        '''
+        if self._worker is None:
+            return True
+        with self._lock:
+            uncommitted = bool(self._uncommitted)
+        if uncommitted:
+            # replaces a pass that did not start yet, a running one may have given up on a generation completed since
+            self._worker.submit(self._commit_pass)
+        return self._worker.wait(timeout)
+
+    def _generations(self) -> List[int]:
+        '''
+        Returns the generations with a directory on the target, if the backend can list it.
+        '''
+        if not self.backend.supports("list") or not self.backend.exists(self.target):
+            return []
+        return [
+            int(name[4:]) for name in self.backend.list(self.target)
+            if name.startswith("gen-") and name[4:].isdigit()
+        ]
+
+    def _uncommitted_generations(self, committed: int) -> List[int]:
+        return [generation for generation in self._generations() if generation > committed]
+
+    def _find_leftover_markers(self) -> dict:
+        committed = self.committed_generation() or 0
+        markers = {}
+        for generation in self._uncommitted_generations(committed):
+            for rank in range(self.world_size):
+                stat = self.backend.stat(self._marker(generation, rank))
+                if stat is not None:
+                    markers[(generation, rank)] = stat
+        return markers
+
+    def _missing_shards(self, generation: int) -> List[int]:
+        missing = []
+        for rank in range(self.world_size):
+            stat = self.backend.stat(self._marker(generation, rank))
+            # a marker left over by an earlier job does not count until the rank replaced it
+            if stat is None or self._leftover_markers.get((generation, rank)) == stat:
+                missing.append(rank)
+        return missing
+
+    def _commit_pass(self) -> bool:
+        '''
+        Commits the newest generation all ranks transferred their shards of. Returns False if there is none
+        within the timeout, or if the coordinator transferred a newer shard meanwhile, which starts the next pass.
+        '''
+        deadline = time.monotonic() + self.timeout
+        with self._lock:
+            uncommitted = sorted(self._uncommitted, reverse=True)
+        newest = uncommitted[0] if uncommitted else None
+        while newest is not None:
+            for generation in uncommitted:
+                if not self._missing_shards(generation):
+                    self._commit(generation)
+                    return True
+            with self._lock:
+                if max(self._uncommitted, default=None) != newest:
+                    return False
+            if time.monotonic() >= deadline:
+                print(f"Checkpointer: shards {self._missing_shards(newest)} of generation {newest} missing, not committing it yet.")
+                return False
+            time.sleep(self.poll_interval)
+        return False
+
+    def _commit(self, generation: int) -> None:
+        previous = self.committed_generation()
+        self._write_json(
+            remote_join(self.target, MANIFEST_FILE),
+            {"generation": generation, "world_size": self.world_size},
+        )
+        with self._lock:
+            stale = {older for older in self._uncommitted if older < generation}
+            self._uncommitted = {newer for newer in self._uncommitted if newer > generation}
+        if previous is not None and previous < generation:
+            stale.add(previous)
+        # generations left behind by an earlier job, and those the coordinator skipped, e.g. because its transfer
+        # was replaced by a newer one, while other ranks transferred their shards
+        stale.update(older for older in self._generations() if older < generation)
+        for older, rank in [key for key in self._leftover_markers if key[0] < generation]:
+            stale.add(older)
+            del self._leftover_markers[(older, rank)]
+        for older in sorted(stale):
+            self._remove_generation(older)
+
+    def discard_uncommitted(self, committed: int) -> None:
+        '''
+        Removes the shards of this rank of generations newer than the committed one, left over by an earlier job.
+        '''
+        for generation in self._uncommitted_generations(committed):
+            self._remove_shard(generation, self.rank)
+
+    def _remove_generation(self, generation: int) -> None:
+        for rank in range(self.world_size):
+            self._remove_shard(generation, rank)
+        self.backend.remove_dir(self.generation_dir(generation))
+
+    def _remove_shard(self, generation: int, rank: int) -> None:
+        marker = self._marker(generation, rank)
+        if not self.backend.exists(marker):
+            return
+        generation_dir = self.generation_dir(generation)
+        directories = {self.shard_dir(generation, rank)}
+        for name in self._read_json(marker)["files"]:
+            remote = remote_join(generation_dir, name)
+            self.backend.delete(remote)
+            # e.g. the slot directories of a multi-file shard
+            while posixpath.dirname(name):
+                name = posixpath.dirname(name)
+                directories.add(remote_join(generation_dir, name))
+        self.backend.delete(marker)
+        # the deepest directories first, so their parents are empty when they are removed
+        for directory in sorted(directories, key=lambda directory: str(directory).count("/"), reverse=True):
+            self.backend.remove_dir(directory)
@@ -0,0 +1,172 @@
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, List
+
+logger = logging.getLogger("checkpointer")
+
+
+class PhaseStatistics:
+    '''
+    Accumulated measurements of one phase.
+    '''
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.total_duration = 0.0
+        self.total_bytes = 0
+        self.last_duration = None
+        self.last_bytes = None
+        self.max_duration = 0.0
+
+    @property
+    def last_throughput(self):
+        '''
+        Bytes per second of the last measurement, or None if it moved no bytes.
+        '''
+        if not self.last_bytes or not self.last_duration:
+            return None
+        return self.last_bytes / self.last_duration
+
+    def as_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "total_duration": self.total_duration,
+            "total_bytes": self.total_bytes,
+            "last_duration": self.last_duration,
+            "last_bytes": self.last_bytes,
+            "last_throughput": self.last_throughput,
+            "max_duration": self.max_duration,
+        }
+
+
+class CheckpointMetrics:
+    '''
+    Collects the durations, byte counts and throughput of the phases of checkpointing, as well as event counters,
+    e.g. checkpoints skipped on SIGTERM or transfers coalesced by async_transfer.
+    Every measurement is passed to the hooks and logged to the "checkpointer" logger at DEBUG level,
+    with the measurement attached to the log record as the checkpointer_metrics attribute.
+    export() writes the accumulated statistics to a Prometheus textfile (e.g. for the node exporter) and/or a JSON file.
+    '''
+
+    def __init__(
+        self,
+        # functions called with a dict describing every measurement
+        hooks: List[Callable] = None,
+        prometheus_file: Path = None,  # textfile written by export() in the Prometheus exposition format
+        json_file: Path = None,  # file written by export() in JSON format
+        labels: dict = None,  # labels added to every exported metric, e.g. {"job": "1234.0"}
+    ) -> None:
+        self.hooks = list(hooks) if hooks else []
+        self.prometheus_file = Path(prometheus_file) if prometheus_file is not None else None
+        self.json_file = Path(json_file) if json_file is not None else None
+        self.labels = dict(labels) if labels else {}
+        self.phases = {}
+        self.counters = {}
+        self._lock = threading.Lock()
+
+    def record(self, phase: str, duration: float, nbytes: int = None) -> None:
+        '''
+        Records that phase took duration seconds, moving nbytes bytes.
+        '''
+        with self._lock:
+            statistics = self.phases.setdefault(phase, PhaseStatistics())
+            statistics.count += 1
+            statistics.total_duration += duration
+            statistics.last_duration = duration
+            statistics.max_duration = max(statistics.max_duration, duration)
+            statistics.last_bytes = nbytes
+            if nbytes is not None:
+                statistics.total_bytes += nbytes
+            throughput = statistics.last_throughput
+        if not self.hooks and not logger.isEnabledFor(logging.DEBUG):
+            return
+        measurement = {"phase": phase, "duration": duration, "bytes": nbytes, "throughput": throughput}
+        for hook in self.hooks:
+            hook(measurement)
+        logger.debug(
+            "%s took %.6fs (%s bytes)", phase, duration, nbytes, extra={"checkpointer_metrics": measurement}
+        )
+
+    @contextmanager
+    def measure(self, phase: str, nbytes: Callable = None):
+        '''
+        Context manager recording the duration of its body as phase.
+        nbytes is an optional function called afterwards, returning the number of bytes moved.
+        '''
+        start = time.perf_counter()
+        yield
+        duration = time.perf_counter() - start
+        self.record(phase, duration, nbytes() if nbytes is not None else None)
+
+    def count(self, event: str, increment: int = 1) -> None:
+        '''
+        Increments the counter of event.
+        '''
+        with self._lock:
+            self.counters[event] = self.counters.get(event, 0) + increment
+
+    def set_count(self, event: str, value: int) -> None:
+        with self._lock:
+            self.counters[event] = value
+
+    def summary(self) -> dict:
+        '''
+        Returns the accumulated statistics of all phases and the counters as a dict.
+        '''
+        with self._lock:
+            return {
+                "labels": dict(self.labels),
+                "phases": {phase: statistics.as_dict() for phase, statistics in self.phases.items()},
+                "counters": dict(self.counters),
+            }
+
+    def prometheus_text(self) -> str:
+        '''
+        Returns the accumulated statistics in the Prometheus text exposition format.
+        '''
+        summary = self.summary()
+
+        def labels(**extra):
+            content = {**self.labels, **extra}
+            return "{" + ",".join(f'{key}="{value}"' for key, value in sorted(content.items())) + "}"
+
+        lines = []
+        metrics = [
+            ("checkpointer_phase_count_total", "counter", "count", "number of measurements of the phase"),
+            ("checkpointer_phase_duration_seconds_total", "counter", "total_duration", "total duration of the phase"),
+            ("checkpointer_phase_bytes_total", "counter", "total_bytes", "total bytes moved in the phase"),
+            ("checkpointer_phase_last_duration_seconds", "gauge", "last_duration", "duration of the last measurement"),
+            ("checkpointer_phase_max_duration_seconds", "gauge", "max_duration", "longest measurement of the phase"),
+            ("checkpointer_phase_last_throughput_bytes_per_second", "gauge", "last_throughput",
+             "throughput of the last measurement"),
+        ]
+        for name, kind, key, description in metrics:
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} {kind}")
+            for phase, statistics in sorted(summary["phases"].items()):
+                if statistics[key] is not None:
+                    lines.append(f"{name}{labels(phase=phase)} {statistics[key]}")
+        lines.append("# HELP checkpointer_events_total number of events, e.g. skipped or coalesced checkpoints")
+        lines.append("# TYPE checkpointer_events_total counter")
+        for event, value in sorted(summary["counters"].items()):
+            lines.append(f"checkpointer_events_total{labels(event=event)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def export(self) -> None:
+        '''
+        Writes the statistics to prometheus_file and json_file, if set. The files are replaced atomically.
+        '''
+        if self.prometheus_file is not None:
+            self._write_atomically(self.prometheus_file, self.prometheus_text())
+        if self.json_file is not None:
+            self._write_atomically(self.json_file, json.dumps(self.summary(), indent=2))
+
+    def _write_atomically(self, path: Path, content: str) -> None:
+        tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        tmp_path.write_text(content)
+        os.replace(tmp_path, path)
@@ -1,18 +1,8 @@
 from keras.callbacks import BackupAndRestore
 from ..checkpointer import Checkpointer
+from ..archiving import make_archive, extract_archive
 from pathlib import Path
 import os
-import tarfile
-
-
-def make_tarfile(output_filename, source_dir):
-    with tarfile.open(output_filename, "w:gz") as tar:
-        tar.add(source_dir, arcname=os.path.basename(source_dir), recursive=True)
-
-
-def extract_tar(tar_filename, extract_folder):
-    with tarfile.open(tar_filename, 'r') as tar:
-        tar.extractall(extract_folder)
 
 
 class KerasCheckpointerCallback(BackupAndRestore):
@@ -24,22 +14,57 @@ class KerasCheckpointerCallback(BackupAndRestore):
     The checkpointers `checkpoint_every` parameter will only determine how often the zip archive will be created.
     Checkpoints are restored before the training begins.
     With the `**checkpointer_kwargs` you can pass configurations like the checkpoint transfer mode to the checkpointer.
+    The archive is compressed with `archive_codec` ("gz", "zst" or "none"), using multi-threaded compressors if installed.
+    With `stream_to_target` in shared mode, the archive is written directly to the checkpoint_transfer_target
+    instead of being staged locally and copied.
+    With `directory_sync`, no archive is created. The backup directory is transferred file by file into the
+    checkpoint_transfer_target directory, and only files that changed since the last transfer are uploaded.
+    Restoring only fetches files that are missing or differ locally.
     '''
 
-    def __init__(self, local_checkpoint_file, save_freq="epoch", **checkpointer_kwargs) -> None:
+    def __init__(
+        self,
+        local_checkpoint_file,
+        save_freq="epoch",
+        archive_codec="gz",
+        compresslevel=None,
+        stream_to_target=False,
+        directory_sync=False,
+        **checkpointer_kwargs
+    ) -> None:
         super().__init__(
             backup_dir=local_checkpoint_file,
             save_freq=save_freq,
             delete_checkpoint=True,
         )
+        if directory_sync:
+            assert not stream_to_target, "stream_to_target can not be combined with directory_sync"
+            Path(local_checkpoint_file).mkdir(parents=True, exist_ok=True)
+            self.checkpointer = Checkpointer(
+                local_checkpoint_file=Path(local_checkpoint_file),
+                # keras writes the backup directory itself, it only needs to be transferred
+                checkpoint_function=lambda path, model: None,
+                # get_checkpoint fetched the files into the backup directory
+                restore_function=lambda path: path,
+                **checkpointer_kwargs
+            )
+            return
         self.zip_file = f"{local_checkpoint_file}/checkpoint.zip"
+        if stream_to_target:
+            assert checkpointer_kwargs.get("checkpoint_transfer_mode") == "shared", \
+                "stream_to_target is only supported in shared mode"
+            # the archive on the shared target is the checkpoint, nothing is left to transfer
+            self.zip_file = str(checkpointer_kwargs.pop("checkpoint_transfer_target"))
+            checkpointer_kwargs["checkpoint_transfer_mode"] = "None"
         self.local_parent_dir = os.path.dirname(local_checkpoint_file)
         self.checkpointer = Checkpointer(
             local_checkpoint_file=Path(self.zip_file),
             # needing to zip, since keras creates a whole dir structure
-            checkpoint_function=lambda path, model: make_tarfile(self.zip_file, local_checkpoint_file),
+            checkpoint_function=lambda path, model: make_archive(
+                self.zip_file, local_checkpoint_file, codec=archive_codec, compresslevel=compresslevel
+            ),
             # needing to unzip, since keras creates a whole dir structure
-            restore_function=lambda path: extract_tar(self.zip_file, self.local_parent_dir),
+            restore_function=lambda path: extract_archive(self.zip_file, self.local_parent_dir),
             **checkpointer_kwargs
         )
 
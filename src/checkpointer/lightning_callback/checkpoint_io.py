@@ -0,0 +1,85 @@
+import os
+from pathlib import Path
+from pytorch_lightning.plugins.io import CheckpointIO, TorchCheckpointIO
+from ..snapshot import StateSnapshot
+
+
+class CheckpointerIO(CheckpointIO):
+    '''
+    Lightning CheckpointIO plugin writing checkpoints off the training loop.
+    save_checkpoint only copies the checkpoint's tensors into host buffers (see checkpointer.snapshot.StateSnapshot)
+    and returns, after the previous save released the buffers. The copy is written by base_io in the checkpointer's
+    background thread, and transferred by its transfer thread, if it is written to the checkpointer's local_checkpoint_file.
+    A repeated save of the same global_step to the same path is skipped, e.g. when the checkpointer and a
+    ModelCheckpoint callback both save at the end of an epoch. Loading, removing and teardown wait for pending saves.
+    A failed background save or transfer is raised by the next save_checkpoint or by teardown.
+    The checkpointer needs a background thread, i.e. async_transfer or a snapshot_function.
+    '''
+
+    def __init__(self, checkpointer, base_io: CheckpointIO = None, snapshot_function=None) -> None:
+        '''
+        parameters:
+            checkpointer: the Checkpointer transferring the checkpoints written to its local_checkpoint_file
+            base_io: CheckpointIO writing and reading the files, by default a TorchCheckpointIO
+            snapshot_function: function copying the checkpoint before it is written, by default a StateSnapshot
+        '''
+        assert checkpointer._transfer_worker is not None, "CheckpointerIO needs a checkpointer with async_transfer"
+        self.checkpointer = checkpointer
+        self.base_io = base_io if base_io is not None else TorchCheckpointIO()
+        self.snapshot_function = snapshot_function if snapshot_function is not None else StateSnapshot()
+        self.last_saved = None  # global_step and path of the last save that was written
+        self._saving = None  # global_step and path of the save being written in the background
+
+    def _is_checkpoint_file(self, path) -> bool:
+        local_checkpoint_file = self.checkpointer.local_checkpoint_file
+        return not isinstance(local_checkpoint_file, list) and \
+            Path(path).resolve() == Path(local_checkpoint_file).resolve()
+
+    def has_saved(self, global_step, path) -> bool:
+        '''
+        Returns True if the state of global_step was already saved to path.
+        '''
+        return (global_step, os.fspath(path)) in (self.last_saved, self._saving)
+
+    def save_checkpoint(self, checkpoint, path, storage_options=None) -> None:
+        # a failed background save or transfer is raised to the trainer, like by Checkpointer.step()
+        self.checkpointer._raise_background_error()
+        global_step = checkpoint.get("global_step")
+        if global_step is not None and self.has_saved(global_step, path):
+            self.checkpointer.metrics.count("coalesced")
+            return
+        saving = (global_step, os.fspath(path))
+        transfer = self._is_checkpoint_file(path)
+
+        def write(snapshot, step):
+            try:
+                if transfer:
+                    with self.checkpointer._writing_local_files(step):
+                        self.base_io.save_checkpoint(snapshot, path, storage_options=storage_options)
+                else:
+                    self.base_io.save_checkpoint(snapshot, path, storage_options=storage_options)
+                self.last_saved = saving
+            finally:
+                if self._saving == saving:
+                    self._saving = None
+
+        self._saving = saving
+        try:
+            # waits for the previous save to release the snapshot buffers, but not for its transfer
+            self.checkpointer._persist_in_background(lambda: self.snapshot_function(checkpoint), write, transfer)
+        except BaseException:
+            self._saving = None
+            raise
+
+    def load_checkpoint(self, path, map_location=None):
+        self.checkpointer.flush()
+        return self.base_io.load_checkpoint(path, map_location=map_location)
+
+    def remove_checkpoint(self, path) -> None:
+        self.checkpointer.flush()
+        self.base_io.remove_checkpoint(path)
+
+    def teardown(self) -> None:
+        self.checkpointer.flush()
+        self.base_io.teardown()
+        self.checkpointer._raise_background_error()
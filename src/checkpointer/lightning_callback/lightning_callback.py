@@ -1,5 +1,6 @@
 from pytorch_lightning.callbacks import Callback
 from ..checkpointer import Checkpointer
+from .checkpoint_io import CheckpointerIO
 
 
 class LightningCheckpointerCallback(Callback):
@@ -8,24 +9,42 @@ class LightningCheckpointerCallback(Callback):
     It uses the trainers `save_checkpoint`´to create the checkpoint and handles the transfer of checkpoint upon their creation.
     Besides the predefined `restore_function` and `checkpoint_function` the callback can be configured just like the checkpointer.
     Since the checkpoint function is also called upon interuption, the training can be resumed from the last batch, that was passed.
+    With `async_io`, checkpoints are written and transferred in the background by the `checkpoint_io` plugin,
+    which has to be passed to the trainer: `Trainer(callbacks=[callback], plugins=[callback.checkpoint_io])`.
     '''
 
-    def __init__(self, **checkpointer_kwargs) -> None:
+    def __init__(self, async_io=False, **checkpointer_kwargs) -> None:
         super().__init__()
+        if async_io:
+            checkpointer_kwargs["async_transfer"] = True
         self.checkpointer = Checkpointer(
             checkpoint_function=lambda path, trainer: trainer.save_checkpoint(path),
             restore_function=lambda path: path,
             **checkpointer_kwargs
         )
+        self.checkpoint_io = CheckpointerIO(self.checkpointer) if async_io else None
+
     def on_fit_start(self, trainer, pl_module,) -> None:
         # initialize the checkpointer with the trainer instance so it can call the checkpoint function
         self.checkpointer.checkpoint_value = trainer
 
     def on_save_checkpoint(self, trainer, pl_module, checkpoint):
-        self.checkpointer.transfer_checkpoint_files()
+        # with async_io, the checkpoint_io transfers the checkpoint once it is written
+        if self.checkpoint_io is None:
+            self.checkpointer.transfer_checkpoint_files()
 
     def restore(self):
         return self.checkpointer.restore(None)
 
     def on_train_epoch_end(self, trainer, pl_module):
-        self.checkpointer.step(trainer)
+        if self.checkpoint_io is None:
+            self.checkpointer.step(trainer)
+            return
+        # the checkpoint_io writes and transfers the checkpoint in the background, so the checkpointer must not
+        # schedule a transfer itself, it would replace the pending write
+        self.checkpointer._step(trainer, lambda: self._save_checkpoint(trainer))
+
+    def _save_checkpoint(self, trainer):
+        local_checkpoint_file = self.checkpointer.local_checkpoint_file
+        if not self.checkpoint_io.has_saved(trainer.global_step, local_checkpoint_file):
+            trainer.save_checkpoint(local_checkpoint_file)
@@ -0,0 +1,234 @@
+import hashlib
+import json
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable
+from .backends import remote_with_suffix
+from .throttling import THROTTLE_CHUNK_SIZE, put_throttled
+
+
+class RangedTransfer:
+    '''
+    Moves large files in ranges of range_size bytes over several parallel streams.
+    Failed ranges are retried with exponential backoff. Data is written to a `.part` file that is renamed
+    once all ranges arrived, so the destination never holds a partial file.
+    Interrupted transfers (e.g. a dropped connection or an eviction) resume with the missing ranges instead of starting
+    from byte zero:
+    - uploads record the digest of every range written to the remote `.part` file in a journal next to it on the target.
+      A later upload to the same target, also by another process on another node, skips ranges whose local content
+      still has the recorded digest.
+    - downloads keep the `.part` file and a journal of the completed ranges in state_dir, keyed by the remote file,
+      its size and modification time.
+    Files not larger than range_size are transferred with the backend's plain put and get.
+    '''
+
+    def __init__(
+        self,
+        backend,  # a TransferBackend supporting stat, ranged_get, ranged_put and move
+        range_size: int = 64 * 2**20,
+        streams: int = 4,
+        retries: int = 5,
+        backoff: float = 1.0,  # delay before the first retry in seconds, doubled for each further one
+        throttle: Callable = None,  # called with the number of bytes before each piece of an upload is sent
+        state_dir: Path = None,  # local directory for partial downloads, outside of the checkpoint
+    ) -> None:
+        assert backend.supports(
+            "stat", "ranged_get", "ranged_put", "move"
+        ), "ranged transfers need a backend supporting stat, ranged_get, ranged_put and move"
+        self.backend = backend
+        self.range_size = range_size
+        self.streams = streams
+        self.retries = retries
+        self.backoff = backoff
+        self.throttle = throttle
+        self.state_dir = Path(state_dir) if state_dir is not None else Path(tempfile.gettempdir()) / "checkpointer-ranged"
+        self.resumed_bytes = 0  # bytes skipped because an earlier attempt transferred them
+        self._downloads = 0  # running downloads using the state_dir
+        self._state_lock = threading.Lock()
+
+    def upload(self, local_file: Path, remote_file) -> int:
+        '''
+        Uploads local_file to remote_file, resuming an interrupted upload. Returns the number of bytes sent.
+        '''
+        local_file = Path(local_file)
+        size = local_file.stat().st_size
+        if size <= self.range_size:
+            if self.throttle is not None:
+                put_throttled(self.backend, local_file, remote_file, self.throttle)
+            else:
+                self.backend.put(local_file, remote_file)
+            return size
+        partial = remote_with_suffix(remote_file, ".part")
+        journal = remote_with_suffix(remote_file, ".part.journal")
+        identity = {"size": size, "range_size": self.range_size}
+        recorded = self._load_remote_journal(journal, identity) if self.backend.exists(partial) else {}
+        digests = dict(recorded)
+        sent = 0
+
+        def transfer_range(index, offset, length):
+            data = os.pread(fd, length, offset)
+            digest = hashlib.blake2b(data, digest_size=20).hexdigest()
+            if recorded.get(str(index)) == digest:
+                return digest, True
+            if self.throttle is None:
+                writer.write(offset, data)
+                return digest, False
+            # sent in pieces, so the range does not go out in a burst after waiting for its whole bandwidth
+            for start in range(0, length, THROTTLE_CHUNK_SIZE):
+                piece = data[start:start + THROTTLE_CHUNK_SIZE]
+                self.throttle(len(piece))
+                writer.write(offset + start, piece)
+            return digest, False
+
+        def record(index, result):
+            nonlocal sent
+            digest, resumed = result
+            if resumed:
+                self.resumed_bytes += min(self.range_size, size - index * self.range_size)
+                return
+            sent += min(self.range_size, size - index * self.range_size)
+            digests[str(index)] = digest
+            self._save_remote_journal(journal, identity, digests)
+
+        fd = os.open(local_file, os.O_RDONLY)
+        writer = self.backend.open_range_writer(partial, truncate=not recorded)
+        try:
+            self._run(size, range(self._count(size)), transfer_range, record)
+        finally:
+            writer.close()
+            os.close(fd)
+        self.backend.move(partial, remote_file)
+        if self.backend.supports("delete"):
+            self.backend.delete(journal)
+        return sent
+
+    def download(self, remote_file, local_file: Path) -> None:
+        local_file = Path(local_file)
+        stat = self.backend.stat(remote_file)
+        assert stat is not None, f"{remote_file} does not exist"
+        if stat.size <= self.range_size:
+            self.backend.get(remote_file, local_file)
+            return
+        key = hashlib.blake2b(f"{remote_file}:{local_file.resolve()}".encode(), digest_size=10).hexdigest()
+        partial = self.state_dir / f"{key}.part"
+        journal = self.state_dir / f"{key}.download-journal"
+        identity = {
+            "remote": str(remote_file),
+            "size": stat.size,
+            "mtime": stat.mtime,
+            "range_size": self.range_size,
+        }
+        with self._state_lock:
+            self.state_dir.mkdir(parents=True, exist_ok=True)
+            self._downloads += 1
+        try:
+            done = self._load_journal(journal, identity)
+            if done and not partial.exists():
+                done = set()
+            self.resumed_bytes += sum(min(self.range_size, stat.size - index * self.range_size) for index in done)
+
+            def transfer_range(index, offset, length):
+                data = reader.read(offset, length)
+                assert len(data) == length, f"short read of {remote_file} at offset {offset}"
+                written = 0
+                while written < length:
+                    written += os.pwrite(fd, data[written:], offset + written)
+
+            def record(index, result):
+                done.add(index)
+                journal.write_text(json.dumps({"identity": identity, "done": sorted(done)}))
+
+            fd = os.open(partial, os.O_WRONLY | os.O_CREAT | (0 if done else os.O_TRUNC), 0o644)
+            reader = self.backend.open_range_reader(remote_file)
+            try:
+                pending = [index for index in range(self._count(stat.size)) if index not in done]
+                self._run(stat.size, pending, transfer_range, record)
+                os.ftruncate(fd, stat.size)
+            finally:
+                reader.close()
+                os.close(fd)
+            # the state_dir may be on another file system than local_file
+            shutil.move(partial, local_file)
+            journal.unlink(missing_ok=True)
+        finally:
+            with self._state_lock:
+                self._downloads -= 1
+                if not self._downloads:
+                    try:
+                        self.state_dir.rmdir()
+                    except OSError:  # holds interrupted downloads
+                        pass
+
+    def _count(self, size):
+        return (size + self.range_size - 1) // self.range_size
+
+    def _load_journal(self, journal: Path, identity: dict) -> set:
+        '''
+        Returns the ranges completed by an earlier attempt of the same download.
+        '''
+        try:
+            content = json.loads(journal.read_text())
+        except (OSError, ValueError):
+            return set()
+        if content.get("identity") != identity:
+            return set()
+        return set(content["done"])
+
+    def _load_remote_journal(self, journal, identity: dict) -> dict:
+        '''
+        Returns the digests of the ranges written by an earlier attempt of an upload to the same target, by range index.
+        '''
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            local_journal = Path(tmp_dir) / "journal"
+            try:
+                self.backend.get(journal, local_journal)
+                content = json.loads(local_journal.read_text())
+            except (OSError, ValueError):
+                return {}
+        if content.get("identity") != identity:
+            return {}
+        return content["ranges"]
+
+    def _save_remote_journal(self, journal, identity: dict, digests: dict) -> None:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            local_journal = Path(tmp_dir) / "journal"
+            local_journal.write_text(json.dumps({"identity": identity, "ranges": digests}))
+            self.backend.put(local_journal, journal)
+
+    def _run(self, size, indices, transfer_range, record):
+        '''
+        Calls transfer_range(index, offset, length) for the ranges with the given indices over parallel streams,
+        retrying failed ranges, and record(index, result) one at a time after each range is complete.
+        '''
+        lock = threading.Lock()
+        failed = threading.Event()
+
+        def run_range(index):
+            if failed.is_set():  # no point in trying further ranges, the journal keeps the progress
+                return
+            offset = index * self.range_size
+            length = min(self.range_size, size - offset)
+            for attempt in range(self.retries + 1):
+                try:
+                    result = transfer_range(index, offset, length)
+                    break
+                except Exception as e:
+                    if attempt == self.retries:
+                        failed.set()
+                        raise
+                    delay = self.backoff * 2**attempt * random.uniform(0.5, 1.5)
+                    print(f"Checkpointer: transfer of range {index} failed ({e}), retrying in {delay:.1f}s")
+                    time.sleep(delay)
+            with lock:
+                record(index, result)
+
+        indices = list(indices)
+        with ThreadPoolExecutor(max_workers=max(1, min(self.streams, len(indices)))) as executor:
+            # list() propagates the first range that failed after all retries
+            list(executor.map(run_range, indices))
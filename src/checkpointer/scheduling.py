@@ -0,0 +1,133 @@
+import math
+import os
+import random
+import time
+from typing import Callable
+from .batch_system import HTCondor, get_job_ad
+
+
+def optimal_checkpoint_interval(checkpoint_cost: float, mean_time_between_failures: float) -> float:
+    '''
+    Daly's higher-order estimate of the checkpoint interval (in seconds of work between two checkpoints)
+    that minimises the expected lost work plus checkpoint overhead.
+    For small checkpoint costs, this approaches Young's sqrt(2 * C * M).
+    '''
+    cost, mtbf = checkpoint_cost, mean_time_between_failures
+    if cost >= 2 * mtbf:
+        return mtbf
+    ratio = cost / (2 * mtbf)
+    return math.sqrt(2 * cost * mtbf) * (1 + math.sqrt(ratio) / 3 + ratio / 9) - cost
+
+
+class AdaptiveSchedule:
+    '''
+    Wall-clock checkpoint schedule for the Checkpointer's checkpoint_schedule parameter.
+    Instead of checkpointing every checkpoint_every steps, it measures how long steps and checkpoints take
+    and checkpoints whenever the time since the last checkpoint reaches the Young/Daly optimal interval.
+    The first step always creates a checkpoint, which also provides the first cost measurement.
+    '''
+
+    def __init__(
+        self,
+        mean_time_between_failures: float = 6 * 3600,  # expected time between evictions or failures in seconds
+        min_interval: float = 60,  # lower bound of the interval in seconds
+        max_interval: float = None,  # upper bound of the interval in seconds
+        # name of a job ad attribute holding the job's runtime limit in seconds, e.g. "MaxRuntime"
+        job_ad_limit: str = None,
+        smoothing: float = 0.3,  # weight of the newest measurement in the moving averages
+        jitter: float = 0.0,  # fraction by which every interval is randomly shortened or lengthened
+        clock: Callable = time.monotonic,
+    ) -> None:
+        '''
+        parameters:
+            mean_time_between_failures: expected time between evictions or failures in seconds
+            min_interval: lower bound of the interval in seconds
+            max_interval: upper bound of the interval in seconds
+            job_ad_limit: name of an HTCondor job ad attribute holding the runtime limit of the job in seconds.
+                If set and available, the runtime left, i.e. the limit minus the time since the job started,
+                bounds both the mean time between failures and the interval, but not below min_interval.
+            smoothing: weight of the newest measurement in the moving averages of step and checkpoint durations
+            jitter: every interval is multiplied by a random factor between 1 - jitter and 1 + jitter,
+                so jobs started together drift apart instead of checkpointing at the same moments
+            clock: function returning the current time in seconds
+        '''
+        self.mean_time_between_failures = mean_time_between_failures
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.smoothing = smoothing
+        assert 0 <= jitter < 1, "jitter must be in [0, 1)"
+        self.jitter = jitter
+        self._jitter_factor = self._draw_jitter()
+        self.clock = clock
+        self._runtime_end = None  # clock time at which the runtime limit of the job is reached
+        if job_ad_limit is not None and os.environ.get("_CONDOR_JOB_AD"):
+            job_ad = get_job_ad()
+            limit = job_ad.get(job_ad_limit)
+            if isinstance(limit, (int, float)) and not isinstance(limit, bool):
+                start = HTCondor(job_ad)._number("JobCurrentStartDate", "JobStartDate")
+                elapsed = 0.0 if start is None else max(0.0, time.time() - start)
+                self._runtime_end = self.clock() + float(limit) - elapsed
+
+        self.step_duration = None  # moving average of the time between steps, excluding checkpoints
+        self.checkpoint_cost = None  # moving average of the time a checkpoint blocks the training
+        self.transfer_duration = None  # moving average of the transfer duration
+        self._last_step = None
+        self._last_checkpoint = None
+        self._stall = 0.0
+
+    def _draw_jitter(self):
+        return random.uniform(1 - self.jitter, 1 + self.jitter) if self.jitter else 1.0
+
+    def _average(self, average, value):
+        if average is None:
+            return value
+        return self.smoothing * value + (1 - self.smoothing) * average
+
+    @property
+    def interval(self) -> float:
+        '''
+        The current target interval between two checkpoints in seconds.
+        '''
+        if self.checkpoint_cost is None:
+            return self.min_interval
+        mean_time_between_failures, max_interval = self.mean_time_between_failures, self.max_interval
+        if self._runtime_end is not None:
+            # the job ends at its runtime limit at the latest
+            remaining = max(self._runtime_end - self.clock(), self.min_interval, 1.0)
+            mean_time_between_failures = min(mean_time_between_failures, remaining)
+            max_interval = remaining if max_interval is None else min(max_interval, remaining)
+        interval = optimal_checkpoint_interval(self.checkpoint_cost, mean_time_between_failures)
+        # checkpointing faster than transfers finish only produces checkpoints that are dropped
+        if self.transfer_duration is not None:
+            interval = max(interval, self.transfer_duration)
+        interval = max(interval, self.min_interval)
+        if max_interval is not None:
+            interval = min(interval, max_interval)
+        return interval
+
+    def due(self) -> bool:
+        '''
+        Called once per step. Returns True if a checkpoint should be created in this step.
+        '''
+        now = self.clock()
+        if self._last_step is not None:
+            self.step_duration = self._average(self.step_duration, now - self._last_step - self._stall)
+        self._last_step = now
+        self._stall = 0.0
+        if self._last_checkpoint is None:
+            return True
+        # checkpoint in the step that ends closest to the target interval
+        half_step = (self.step_duration or 0.0) / 2
+        return now - self._last_checkpoint + half_step >= self.interval * self._jitter_factor
+
+    def checkpoint_done(self, duration: float, transfer_duration: float = None) -> None:
+        '''
+        Records that a checkpoint was created, blocking the training for duration seconds.
+        transfer_duration is the duration of the latest transfer, if it ran in the background.
+        '''
+        self._last_checkpoint = self.clock()
+        self._jitter_factor = self._draw_jitter()
+        self._stall += duration
+        self.checkpoint_cost = self._average(self.checkpoint_cost, duration)
+        if transfer_duration is not None:
+            self.transfer_duration = self._average(self.transfer_duration, transfer_duration)
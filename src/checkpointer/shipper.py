@@ -0,0 +1,259 @@
+'''
+Standalone process transferring checkpoints written by another process, e.g. a training that only writes
+its checkpoint locally, or a program not written in Python:
+
+    checkpointer-ship --local-checkpoint-file checkpoint.pt --mode shared --target /storage/checkpoint.pt
+
+The checkpoint is transferred whenever its files were completely written, detected with inotify on Linux
+and by polling otherwise. Further Checkpointer parameters can be given as JSON with --config.
+'''
+import argparse
+import ctypes
+import ctypes.util
+import json
+import os
+import select
+import signal
+import struct
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import List
+from .checkpointer import Checkpointer
+
+# inotify events of files that were completely written, or moved into place
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_ISDIR = 0x40000000
+_EVENT = struct.Struct("iIII")  # wd, mask, cookie and length of the name of struct inotify_event
+# transfers of a checkpoint changing while it is transferred, before the shipper waits for the next write instead
+MAX_SHIP_ATTEMPTS = 3
+
+
+def scan_signatures(paths: List[Path]) -> dict:
+    '''
+    Returns the size, modification time and inode of every file of paths, descending into directories.
+    '''
+    signatures = {}
+    for path in paths:
+        files = sorted(Path(path).rglob("*")) if Path(path).is_dir() else [Path(path)]
+        for file in files:
+            try:
+                stat = file.stat()
+            except FileNotFoundError:
+                continue
+            signatures[file] = (stat.st_size, stat.st_mtime_ns, stat.st_ino)
+    return signatures
+
+
+class PollingWatcher:
+    '''
+    Detects changes of files by comparing their sizes and modification times every poll_interval seconds.
+    '''
+
+    def __init__(self, paths: List[Path], poll_interval: float = 5.0) -> None:
+        self.paths = [Path(path) for path in paths]
+        self.poll_interval = poll_interval
+        self._signatures = scan_signatures(self.paths)
+
+    def wait(self, timeout: float) -> bool:
+        '''
+        Returns True if the files changed within timeout seconds.
+        '''
+        deadline = time.monotonic() + timeout
+        while True:
+            signatures = scan_signatures(self.paths)
+            if signatures != self._signatures:
+                self._signatures = signatures
+                return True
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            time.sleep(min(self.poll_interval, remaining))
+
+    def close(self) -> None:
+        pass
+
+
+class InotifyWatcher:
+    '''
+    Detects completely written files (IN_CLOSE_WRITE) and files moved into place (IN_MOVED_TO) with Linux' inotify.
+    Files are watched through their directory, so they may be replaced atomically. Directories are watched recursively.
+    '''
+
+    def __init__(self, paths: List[Path]) -> None:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        if not hasattr(libc, "inotify_init1"):
+            raise OSError("inotify is not available")
+        self._libc = libc
+        self._fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._watches = {}  # watch descriptor to watched directory
+        self._files = set()  # watched files, as opposed to directories
+        self._directories = []
+        for path in paths:
+            path = Path(path).absolute()
+            if path.is_dir():
+                self._directories.append(path)
+                for directory in [path] + [entry for entry in path.rglob("*") if entry.is_dir()]:
+                    self._add_watch(directory)
+            else:
+                self._files.add(path)
+                self._add_watch(path.parent)
+
+    def _add_watch(self, directory: Path) -> None:
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(directory), IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"watching {directory} failed")
+        self._watches[wd] = directory
+
+    def _relevant(self, path: Path, mask: int) -> bool:
+        if mask & IN_ISDIR:
+            if mask & (IN_CREATE | IN_MOVED_TO) and any(d in path.parents for d in self._directories):
+                self._add_watch(path)
+                return True
+            return False
+        if not mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+            return False
+        return path in self._files or any(d in path.parents for d in self._directories)
+
+    def wait(self, timeout: float) -> bool:
+        '''
+        Returns True if a watched file was written within timeout seconds.
+        '''
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            readable, _, _ = select.select([self._fd], [], [], remaining)
+            if not readable:
+                return False
+            data = os.read(self._fd, 64 * 1024)
+            changed = False
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = _EVENT.unpack_from(data, offset)
+                name = data[offset + _EVENT.size:offset + _EVENT.size + length].rstrip(b"\0")
+                offset += _EVENT.size + length
+                if mask & IN_Q_OVERFLOW:
+                    changed = True
+                elif wd in self._watches:
+                    changed |= self._relevant(self._watches[wd] / os.fsdecode(name), mask)
+            if changed:
+                return True
+
+    def close(self) -> None:
+        os.close(self._fd)
+
+
+class CheckpointShipper:
+    '''
+    Transfers the checkpoint of a Checkpointer whenever its local files were written.
+    A transfer starts once no further writes happened for settle_time seconds, so checkpoints consisting
+    of several files are transferred once they are complete.
+    '''
+
+    def __init__(
+        self,
+        checkpointer: Checkpointer,
+        settle_time: float = 1.0,  # seconds without writes before the checkpoint is transferred
+        poll_interval: float = 5.0,  # seconds between checks if inotify is not available
+        use_inotify: bool = True,
+    ) -> None:
+        self.checkpointer = checkpointer
+        self.settle_time = settle_time
+        self.watcher = None
+        if use_inotify and sys.platform.startswith("linux"):
+            try:
+                self.watcher = InotifyWatcher(checkpointer._local_paths)
+            except OSError as e:
+                print(f"Checkpointer: inotify not available ({e}), polling instead.")
+        if self.watcher is None:
+            self.watcher = PollingWatcher(checkpointer._local_paths, poll_interval)
+        self.shipped = 0
+
+    def ship(self) -> None:
+        '''
+        Transfers the checkpoint, if it exists. The other process may write the checkpoint again during the transfer,
+        so it is transferred again if the size, modification time or inode of one of its files changed meanwhile.
+        '''
+        for _ in range(MAX_SHIP_ATTEMPTS):
+            if not self.checkpointer._local_checkpoint_exists():
+                return
+            signatures = scan_signatures(self.checkpointer._local_paths)
+            self.checkpointer.transfer_checkpoint_files()
+            changed = scan_signatures(self.checkpointer._local_paths) != signatures
+            self.shipped += 1
+            if not changed:
+                return
+        print(f"Checkpointer: checkpoint changed during {MAX_SHIP_ATTEMPTS} transfers, shipping it after the next write.")
+
+    def run(self, stop: threading.Event = None) -> None:
+        '''
+        Transfers the checkpoint after every write until stop is set. Transfers once more before returning
+        if a write was not transferred yet.
+        '''
+        stop = stop if stop is not None else threading.Event()
+        pending = False
+        while not stop.is_set():
+            if self.watcher.wait(self.settle_time if pending else 1.0):
+                pending = True
+            elif pending:
+                self.ship()
+                pending = False
+        if pending:
+            self.ship()
+        self.watcher.close()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="checkpointer-ship", description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--local-checkpoint-file", nargs="+", required=True,
+                        help="file, directory or several files defining the checkpoint")
+    parser.add_argument("--mode", default="shared", help="checkpoint_transfer_mode, e.g. shared, xrootd or local")
+    parser.add_argument("--target", required=True, help="checkpoint_transfer_target")
+    parser.add_argument("--xrootd-server-name", help="name of the xrootd server in xrootd mode")
+    parser.add_argument("--config", help="JSON file with further keyword arguments of the Checkpointer")
+    parser.add_argument("--settle-time", type=float, default=1.0, help="seconds without writes before transferring")
+    parser.add_argument("--poll-interval", type=float, default=5.0, help="seconds between checks without inotify")
+    parser.add_argument("--no-inotify", action="store_true", help="poll for changes instead of using inotify")
+    parser.add_argument("--once", action="store_true", help="transfer the checkpoint once and exit")
+    args = parser.parse_args(argv)
+
+    kwargs = json.loads(Path(args.config).read_text()) if args.config else {}
+    local_checkpoint_file = [Path(path).absolute() for path in args.local_checkpoint_file]
+    checkpointer = Checkpointer(
+        local_checkpoint_file=local_checkpoint_file[0] if len(local_checkpoint_file) == 1 else local_checkpoint_file,
+        checkpoint_function=None,  # the checkpoint is written by another process
+        restore_function=None,
+        checkpoint_transfer_mode=args.mode,
+        checkpoint_transfer_target=Path(args.target) if args.mode == "shared" else args.target,
+        xrootd_server_name=args.xrootd_server_name,
+        **kwargs
+    )
+    assert checkpointer.backend is not None, "the shipper needs a transfer mode transferring files"
+    shipper = CheckpointShipper(
+        checkpointer, settle_time=args.settle_time, poll_interval=args.poll_interval, use_inotify=not args.no_inotify
+    )
+    if args.once:
+        shipper.ship()
+        return 0
+
+    # the Checkpointer's own handlers would remove the local checkpoint of the other process
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signalNumber, frame: stop.set())
+    signal.signal(signal.SIGINT, lambda signalNumber, frame: stop.set())
+    shipper.run(stop)
+    checkpointer.flush()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,76 @@
+import copy
+import sys
+
+
+class StateSnapshot:
+    '''
+    Snapshot function for the Checkpointer's snapshot_function parameter.
+    Copies the tensors and arrays of a (nested) state into preallocated host buffers, so the
+    training can continue while the checkpoint_function serializes the copy in the background.
+    Buffers are reused between calls as long as the shape and dtype of an entry do not change.
+    Objects with a `state_dict` method (e.g. torch modules and optimizers) are replaced by their state_dict.
+    Other values are deep-copied.
+    '''
+
+    def __init__(self, pin_memory: bool = True) -> None:
+        '''
+        parameters:
+            pin_memory: allocate page-locked buffers for torch tensors if CUDA is available, allowing asynchronous device-to-host copies
+        '''
+        self.pin_memory = pin_memory
+        self._buffers = {}
+        self._used_keys = set()
+        self._needs_synchronize = False
+
+    def __call__(self, state):
+        self._used_keys = set()
+        self._needs_synchronize = False
+        snapshot = self._copy(state, ())
+        if self._needs_synchronize:
+            sys.modules["torch"].cuda.synchronize()
+        # free buffers of entries that vanished from the state
+        for key in set(self._buffers) - self._used_keys:
+            del self._buffers[key]
+        return snapshot
+
+    def _copy(self, value, key):
+        torch = sys.modules.get("torch")
+        numpy = sys.modules.get("numpy")
+        if torch is not None and isinstance(value, torch.Tensor):
+            return self._copy_tensor(torch, value, key)
+        if numpy is not None and isinstance(value, numpy.ndarray):
+            return self._copy_array(numpy, value, key)
+        if hasattr(value, "state_dict") and callable(value.state_dict):
+            return self._copy(value.state_dict(), key)
+        if isinstance(value, dict):
+            # a shallow copy keeps the dict type and attributes like torch's `_metadata`
+            result = copy.copy(value)
+            result.clear()
+            result.update((k, self._copy(v, key + (k,))) for k, v in value.items())
+            return result
+        if isinstance(value, list):
+            return [self._copy(v, key + (i,)) for i, v in enumerate(value)]
+        if type(value) is tuple:
+            return tuple(self._copy(v, key + (i,)) for i, v in enumerate(value))
+        return copy.deepcopy(value)
+
+    def _copy_tensor(self, torch, tensor, key):
+        self._used_keys.add(key)
+        buffer = self._buffers.get(key)
+        if buffer is None or buffer.shape != tensor.shape or buffer.dtype != tensor.dtype:
+            pin_memory = self.pin_memory and torch.cuda.is_available()
+            buffer = torch.empty(tensor.shape, dtype=tensor.dtype, device="cpu", pin_memory=pin_memory)
+            self._buffers[key] = buffer
+        non_blocking = tensor.is_cuda and buffer.is_pinned()
+        buffer.copy_(tensor.detach(), non_blocking=non_blocking)
+        self._needs_synchronize |= non_blocking
+        return buffer
+
+    def _copy_array(self, numpy, array, key):
+        self._used_keys.add(key)
+        buffer = self._buffers.get(key)
+        if buffer is None or buffer.shape != array.shape or buffer.dtype != array.dtype:
+            buffer = numpy.empty_like(array)
+            self._buffers[key] = buffer
+        numpy.copyto(buffer, array)
+        return buffer
@@ -0,0 +1,199 @@
+import json
+import mmap
+import os
+import pickle
+import struct
+import sys
+from collections.abc import Mapping
+from pathlib import Path
+
+MAGIC = b"CKPTTNSR"
+ALIGNMENT = 64
+_PREFIX = struct.Struct("<8sQ")  # magic and length of the JSON header
+
+
+def _align(offset: int) -> int:
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def _flatten(value, key, entries):
+    if hasattr(value, "state_dict") and callable(value.state_dict):
+        value = value.state_dict()
+    if isinstance(value, dict) and value:
+        for k, v in value.items():
+            _flatten(v, key + [k], entries)
+    else:
+        entries.append((key, value))
+    return entries
+
+
+def _raw_buffer(value):
+    '''
+    Returns the kind, dtype, shape and a bytes-like view of the data of a tensor or array, or None for other values.
+    '''
+    torch = sys.modules.get("torch")
+    numpy = sys.modules.get("numpy")
+    if torch is not None and isinstance(value, torch.Tensor):
+        tensor = value.detach().cpu().contiguous()
+        data = tensor.reshape(-1).view(torch.uint8).numpy()
+        return "torch", str(tensor.dtype).replace("torch.", ""), list(tensor.shape), memoryview(data)
+    if numpy is not None and isinstance(value, numpy.ndarray) and value.dtype != object:
+        array = numpy.ascontiguousarray(value)
+        return "numpy", array.dtype.str, list(array.shape), memoryview(array.reshape(-1)).cast("B")
+    return None
+
+
+def _key_to_json(key):
+    # keys of optimizer states are ints, so their type is kept
+    return [[type(k).__name__, k] if isinstance(k, (int, str)) else ["pickle", pickle.dumps(k).hex()] for k in key]
+
+
+def _key_from_json(key):
+    return tuple(pickle.loads(bytes.fromhex(k)) if kind == "pickle" else k for kind, k in key)
+
+
+def _json_round_trips(value) -> bool:
+    '''
+    Returns True if json.loads(json.dumps(value)) equals value with the same types, i.e. for scalars and for lists and
+    str-keyed dicts of them, but not for tuples, dicts with other keys or subclasses such as enums.
+    '''
+    if value is None or type(value) in (str, int, float, bool):
+        return True
+    if type(value) is list:
+        return all(_json_round_trips(item) for item in value)
+    if type(value) is dict:
+        return all(type(k) is str and _json_round_trips(v) for k, v in value.items())
+    return False
+
+
+def save_tensors(path: Path, value) -> None:
+    '''
+    checkpoint_function writing a (nested) dict of tensors and arrays to path.
+    The file starts with a JSON header describing the entries, followed by the raw data of every tensor and array,
+    aligned to 64 bytes, so load_tensors can memory-map them. Other values are stored in the header if they are
+    read back unchanged from JSON, and pickled otherwise, e.g. the tuple of Adam's betas. The file is replaced atomically.
+    '''
+    path = Path(path)
+    entries, buffers = [], []
+    offset = 0
+    for key, entry in _flatten(value, [], []):
+        raw = _raw_buffer(entry)
+        if raw is not None:
+            kind, dtype, shape, data = raw
+            offset = _align(offset)
+            entries.append({"key": _key_to_json(key), "kind": kind, "dtype": dtype, "shape": shape,
+                            "offset": offset, "nbytes": data.nbytes})
+            buffers.append((offset, data))
+            offset += data.nbytes
+            continue
+        if _json_round_trips(entry):
+            entries.append({"key": _key_to_json(key), "kind": "json", "value": entry})
+        else:
+            data = memoryview(pickle.dumps(entry, protocol=pickle.HIGHEST_PROTOCOL))
+            entries.append({"key": _key_to_json(key), "kind": "pickle", "offset": offset, "nbytes": data.nbytes})
+            buffers.append((offset, data))
+            offset += data.nbytes
+    header = json.dumps({"entries": entries}).encode()
+    data_start = _align(_PREFIX.size + len(header))
+
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    try:
+        with open(tmp_path, "wb") as file:
+            file.write(_PREFIX.pack(MAGIC, len(header)))
+            file.write(header)
+            for buffer_offset, data in buffers:
+                file.seek(data_start + buffer_offset)
+                file.write(data)
+            file.truncate(data_start + offset)
+        os.replace(tmp_path, path)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+
+
+class _Entry(dict):
+    '''
+    Header entry of a tensor, array or other value, as opposed to a dict of nested entries.
+    '''
+
+
+class TensorFile(Mapping):
+    '''
+    Read-only mapping of the entries of a file written by save_tensors. Nested dicts are TensorFiles as well.
+    Tensors and arrays are views into a copy-on-write memory map of the file, created on first access,
+    so only the pages of the entries used are read from disk. Modifying them does not change the file.
+    '''
+
+    def __init__(self, buffer, entries: dict, data_start: int) -> None:
+        self._buffer = buffer
+        self._entries = entries  # key to header entry or to dict of nested entries
+        self._data_start = data_start
+        self._loaded = {}
+
+    def __getitem__(self, key):
+        if key not in self._loaded:
+            entry = self._entries[key]
+            if not isinstance(entry, _Entry):
+                self._loaded[key] = TensorFile(self._buffer, entry, self._data_start)
+            else:
+                self._loaded[key] = self._load(entry)
+        return self._loaded[key]
+
+    def __iter__(self):
+        return iter(self._entries)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _load(self, entry):
+        if entry["kind"] == "json":
+            return entry["value"]
+        offset = self._data_start + entry["offset"]
+        if entry["kind"] == "pickle":
+            return pickle.loads(self._buffer[offset:offset + entry["nbytes"]])
+        if entry["kind"] == "numpy":
+            import numpy
+            dtype = numpy.dtype(entry["dtype"])
+            count = entry["nbytes"] // dtype.itemsize
+            return numpy.frombuffer(self._buffer, dtype, count, offset).reshape(entry["shape"])
+        import torch
+        dtype = getattr(torch, entry["dtype"])
+        if entry["nbytes"] == 0:
+            return torch.empty(entry["shape"], dtype=dtype)
+        count = entry["nbytes"] // torch.empty((), dtype=dtype).element_size()
+        return torch.frombuffer(self._buffer, dtype=dtype, count=count, offset=offset).reshape(entry["shape"])
+
+    def to_dict(self) -> dict:
+        '''
+        Returns the content as nested dicts, loading all entries.
+        '''
+        return {key: value.to_dict() if isinstance(value, TensorFile) else value for key, value in self.items()}
+
+
+def load_tensors(path):
+    '''
+    restore_function for files written by save_tensors. Returns a TensorFile loading the entries lazily.
+    path can also be a binary file object, e.g. from restore_mode "direct" in xrootd mode, which is read completely.
+    '''
+    if isinstance(path, (str, Path)):
+        with open(path, "rb") as file:
+            # copy-on-write, so the returned tensors are writable; the mapping stays valid after closing the file
+            buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_COPY)
+    else:
+        buffer = bytearray(path.read())
+    magic, header_length = _PREFIX.unpack_from(buffer, 0)
+    assert magic == MAGIC, f"{path} is not a file written by save_tensors"
+    header = json.loads(bytes(buffer[_PREFIX.size:_PREFIX.size + header_length]))
+    data_start = _align(_PREFIX.size + header_length)
+
+    root = {}
+    for entry in header["entries"]:
+        entry = _Entry(entry)
+        key = _key_from_json(entry["key"])
+        if not key:  # the value itself is not a dict
+            return TensorFile(buffer, {None: entry}, data_start)[None]
+        node = root
+        for k in key[:-1]:
+            node = node.setdefault(k, {})
+        node[key[-1]] = entry
+    return TensorFile(buffer, root, data_start)
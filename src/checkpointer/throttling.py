@@ -0,0 +1,158 @@
+import errno
+import fcntl
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable
+from .backends import remote_with_suffix
+
+# bytes a throttled upload sends at once, before waiting for the bandwidth of the next piece
+THROTTLE_CHUNK_SIZE = 2**20
+
+
+def put_throttled(backend, local_file: Path, remote_file, consume: Callable) -> None:
+    '''
+    Uploads local_file with a backend supporting ranged_put and move in pieces of THROTTLE_CHUNK_SIZE bytes,
+    calling consume with the size of each piece before it is sent. The file is written under a temporary name
+    and moved into place once complete.
+    '''
+    tmp_file = remote_with_suffix(remote_file, f".{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        writer = backend.open_range_writer(tmp_file)
+        try:
+            with open(local_file, "rb") as file:
+                offset = 0
+                for piece in iter(lambda: file.read(THROTTLE_CHUNK_SIZE), b""):
+                    consume(len(piece))
+                    writer.write(offset, piece)
+                    offset += len(piece)
+        finally:
+            writer.close()
+        backend.move(tmp_file, remote_file)
+    except BaseException:
+        if backend.supports("delete"):
+            backend.delete(tmp_file)
+        raise
+
+
+class TransferThrottle:
+    '''
+    Shapes the load the transfers of many jobs put on a shared storage, for the Checkpointer's transfer_throttle parameter.
+    - jitter: every transfer starts after a random delay of up to jitter seconds, so jobs started or evicted together
+      do not transfer at the same moment.
+    - bandwidth: the uploads of this job are limited to bandwidth bytes per second on average (token bucket).
+      Uploads are sent in pieces of THROTTLE_CHUNK_SIZE bytes, each waiting for its share of the bandwidth, if the
+      backend supports ranged writes (shared, local and xrootd mode). Otherwise the limit applies per file.
+    - slot_dir and max_concurrent: at most max_concurrent jobs sharing slot_dir, a directory on a shared file system,
+      transfer at once. A job holds one of max_concurrent slot files locked with flock during its transfer. Locks are released
+      by the operating system if a job dies, so crashed jobs never leave slots occupied.
+    Once a deadline is set, e.g. by on_SIGTERM, waiting for a slot or for the bandwidth never exceeds it.
+    '''
+
+    def __init__(
+        self,
+        bandwidth: float = None,  # average upload bandwidth in bytes per second, unlimited if None
+        slot_dir: Path = None,  # shared directory holding the slot files
+        max_concurrent: int = None,  # number of jobs sharing slot_dir that may transfer at once
+        jitter: float = 0.0,  # maximum random delay before every transfer in seconds
+        burst: float = 1.0,  # seconds of bandwidth that can be sent without waiting after a pause
+        poll_interval: float = 1.0,  # average seconds between attempts to get a slot
+        slot_timeout: float = None,  # seconds after which a transfer proceeds without slot, waits forever if None
+    ) -> None:
+        '''
+        parameters:
+            bandwidth: average upload bandwidth of this job in bytes per second, unlimited if None
+            slot_dir: directory on a shared file system, supporting flock, holding the slot files
+            max_concurrent: number of jobs sharing slot_dir that may transfer at once
+            jitter: maximum random delay before every transfer in seconds
+            burst: seconds of bandwidth that can be sent without waiting after a pause
+            poll_interval: average seconds between attempts to get a slot, randomized to avoid jobs polling in lockstep
+            slot_timeout: seconds after which a transfer proceeds without slot, waits forever if None
+        '''
+        assert (slot_dir is None) == (max_concurrent is None), "slot_dir and max_concurrent must be set together"
+        assert max_concurrent is None or max_concurrent >= 1, "max_concurrent must be at least 1"
+        assert bandwidth is None or bandwidth > 0, "bandwidth must be positive"
+        self.bandwidth = bandwidth
+        self.slot_dir = Path(slot_dir) if slot_dir is not None else None
+        self.max_concurrent = max_concurrent
+        self.jitter = jitter
+        self.burst = burst
+        self.poll_interval = poll_interval
+        self.slot_timeout = slot_timeout
+        self.deadline = None  # time.monotonic() after which nothing is delayed anymore
+        self._lock = threading.Lock()
+        self._tokens = bandwidth * burst if bandwidth is not None else 0.0
+        self._last_refill = time.monotonic()
+        self.waited = 0.0  # seconds spent waiting in total
+
+    def _sleep(self, seconds: float) -> None:
+        if self.deadline is not None:
+            seconds = min(seconds, max(0.0, self.deadline - time.monotonic()))
+        if seconds > 0:
+            time.sleep(seconds)
+            # several transfer workers wait at once
+            with self._lock:
+                self.waited += seconds
+
+    def consume(self, nbytes: int) -> None:
+        '''
+        Waits until nbytes may be uploaded without exceeding the bandwidth on average.
+        '''
+        if self.bandwidth is None:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.bandwidth * self.burst, self._tokens + (now - self._last_refill) * self.bandwidth)
+            self._last_refill = now
+            self._tokens -= nbytes
+            wait = -self._tokens / self.bandwidth if self._tokens < 0 else 0.0
+        self._sleep(wait)
+
+    def _try_slot(self):
+        for index in random.sample(range(self.max_concurrent), self.max_concurrent):
+            fd = os.open(self.slot_dir / f"slot-{index:04d}.lock", os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return fd
+            except OSError as e:
+                os.close(fd)
+                if e.errno not in (errno.EAGAIN, errno.EACCES):
+                    raise
+        return None
+
+    def _acquire_slot(self):
+        self.slot_dir.mkdir(parents=True, exist_ok=True)
+        timeout = None if self.slot_timeout is None else time.monotonic() + self.slot_timeout
+        while True:
+            fd = self._try_slot()
+            if fd is not None:
+                return fd
+            now = time.monotonic()
+            if any(limit is not None and now >= limit for limit in (timeout, self.deadline)):
+                print("Checkpointer: no transfer slot free in time, transferring without one.")
+                return None
+            delay = self.poll_interval * random.uniform(0.5, 1.5)
+            if timeout is not None:
+                delay = min(delay, timeout - now)
+            self._sleep(delay)
+
+    @contextmanager
+    def transfer_slot(self):
+        '''
+        Context manager around a transfer: waits for the jitter delay and a free slot, and releases the slot afterwards.
+        With a deadline, the jitter delay is at most a quarter of the remaining time.
+        '''
+        delay = random.uniform(0, self.jitter) if self.jitter else 0.0
+        if self.deadline is not None:
+            delay = min(delay, max(0.0, self.deadline - time.monotonic()) / 4)
+        self._sleep(delay)
+        fd = self._acquire_slot() if self.slot_dir is not None else None
+        try:
+            yield
+        finally:
+            if fd is not None:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+                os.close(fd)
@@ -0,0 +1,278 @@
+import json
+import posixpath
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import List
+from .backends import RemoteStat, TransferBackend, create_backend, register_backend, remote_parent, remote_with_suffix
+
+# written next to every file on every tier, after the file itself
+GENERATION_SUFFIX = ".generation"
+# attempts of a background copy before it is given up, and the delay before the first retry, doubled for every further one
+COPY_ATTEMPTS = 5
+RETRY_DELAY = 1.0
+MAX_RETRY_DELAY = 60.0
+
+
+class StorageTier:
+    '''
+    One tier of a TieredBackend: a transfer mode, the directory of the tier the checkpoint paths are relative to,
+    and whether a copy on this tier survives the job being moved elsewhere.
+    '''
+
+    def __init__(
+        self,
+        mode: str,  # transfer mode of the tier, e.g. shared, local or xrootd
+        root: str,  # directory on the tier holding the checkpoints, a Path in shared mode
+        durable: bool = True,  # False for storage lost with the node, e.g. a node-local SSD
+        backend_kwargs: dict = None,  # kwargs to create the backend with, e.g. {"server_name": ...} in xrootd mode
+    ) -> None:
+        self.mode = mode
+        self.root = root
+        self.durable = durable
+        self.backend = create_backend(mode, **(backend_kwargs or {}))
+
+    def path(self, remote):
+        '''
+        Returns the path of the logical remote path on this tier.
+        '''
+        relative = str(remote).lstrip("/")
+        if isinstance(self.root, Path):
+            return self.root / relative
+        return posixpath.join(self.root, relative)
+
+    def __repr__(self) -> str:
+        return f"StorageTier({self.mode}, {self.root})"
+
+
+@register_backend("tiered")
+class TieredBackend(TransferBackend):
+    '''
+    Backend writing every file to a list of tiers, ordered from fastest to slowest, e.g. node-local SSD,
+    site-shared file system and remote xrootd storage. A put returns once the file is on all tiers up to the
+    first durable one; the slower tiers are filled from the fastest tier in a background thread.
+    The slower tiers are filled in the order of the puts, so a multi-file checkpoint's index arrives after its files.
+    If a file is put again before its background copy started, only the newest version is copied, in the order of its last put.
+
+    Every copy is accompanied by a record of its generation, which increases with every put, and a copy without
+    a record counts as incomplete on tiers holding records. A get probes the tiers
+    and fetches the newest complete copy, from the fastest tier holding it, so a job moved to another node or site
+    restores from the slower tiers and a job returning to its node does not restore a stale local copy.
+    Remote paths are logical paths like "/run/checkpoint.pt", resolved relative to the root of each tier.
+    A failed background copy is retried with increasing delays, holding back the later copies to keep their order,
+    up to COPY_ATTEMPTS times. flush() waits for the background copies, and reports copies given up.
+    '''
+    capabilities = frozenset(["stat", "put", "get", "delete"])
+
+    def __init__(self, tiers: List) -> None:
+        '''
+        parameters:
+            tiers: StorageTiers or dicts of their parameters, from fastest to slowest.
+                Writes are synchronous up to the first durable tier, and to all tiers if none is durable.
+        '''
+        assert tiers, "tiers must not be empty"
+        self.tiers = [tier if isinstance(tier, StorageTier) else StorageTier(**tier) for tier in tiers]
+        assert all(tier.backend.supports("stat", "put", "get") for tier in self.tiers), \
+            "every tier needs a backend supporting stat, put and get"
+        durable = [index for index, tier in enumerate(self.tiers) if tier.durable]
+        synchronous = durable[0] + 1 if durable else len(self.tiers)
+        self.sync_tiers = self.tiers[:synchronous]
+        self.background_tiers = self.tiers[synchronous:]
+        self._generation = 0
+        self._generation_lock = threading.Lock()
+        self._condition = threading.Condition()
+        self._pending = OrderedDict()  # (tier index, remote) -> ("put", generation) or ("delete", None)
+        self._recorded_tiers = set()  # tiers this backend wrote generation records to
+        self._busy = False
+        self._retry_at = 0.0  # time.monotonic() before which a failed copy is not retried
+        self._attempts = {}  # (tier index, remote) -> failed attempts of the pending operation
+        self.failed_copies = {}  # (tier index, remote) -> exception of the last attempt of a copy given up
+        self.failures = 0  # attempts of background copies that failed
+        self._thread = None
+        if self.background_tiers:
+            self._thread = threading.Thread(target=self._run, name="checkpointer-tiers", daemon=True)
+            self._thread.start()
+
+    def _next_generation(self) -> int:
+        with self._generation_lock:
+            self._generation = max(self._generation + 1, time.time_ns())
+            return self._generation
+
+    def _read_generation(self, tier: StorageTier, remote):
+        '''
+        Returns the generation of the copy of remote on tier, or None if there is no complete copy.
+        '''
+        path = tier.path(remote)
+        stat = tier.backend.stat(path)
+        if stat is None:
+            return None
+        record_path = remote_with_suffix(path, GENERATION_SUFFIX)
+        if tier.backend.stat(record_path) is None:
+            if self._has_records(tier, remote):
+                return None  # a TieredBackend is writing the file, or was interrupted before its record
+            return -1  # written without TieredBackend, older than every generation
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            local_record = Path(tmp_dir) / "generation"
+            try:
+                tier.backend.get(record_path, local_record)
+                record = json.loads(local_record.read_text())
+            except (OSError, ValueError):
+                return None
+        if record.get("size") != stat.size:
+            return None  # the file was replaced after the record, or is incomplete
+        return record["generation"]
+
+    def _has_records(self, tier: StorageTier, remote) -> bool:
+        '''
+        Returns True if tier holds generation records, i.e. if the files next to remote are written by a TieredBackend.
+        '''
+        if tier in self._recorded_tiers:
+            return True
+        if not tier.backend.supports("list"):
+            return False
+        try:
+            names = tier.backend.list(remote_parent(tier.path(remote)))
+        except OSError:  # e.g. the directory does not exist
+            return False
+        return any(name.endswith(GENERATION_SUFFIX) for name in names)
+
+    def _write(self, tier: StorageTier, local: Path, remote, generation: int) -> None:
+        self._recorded_tiers.add(tier)
+        path = tier.path(remote)
+        tier.backend.make_dir(remote_parent(path))
+        record_path = remote_with_suffix(path, GENERATION_SUFFIX)
+        if tier.backend.supports("delete"):
+            # a crash between file and record leaves the file without a record, never with the old one
+            tier.backend.delete(record_path)
+        tier.backend.put(local, path)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            local_record = Path(tmp_dir) / "generation"
+            local_record.write_text(json.dumps({"generation": generation, "size": Path(local).stat().st_size}))
+            tier.backend.put(local_record, record_path)
+
+    def _newest(self, remote):
+        '''
+        Returns the fastest tier holding the newest complete copy of remote, or None if no tier holds one.
+        '''
+        best, best_generation = None, None
+        for tier in self.tiers:
+            generation = self._read_generation(tier, remote)
+            if generation is not None and (best_generation is None or generation > best_generation):
+                best, best_generation = tier, generation
+        return best
+
+    def stat(self, remote):
+        tier = self._newest(remote)
+        if tier is None:
+            return None
+        stat = tier.backend.stat(tier.path(remote))
+        return RemoteStat(stat.size, stat.mtime) if stat is not None else None
+
+    def put(self, local, remote):
+        generation = self._next_generation()
+        for tier in self.sync_tiers:
+            self._write(tier, local, remote, generation)
+        self._schedule(remote, ("put", generation))
+
+    def get(self, remote, local):
+        tier = self._newest(remote)
+        if tier is None:
+            raise FileNotFoundError(f"{remote} does not exist on any tier")
+        tier.backend.get(tier.path(remote), local)
+
+    def delete(self, remote):
+        for tier in self.sync_tiers:
+            self._delete(tier, remote)
+        self._schedule(remote, ("delete", None))
+
+    def _delete(self, tier: StorageTier, remote) -> None:
+        if not tier.backend.supports("delete"):
+            return
+        path = tier.path(remote)
+        tier.backend.delete(remote_with_suffix(path, GENERATION_SUFFIX))
+        tier.backend.delete(path)
+
+    def _schedule(self, remote, operation) -> None:
+        if not self.background_tiers:
+            return
+        with self._condition:
+            for index in range(len(self.background_tiers)):
+                key = (index, remote)
+                # only the newest operation on a file is carried out, in the order of the puts, so the slower tiers
+                # are filled in checkpoint order and an index is copied after the files it lists
+                self._pending.pop(key, None)
+                self._pending[key] = operation
+                self._attempts.pop(key, None)
+            self._condition.notify_all()
+
+    def flush(self, timeout: float = None) -> bool:
+        '''
+        Blocks until the background tiers are filled. Returns False if the timeout expired first,
+        or if a copy was given up and not replaced by a successful copy or delete of the same file since.
+        '''
+        with self._condition:
+            if not self._condition.wait_for(lambda: not self._pending and not self._busy, timeout):
+                return False
+            return not self.failed_copies
+
+    def _copy(self, tier: StorageTier, remote, generation: int) -> None:
+        # the fastest synchronous tier is the source, unless it already holds a newer version
+        source = self.sync_tiers[0]
+        if self._read_generation(source, remote) != generation:
+            return
+        source_path = source.path(remote)
+        if source.backend.supports("direct_read"):
+            self._write(tier, source.backend.direct_path(source_path), remote, generation)
+            return
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            local = Path(tmp_dir) / Path(str(remote)).name
+            source.backend.get(source_path, local)
+            self._write(tier, local, remote, generation)
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                while not self._pending or time.monotonic() < self._retry_at:
+                    self._condition.wait(self._retry_at - time.monotonic() if self._pending else None)
+                key, operation = self._pending.popitem(last=False)
+                self._busy = True
+            index, remote = key
+            action, generation = operation
+            tier = self.background_tiers[index]
+            try:
+                if action == "put":
+                    self._copy(tier, remote, generation)
+                else:
+                    self._delete(tier, remote)
+            except Exception as e:
+                self.failures += 1
+                attempts = self._retry(key, operation, e)
+                print(f"Checkpointer: copying {remote} to {tier} failed (attempt {attempts} of {COPY_ATTEMPTS}): {e}")
+            else:
+                with self._condition:
+                    self._attempts.pop(key, None)
+                    self.failed_copies.pop(key, None)
+            finally:
+                with self._condition:
+                    self._busy = False
+                    self._condition.notify_all()
+
+    def _retry(self, key, operation, error: Exception) -> int:
+        '''
+        Queues a failed operation again, ahead of the others, unless a newer one was scheduled for the same file
+        or it failed COPY_ATTEMPTS times. Returns the number of failed attempts.
+        '''
+        with self._condition:
+            attempts = self._attempts.pop(key, 0) + 1
+            if key in self._pending:
+                return attempts
+            if attempts >= COPY_ATTEMPTS:
+                self.failed_copies[key] = error
+                return attempts
+            self._attempts[key] = attempts
+            self._pending[key] = operation
+            self._pending.move_to_end(key, last=False)
+            self._retry_at = time.monotonic() + min(RETRY_DELAY * 2 ** (attempts - 1), MAX_RETRY_DELAY)
+            return attempts
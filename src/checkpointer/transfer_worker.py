@@ -0,0 +1,112 @@
+import threading
+
+
+class TransferWorker:
+    '''
+    Background thread that runs checkpoint transfers off the training thread.
+    Only the latest submitted job is kept: a job that is still pending when a newer one
+    is submitted is dropped, so the most recent checkpoint always wins.
+    The exception of a failed job is kept until raise_error() reports it.
+    '''
+
+    def __init__(self, name: str = "checkpointer-transfer", description: str = "transfer") -> None:
+        '''
+        parameters:
+            name: name of the thread
+            description: what the jobs do, used in the message about a failed job
+        '''
+        self._condition = threading.Condition()
+        self._pending = None
+        self._busy = False
+        self._closed = False
+        self.description = description
+        self.dropped = 0  # number of pending jobs replaced by newer ones
+        self.last_error = None  # last exception raised by a job
+        self._unreported_error = None  # exception of a failed job not raised by raise_error() yet
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, job) -> None:
+        '''
+        Schedules job (a callable without arguments) to run in the background.
+        A job that has not started yet is replaced.
+        '''
+        with self._condition:
+            assert not self._closed, "TransferWorker is closed"
+            if self._pending is not None:
+                self.dropped += 1
+            self._pending = job
+            self._condition.notify_all()
+
+    def discard_pending(self) -> bool:
+        '''
+        Drops the pending job, if any. A job that is already running is not affected.
+        Returns True if a job was dropped.
+        '''
+        with self._condition:
+            discarded = self._pending is not None
+            if discarded:
+                self.dropped += 1
+            self._pending = None
+            self._condition.notify_all()
+            return discarded
+
+    @property
+    def failed(self) -> bool:
+        '''
+        True if a job failed since the last call of raise_error().
+        '''
+        with self._condition:
+            return self._unreported_error is not None
+
+    def raise_error(self) -> None:
+        '''
+        Raises the exception of a job that failed since the last call, if any.
+        '''
+        with self._condition:
+            error, self._unreported_error = self._unreported_error, None
+        if error is not None:
+            raise error
+
+    @property
+    def idle(self) -> bool:
+        with self._condition:
+            return self._pending is None and not self._busy
+
+    def wait(self, timeout: float = None) -> bool:
+        '''
+        Blocks until no job is pending or running. Returns False if the timeout expired first.
+        '''
+        with self._condition:
+            return self._condition.wait_for(
+                lambda: self._pending is None and not self._busy, timeout
+            )
+
+    def close(self, timeout: float = None) -> None:
+        '''
+        Waits for outstanding jobs and stops the background thread.
+        '''
+        self.wait(timeout)
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join(timeout)
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._pending is not None or self._closed)
+                if self._pending is None:
+                    return
+                job, self._pending = self._pending, None
+                self._busy = True
+            try:
+                job()
+            except Exception as e:
+                with self._condition:
+                    self.last_error = self._unreported_error = e
+                print(f"Checkpointer: background {self.description} failed: {e}")
+            finally:
+                with self._condition:
+                    self._busy = False
+                    self._condition.notify_all()
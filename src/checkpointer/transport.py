@@ -0,0 +1,94 @@
+import errno
+import os
+import shutil
+from pathlib import Path
+
+# ioctl request to clone a whole file on btrfs and XFS (and others supporting reflinks)
+FICLONE = 0x40049409
+BUFFER_SIZE = 16 * 2**20
+
+# errors that mean a copy path is not supported for the given files, so the next one should be tried
+_UNSUPPORTED = {errno.EXDEV, errno.EINVAL, errno.ENOSYS, errno.EOPNOTSUPP, errno.ENOTTY, errno.EBADF, errno.EPERM}
+
+
+def _reflink(source_fd, target_fd, size):
+    import fcntl
+    fcntl.ioctl(target_fd, FICLONE, source_fd)
+    return os.fstat(target_fd).st_size
+
+
+def _copy_file_range(source_fd, target_fd, size):
+    copied = 0
+    while copied < size:
+        count = os.copy_file_range(source_fd, target_fd, size - copied)
+        if count == 0:
+            break
+        copied += count
+    return copied
+
+
+def _sendfile(source_fd, target_fd, size):
+    copied = 0
+    while copied < size:
+        count = os.sendfile(target_fd, source_fd, copied, size - copied)
+        if count == 0:
+            break
+        copied += count
+    return copied
+
+
+def _buffered(source_fd, target_fd, size):
+    buffer = bytearray(min(BUFFER_SIZE, max(size, 1)))
+    view = memoryview(buffer)
+    with open(source_fd, "rb", buffering=0, closefd=False) as source:
+        while True:
+            count = source.readinto(buffer)
+            if not count:
+                break
+            written = 0
+            while written < count:
+                written += os.write(target_fd, view[written:count])
+
+
+_METHODS = [("reflink", _reflink), ("copy_file_range", _copy_file_range), ("sendfile", _sendfile)]
+
+
+def copy_file(source, target) -> str:
+    '''
+    Copies the file source to target (or into target, if it is a directory) with the fastest path available:
+    a reflink clone sharing the data blocks (btrfs, XFS), an in-kernel copy with copy_file_range or sendfile,
+    or a large-buffer copy in user space. A path copying less than the whole file is abandoned for the next one.
+    The permission bits are copied as well. Raises shutil.SameFileError if source and target are the same file.
+    Returns the name of the path used: "reflink", "copy_file_range", "sendfile" or "buffered".
+    '''
+    source, target = Path(source), Path(target)
+    if target.is_dir():
+        target = target / source.name
+    # opening the target would truncate the source
+    if target.exists() and os.path.samefile(source, target):
+        raise shutil.SameFileError(f"{source} and {target} are the same file")
+    size = source.stat().st_size
+    with open(source, "rb") as source_file, open(target, "wb") as target_file:
+        source_fd, target_fd = source_file.fileno(), target_file.fileno()
+        for name, method in _METHODS:
+            if name == "copy_file_range" and not hasattr(os, "copy_file_range"):
+                continue
+            if name == "sendfile" and not hasattr(os, "sendfile"):
+                continue
+            try:
+                copied = method(source_fd, target_fd, size)
+            except (OSError, ImportError) as e:
+                if isinstance(e, OSError) and e.errno not in _UNSUPPORTED:
+                    raise
+                copied = None
+            if copied == size:
+                break
+            # not supported, or stopped short (e.g. on file systems reporting no data), restart with the next path
+            os.lseek(source_fd, 0, os.SEEK_SET)
+            os.lseek(target_fd, 0, os.SEEK_SET)
+            os.ftruncate(target_fd, 0)
+        else:
+            name = "buffered"
+            _buffered(source_fd, target_fd, size)
+    shutil.copymode(source, target)
+    return name
@@ -0,0 +1,56 @@
+import io
+import tarfile
+import tempfile
+import unittest
+from pathlib import Path
+from checkpointer.archiving import make_archive, extract_archive
+
+
+class TestArchiving(unittest.TestCase):
+    def test_roundtrip(self):
+        for codec in ["gz", "none"]:
+            with self.subTest(codec=codec), tempfile.TemporaryDirectory() as tmp_dir:
+                backup_dir = Path(tmp_dir) / "backup"
+                (backup_dir / "variables").mkdir(parents=True)
+                (backup_dir / "variables" / "weights.bin").write_bytes(bytes(range(256)) * 100)
+                (backup_dir / "training_metadata.json").write_text('{"epoch": 3}')
+                archive = backup_dir / "checkpoint.zip"
+                make_archive(archive, backup_dir, codec=codec)
+                # the archive itself is not archived on the next checkpoint
+                make_archive(archive, backup_dir, codec=codec)
+
+                extract_dir = Path(tmp_dir) / "restored"
+                extract_archive(archive, extract_dir)
+                restored = sorted(p.relative_to(extract_dir).as_posix() for p in extract_dir.rglob("*"))
+                self.assertEqual(restored, [
+                    "backup",
+                    "backup/training_metadata.json",
+                    "backup/variables",
+                    "backup/variables/weights.bin",
+                ])
+                self.assertEqual(
+                    (extract_dir / "backup" / "variables" / "weights.bin").read_bytes(),
+                    bytes(range(256)) * 100,
+                )
+
+    def test_compresslevel_zero(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            backup_dir = Path(tmp_dir) / "backup"
+            backup_dir.mkdir()
+            (backup_dir / "weights.bin").write_bytes(bytes(256) * 400)
+            make_archive(Path(tmp_dir) / "stored.tar.gz", backup_dir, codec="gz", compresslevel=0)
+            make_archive(Path(tmp_dir) / "default.tar.gz", backup_dir, codec="gz")
+            # level 0 stores the data without compressing it
+            self.assertGreater((Path(tmp_dir) / "stored.tar.gz").stat().st_size, 100 * 1024)
+            self.assertLess((Path(tmp_dir) / "default.tar.gz").stat().st_size, 10 * 1024)
+
+    def test_members_outside_of_extract_folder(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            archive = Path(tmp_dir) / "evil.tar"
+            with tarfile.open(archive, "w") as tar:
+                member = tarfile.TarInfo("../evil.txt")
+                member.size = 4
+                tar.addfile(member, io.BytesIO(b"evil"))
+            with self.assertRaises(tarfile.TarError):
+                extract_archive(archive, Path(tmp_dir) / "restored")
+            self.assertFalse((Path(tmp_dir) / "evil.txt").exists())
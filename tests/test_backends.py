@@ -0,0 +1,151 @@
+import io
+import shutil
+import sys
+import tempfile
+import types
+import unittest
+from pathlib import Path
+from unittest import mock
+from checkpointer import backends
+from checkpointer.backends import (
+    XROOTD_NOT_FOUND, LocalDirectoryBackend, RangeReaderStream, available_backends, create_backend, get_session,
+    register_backend
+)
+from checkpointer.checkpointer import Checkpointer
+
+
+class TestBackends(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.tmp = Path(self.tmp_dir.name)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+        with backends._registry_lock:
+            backends._backends.pop("test-backend", None)
+
+    def test_local_backend(self):
+        backend = create_backend("local", root=self.tmp / "storage")
+        local_file = self.tmp / "checkpoint.txt"
+        local_file.write_text("0123456789")
+        self.assertFalse(backend.exists("/store/checkpoint.txt"))
+        backend.put(local_file, "/store/checkpoint.txt")
+        self.assertEqual(backend.stat("/store/checkpoint.txt").size, 10)
+        self.assertEqual(backend.get_range("/store/checkpoint.txt", 2, 3), b"234")
+        self.assertEqual(backend.list("/store"), ["checkpoint.txt"])
+        backend.delete("/store/checkpoint.txt")
+        self.assertFalse(backend.exists("/store/checkpoint.txt"))
+
+    def test_checkpointer_in_local_mode(self):
+        checkpointer = Checkpointer(
+            local_checkpoint_file=self.tmp / "checkpoint.txt",
+            restore_function=lambda path: int(path.read_text()),
+            checkpoint_function=lambda path, value: path.write_text(str(value)),
+            checkpoint_transfer_mode="local",
+            checkpoint_transfer_target="/store/checkpoint.txt",
+            checkpoint_transfer_backend_kwargs={"root": self.tmp / "storage"},
+        )
+        self.assertFalse(checkpointer.checkpoint_exists)
+        checkpointer.step(42)
+        checkpointer.local_checkpoint_file.unlink()
+        self.assertTrue(checkpointer.checkpoint_exists)
+        self.assertEqual(checkpointer.restore(0), 42)
+
+    def test_register_backend(self):
+        @register_backend("test-backend")
+        class TestBackend(LocalDirectoryBackend):
+            pass
+
+        self.assertIn("test-backend", available_backends())
+        self.assertIsInstance(create_backend("test-backend", root=self.tmp), TestBackend)
+
+    def test_sessions_are_shared(self):
+        first = get_session(("test", "server"), object)
+        self.assertIs(get_session(("test", "server"), object), first)
+
+    def test_xrootd_errors(self):
+        def status(errno=0, message=""):
+            return types.SimpleNamespace(ok=errno == 0, errno=errno, message=message), None
+
+        file_system = mock.Mock()
+        client = types.SimpleNamespace(FileSystem=lambda server_name: file_system)
+        flags = types.SimpleNamespace(MkDirFlags=None, OpenFlags=None)
+        xrootd = types.SimpleNamespace(client=client)
+        modules = {"XRootD": xrootd, "XRootD.client": client, "XRootD.client.flags": flags}
+        with mock.patch.dict(sys.modules, modules):
+            backend = create_backend("xrootd", server_name="root://test-errors.example//")
+        file_system.copy.return_value = status(3005, "no space left")
+        with self.assertRaises(OSError):
+            backend.put(self.tmp / "checkpoint.txt", "/store/checkpoint.txt")
+        with self.assertRaises(OSError):
+            backend.get("/store/checkpoint.txt", self.tmp / "checkpoint.txt")
+        file_system.rm.return_value = status(XROOTD_NOT_FOUND, "no such file")
+        backend.delete("/store/checkpoint.txt")
+        file_system.rm.return_value = status(3010, "permission denied")
+        with self.assertRaises(OSError):
+            backend.delete("/store/checkpoint.txt")
+        file_system.copy.return_value = status()
+        backend.put(self.tmp / "checkpoint.txt", "/store/checkpoint.txt")
+        file_system.rm.reset_mock()
+        file_system.mv.return_value = status(3006, "file exists")
+        with self.assertRaises(OSError):
+            backend.move("/store/checkpoint.txt.tmp", "/store/checkpoint.txt")
+        # the target is replaced by the rename, never removed first
+        file_system.mv.return_value = status()
+        backend.move("/store/checkpoint.txt.tmp", "/store/checkpoint.txt")
+        file_system.rm.assert_not_called()
+        file_system.dirlist.return_value = status(3011, "no such directory")
+        with self.assertRaises(OSError):
+            backend.list("/store")
+
+
+class TestDirectRestore(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.tmp = Path(self.tmp_dir.name)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_direct_path(self):
+        target = self.tmp / "target.txt"
+        checkpointer = Checkpointer(
+            local_checkpoint_file=self.tmp / "checkpoint.txt",
+            restore_function=lambda path: (path, int(path.read_text())),
+            checkpoint_function=lambda path, value: path.write_text(str(value)),
+            checkpoint_transfer_mode="shared",
+            checkpoint_transfer_target=target,
+            restore_mode="direct",
+        )
+        self.assertEqual(checkpointer.restore(None), None)
+        checkpointer.step(5)
+        checkpointer.clean_up_local_checkpoint_files()
+        self.assertEqual(checkpointer.restore(None), (target, 5))
+        self.assertFalse(checkpointer.local_checkpoint_file.exists())
+
+    def test_direct_restore_falls_back_to_copy(self):
+        target = self.tmp / "target.txt"
+        checkpointer = Checkpointer(
+            local_checkpoint_file=self.tmp / "checkpoint.txt",
+            restore_function=lambda path: (path, int(path.read_text())),
+            checkpoint_function=lambda path, value: path.write_text(str(value)),
+            checkpoint_transfer_mode="manual",
+            checkpoint_transfer_target=str(target),
+            checkpoint_transfer_callback=shutil.copyfile,
+            checkpoint_transfer_callback_kwargs={},
+            restore_mode="direct",
+        )
+        checkpointer.step(5)
+        # the manual backend can neither read the target directly nor stat it, the local copy is restored
+        self.assertEqual(checkpointer.restore(None), (checkpointer.local_checkpoint_file, 5))
+
+    def test_stream(self):
+        backend = create_backend("local", root=self.tmp)
+        (self.tmp / "checkpoint.bin").write_bytes(bytes(range(200)))
+        size = backend.stat("/checkpoint.bin").size
+        stream = io.BufferedReader(RangeReaderStream(backend.open_range_reader("/checkpoint.bin"), size), 16)
+        with stream:
+            stream.seek(100)
+            self.assertEqual(stream.read(3), bytes([100, 101, 102]))
+            stream.seek(-2, io.SEEK_END)
+            self.assertEqual(stream.read(), bytes([198, 199]))
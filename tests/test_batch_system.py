@@ -0,0 +1,71 @@
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+from checkpointer.batch_system import HTCondor, JobAd, Slurm, detect_batch_system
+from checkpointer.checkpointer import Checkpointer
+from checkpointer.checkpointing_utils import get_condor_job_ad_settings
+
+JOB_AD = '''ClusterId = 1234
+TransferCheckpoint = "/checkpoints/job=1234"
+SuccessCheckpointExitCode = 85
+JobMaxVacateTime = 600
+MaxRuntime = 3600
+JobCurrentStartDate = 1700000000
+WantCheckpoint = true
+Requirements = (TARGET.Arch == "X86_64") && (TARGET.Memory >= 1024)
+'''
+
+
+class TestBatchSystem(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.job_ad_path = Path(self.tmp_dir.name) / ".job.ad"
+        self.job_ad_path.write_text(JOB_AD)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_job_ad(self):
+        job_ad = JobAd(self.job_ad_path)
+        self.assertEqual(job_ad["ClusterId"], 1234)
+        self.assertEqual(job_ad["TransferCheckpoint"], "/checkpoints/job=1234")
+        self.assertIs(job_ad["WantCheckpoint"], True)
+        self.assertEqual(job_ad["Requirements"], '(TARGET.Arch == "X86_64") && (TARGET.Memory >= 1024)')
+        # reloaded once the file changes
+        self.job_ad_path.write_text(JOB_AD + "CheckpointExitCode = 86\n")
+        os.utime(self.job_ad_path, ns=(0, 10**9))
+        self.assertEqual(HTCondor(job_ad).checkpoint_exit_code, 86)
+
+    def test_htcondor(self):
+        batch_system = HTCondor(JobAd(self.job_ad_path))
+        self.assertEqual(batch_system.checkpoint_exit_code, 85)
+        self.assertEqual(batch_system.grace_time, 600)
+        self.assertEqual(batch_system.retirement_time, 1700003600)
+        # attributes of the slot or about retiring from it are no limits of the job
+        batch_system = HTCondor({"MachineMaxVacateTime": 600, "MaxJobRetirementTime": 3600, "JobCurrentStartDate": 1})
+        self.assertIsNone(batch_system.grace_time)
+        self.assertIsNone(batch_system.runtime_limit)
+        self.assertIsNone(batch_system.retirement_time)
+
+    def test_checkpointer_in_htcondor_mode(self):
+        with mock.patch.dict(os.environ, {"_CONDOR_JOB_AD": str(self.job_ad_path)}):
+            self.assertIsInstance(detect_batch_system(), HTCondor)
+            self.assertEqual(get_condor_job_ad_settings("TransferCheckpoint"), '"/checkpoints/job=1234"')
+            checkpointer = Checkpointer(
+                local_checkpoint_file=Path(self.tmp_dir.name) / "checkpoint.txt",
+                restore_function=lambda path: int(path.read_text()),
+                checkpoint_function=lambda path, value: path.write_text(str(value)),
+                checkpoint_transfer_mode="htcondor",
+            )
+        self.assertEqual(checkpointer.checkpoint_transfer_target, Path("/checkpoints/job=1234"))
+        self.assertEqual(checkpointer.checkpoint_exit_code, 85)
+        self.assertEqual(checkpointer.sigterm_time_budget, 540)
+
+    def test_slurm(self):
+        batch_system = Slurm({"SLURM_JOB_ID": "1", "SLURM_JOB_START_TIME": "1000", "SLURM_JOB_END_TIME": "4600"})
+        self.assertEqual(batch_system.runtime_limit, 3600)
+        self.assertIsNone(batch_system.checkpoint_exit_code)
+        with mock.patch.dict(os.environ, {"SLURM_JOB_ID": "1"}, clear=True):
+            self.assertIsInstance(detect_batch_system(), Slurm)
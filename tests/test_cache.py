@@ -0,0 +1,73 @@
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from checkpointer.cache import LocalCheckpointCache
+from checkpointer.checkpointer import Checkpointer
+
+
+class TestLocalCheckpointCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.tmp = Path(self.tmp_dir.name)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_lru_eviction(self):
+        cache = LocalCheckpointCache(self.tmp / "cache", max_size=250)
+        for key in ["a", "b", "c"]:
+            (self.tmp / key).write_bytes(b"x" * 100)
+            os.utime(self.tmp / key, ns=(0, 1))
+        cache.put(self.tmp / "a", "a")
+        cache.put(self.tmp / "b", "b")
+        # "a" was used more recently than "b"
+        os.utime(cache.directory / "a.1", ns=(2, 1))
+        os.utime(cache.directory / "b.1", ns=(1, 1))
+        cache.put(self.tmp / "c", "c")
+        self.assertEqual(sorted(entry.name for entry in cache.directory.iterdir()), ["a.1", "c.1"])
+        self.assertTrue(cache.get("a", self.tmp / "restored"))
+        self.assertFalse(cache.get("b", self.tmp / "restored"))
+
+    def test_modified_entry_is_discarded(self):
+        cache = LocalCheckpointCache(self.tmp / "cache")
+        path = self.tmp / "checkpoint"
+        path.write_text("1")
+        cache.put(path, "a")
+        self.assertEqual(path.stat().st_nlink, 2)  # linked, not copied
+        # the next checkpoint is written into the same file
+        with open(path, "w") as file:
+            file.write("2")
+        os.utime(path, ns=(0, path.stat().st_mtime_ns + 1))
+        self.assertFalse(cache.get("a", self.tmp / "restored"))
+        self.assertEqual(list(cache.directory.iterdir()), [])
+
+    def test_restore_from_cache(self):
+        def make_checkpointer():
+            return Checkpointer(
+                local_checkpoint_file=self.tmp / "job" / "checkpoint.txt",
+                restore_function=lambda path: int(path.read_text()),
+                checkpoint_function=lambda path, value: path.write_text(str(value)),
+                checkpoint_transfer_mode="local",
+                checkpoint_transfer_target="/store/checkpoint.txt",
+                checkpoint_transfer_backend_kwargs={"root": self.tmp / "storage"},
+                local_cache_dir=self.tmp / "cache",
+            )
+
+        (self.tmp / "job").mkdir()
+        checkpointer = make_checkpointer()
+        checkpointer.step(11)
+        checkpointer.clean_up_local_checkpoint_files()
+
+        restarted = make_checkpointer()
+        self.assertEqual(restarted.restore(0), 11)
+        self.assertEqual(restarted._cache.hits, 1)
+        self.assertEqual(restarted.last_copy_method, None)  # the checkpoint itself was not fetched
+
+        # a record left over from an earlier upload is not used for the new file
+        version = self.tmp / "storage" / "store" / "checkpoint.txt.version"
+        stale_record = version.read_text()
+        restarted.step(12)
+        version.write_text(stale_record)
+        restarted.clean_up_local_checkpoint_files()
+        self.assertEqual(make_checkpointer().restore(0), 12)
@@ -0,0 +1,168 @@
+import json
+import sys
+import tempfile
+import threading
+import types
+import unittest
+from pathlib import Path
+from unittest import mock
+from checkpointer.checkpointer import Checkpointer
+
+
+def import_lightning_callback():
+    '''
+    Imports the lightning callback modules with stand-ins for pytorch_lightning, which is not needed by these tests.
+    '''
+    io = types.SimpleNamespace(CheckpointIO=object, TorchCheckpointIO=object)
+    modules = {
+        "pytorch_lightning": types.SimpleNamespace(),
+        "pytorch_lightning.plugins": types.SimpleNamespace(io=io),
+        "pytorch_lightning.plugins.io": io,
+        "pytorch_lightning.callbacks": types.SimpleNamespace(Callback=object),
+    }
+    with mock.patch.dict(sys.modules, modules):
+        from checkpointer.lightning_callback import checkpoint_io, lightning_callback
+    return checkpoint_io, lightning_callback
+
+
+class FakeCheckpointIO:
+    def __init__(self):
+        self.saved = []
+        self.failures = 0  # number of saves to fail
+        self.release = threading.Event()
+        self.release.set()
+        self.torn_down = False
+
+    def save_checkpoint(self, checkpoint, path, storage_options=None):
+        self.release.wait(10)
+        if self.failures:
+            self.failures -= 1
+            raise OSError("disk full")
+        Path(path).write_text(json.dumps(checkpoint))
+        self.saved.append(checkpoint["global_step"])
+
+    def load_checkpoint(self, path, map_location=None):
+        return json.loads(Path(path).read_text())
+
+    def remove_checkpoint(self, path):
+        Path(path).unlink()
+
+    def teardown(self):
+        self.torn_down = True
+
+
+class TestCheckpointerIO(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.tmp = Path(self.tmp_dir.name)
+        self.checkpoint_io_module, self.lightning_callback_module = import_lightning_callback()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def make_checkpoint_io(self):
+        checkpointer = Checkpointer(
+            local_checkpoint_file=self.tmp / "checkpoint.json",
+            checkpoint_function=lambda path, value: None,
+            restore_function=lambda path: path,
+            checkpoint_transfer_mode="shared",
+            checkpoint_transfer_target=self.tmp / "target.json",
+            async_transfer=True,
+        )
+        return self.checkpoint_io_module.CheckpointerIO(checkpointer, base_io=FakeCheckpointIO())
+
+    def test_repeated_save_is_skipped(self):
+        checkpoint_io = self.make_checkpoint_io()
+        checkpoint_io.base_io.release.clear()
+        checkpoint_io.save_checkpoint({"global_step": 1}, self.tmp / "checkpoint.json")
+        # saved again, e.g. by a ModelCheckpoint callback, while the first save is still written
+        checkpoint_io.save_checkpoint({"global_step": 1}, self.tmp / "checkpoint.json")
+        checkpoint_io.base_io.release.set()
+        checkpoint_io.save_checkpoint({"global_step": 1}, self.tmp / "other.json")
+        checkpoint_io.teardown()
+        self.assertTrue(checkpoint_io.base_io.torn_down)
+        self.assertEqual(checkpoint_io.base_io.saved, [1, 1])
+        self.assertEqual(checkpoint_io.checkpointer.metrics.counters["coalesced"], 1)
+        self.assertEqual(json.loads((self.tmp / "target.json").read_text()), {"global_step": 1})
+        self.assertEqual(checkpoint_io.load_checkpoint(self.tmp / "other.json"), {"global_step": 1})
+
+    def test_failed_save_is_repeated(self):
+        checkpoint_io = self.make_checkpoint_io()
+        checkpoint_io.base_io.failures = 1
+        checkpoint_io.save_checkpoint({"global_step": 1}, self.tmp / "checkpoint.json")
+        self.assertFalse(checkpoint_io.checkpointer.flush(10))
+        self.assertFalse(checkpoint_io.has_saved(1, self.tmp / "checkpoint.json"))
+        with self.assertRaisesRegex(OSError, "disk full"):
+            checkpoint_io.save_checkpoint({"global_step": 1}, self.tmp / "checkpoint.json")
+        checkpoint_io.save_checkpoint({"global_step": 1}, self.tmp / "checkpoint.json")
+        checkpoint_io.teardown()
+        self.assertEqual(checkpoint_io.base_io.saved, [1])
+        self.assertTrue((self.tmp / "target.json").exists())
+
+    def test_save_does_not_wait_for_transfer(self):
+        checkpoint_io = self.make_checkpoint_io()
+        uploading, release = threading.Event(), threading.Event()
+        put = checkpoint_io.checkpointer.backend.put
+
+        def slow_put(local, remote):
+            uploading.set()
+            release.wait(10)
+            put(local, remote)
+
+        checkpoint_io.checkpointer.backend.put = slow_put
+        checkpoint_io.save_checkpoint({"global_step": 1}, self.tmp / "checkpoint.json")
+        self.assertTrue(uploading.wait(10))
+        saved = threading.Event()
+        threading.Thread(
+            target=lambda: (checkpoint_io.save_checkpoint({"global_step": 2}, self.tmp / "checkpoint.json"), saved.set()),
+            daemon=True,
+        ).start()
+        self.assertTrue(saved.wait(5))
+        release.set()
+        checkpoint_io.teardown()
+        self.assertEqual(checkpoint_io.base_io.saved, [1, 2])
+        self.assertEqual(json.loads((self.tmp / "target.json").read_text()), {"global_step": 2})
+
+    def test_callback_saves_when_due(self):
+        callback = self.lightning_callback_module.LightningCheckpointerCallback(
+            async_io=True,
+            local_checkpoint_file=self.tmp / "checkpoint.json",
+            checkpoint_transfer_mode="shared",
+            checkpoint_transfer_target=self.tmp / "target.json",
+            checkpoint_every=2,
+        )
+        callback.checkpoint_io.base_io = FakeCheckpointIO()
+        trainer = types.SimpleNamespace(global_step=0)
+        trainer.save_checkpoint = lambda path: callback.checkpoint_io.save_checkpoint({"global_step": trainer.global_step}, path)
+        for epoch in range(5):
+            trainer.global_step = epoch
+            callback.on_train_epoch_end(trainer, None)
+        callback.checkpoint_io.teardown()
+        self.assertEqual(callback.checkpoint_io.base_io.saved, [0, 2, 4])
+        self.assertEqual(callback.checkpointer.step_counter, 5)
+        self.assertEqual(callback.checkpointer.metrics.counters["checkpoints"], 3)
+
+    def test_callback_keeps_random_phase(self):
+        callback = self.lightning_callback_module.LightningCheckpointerCallback(
+            async_io=True,
+            local_checkpoint_file=self.tmp / "checkpoint.json",
+            checkpoint_transfer_mode="shared",
+            checkpoint_transfer_target=self.tmp / "target.json",
+            checkpoint_every=5,
+            randomize_phase=True,
+        )
+        callback.checkpoint_io.base_io = FakeCheckpointIO()
+        trainer = types.SimpleNamespace(global_step=0)
+        trainer.save_checkpoint = lambda path: callback.checkpoint_io.save_checkpoint({"global_step": trainer.global_step}, path)
+        for epoch in range(10):
+            trainer.global_step = epoch
+            callback.on_train_epoch_end(trainer, None)
+        callback.checkpoint_io.teardown()
+        saved = callback.checkpoint_io.base_io.saved
+        self.assertEqual(len(saved), 2)
+        self.assertEqual(saved[1] - saved[0], 5)
+        self.assertEqual((saved[0] + callback.checkpointer._phase) % 5, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
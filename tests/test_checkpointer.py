@@ -1,3 +1,6 @@
+import os
+import tempfile
+import threading
 import unittest
 from pathlib import Path
 from checkpointer.checkpointer import Checkpointer
@@ -5,12 +8,16 @@ from checkpointer.checkpointer import Checkpointer
 
 class TestCheckpointer(unittest.TestCase):
     def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
         self.checkpointer = Checkpointer(
-            local_checkpoint_file=Path("checkpoint.txt"),
+            local_checkpoint_file=Path(self.tmp_dir.name) / "checkpoint.txt",
             restore_function=lambda path: int(path.read_text()),
             checkpoint_function=lambda path, value: path.write_text(str(value)),
             checkpoint_every=100,
-        )  
+        )
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
 
     def test_loop(self):
         start_value = self.checkpointer.restore(0)
@@ -21,4 +28,312 @@ class TestCheckpointer(unittest.TestCase):
         load_checkpoint = self.checkpointer.restore(0)
         self.assertEqual(load_checkpoint, 9900)
 
-    
\ No newline at end of file
+    
+
+class TestAsyncTransfer(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        tmp = Path(self.tmp_dir.name)
+        self.target = tmp / "target.txt"
+        self.checkpointer = Checkpointer(
+            local_checkpoint_file=tmp / "checkpoint.txt",
+            restore_function=lambda path: int(path.read_text()),
+            checkpoint_function=lambda path, value: path.write_text(str(value)),
+            checkpoint_every=10,
+            checkpoint_transfer_mode="shared",
+            checkpoint_transfer_target=self.target,
+            async_transfer=True,
+        )
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_latest_checkpoint_wins(self):
+        for i in range(1000):
+            self.checkpointer.step(i)
+        self.assertTrue(self.checkpointer.flush(timeout=10))
+        self.assertEqual(int(self.target.read_text()), 990)
+
+    def test_step_does_not_wait_for_upload(self):
+        uploading, release = threading.Event(), threading.Event()
+        uploaded = []
+
+        def slow_upload(source, destination):
+            uploading.set()
+            release.wait(10)
+            uploaded.append(Path(source).read_text())
+            Path(destination).write_text(uploaded[-1])
+
+        tmp = Path(self.tmp_dir.name)
+        checkpointer = Checkpointer(
+            local_checkpoint_file=tmp / "slow.txt",
+            restore_function=lambda path: int(path.read_text()),
+            checkpoint_function=lambda path, value: path.write_text(str(value)),
+            checkpoint_every=1,
+            checkpoint_transfer_mode="manual",
+            checkpoint_transfer_target=str(self.target),
+            checkpoint_transfer_callback=slow_upload,
+            checkpoint_transfer_callback_kwargs={},
+            async_transfer=True,
+        )
+        checkpointer.step(0)
+        self.assertTrue(uploading.wait(10))
+        # the upload of 0 is in flight, the next checkpoints are written meanwhile
+        stepped = threading.Event()
+
+        def steps():
+            for i in range(1, 4):
+                checkpointer.step(i)
+            stepped.set()
+
+        threading.Thread(target=steps, daemon=True).start()
+        self.assertTrue(stepped.wait(5))
+        self.assertEqual((tmp / "slow.txt").read_text(), "3")
+        release.set()
+        self.assertTrue(checkpointer.flush(timeout=10))
+        # the checkpoint is uploaded as it was when the upload started, and the uploads of 1 and 2 were coalesced
+        self.assertEqual(uploaded, ["0", "3"])
+        self.assertEqual(checkpointer._transfer_worker.dropped, 2)
+        self.assertEqual(self.target.read_text(), "3")
+        self.assertEqual(sorted(path.name for path in tmp.iterdir()), ["slow.txt", "target.txt"])
+
+    def test_failed_transfer_is_reported(self):
+        def failing_upload(source, destination):
+            raise OSError("remote storage is gone")
+
+        tmp = Path(self.tmp_dir.name)
+        checkpointer = Checkpointer(
+            local_checkpoint_file=tmp / "failing.txt",
+            restore_function=lambda path: int(path.read_text()),
+            checkpoint_function=lambda path, value: path.write_text(str(value)),
+            checkpoint_every=1,
+            checkpoint_transfer_mode="manual",
+            checkpoint_transfer_target=str(self.target),
+            checkpoint_transfer_callback=failing_upload,
+            checkpoint_transfer_callback_kwargs={},
+            async_transfer=True,
+        )
+        checkpointer.step(0)
+        self.assertFalse(checkpointer.flush(timeout=10))
+        with self.assertRaisesRegex(OSError, "remote storage is gone"):
+            checkpointer.step(1)
+        # the failure is reported once
+        self.assertTrue(checkpointer.flush(timeout=10))
+
+
+class TestMultiFileCheckpoint(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.tmp = Path(self.tmp_dir.name)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def make_checkpointer(self, local_checkpoint_file):
+        def checkpoint_function(paths, value):
+            for path in paths:
+                path.write_text(f"{path.stem}: {value}")
+
+        return Checkpointer(
+            local_checkpoint_file=local_checkpoint_file,
+            restore_function=lambda paths: [path.read_text() for path in paths],
+            checkpoint_function=checkpoint_function,
+            checkpoint_transfer_mode="shared",
+            checkpoint_transfer_target=self.tmp / "target",
+        )
+
+    def test_list_of_files(self):
+        files = [self.tmp / "model.pt", self.tmp / "optimizer.pt", self.tmp / "metrics.json"]
+        checkpointer = self.make_checkpointer(files)
+        self.assertFalse(checkpointer.checkpoint_exists)
+        checkpointer.step(7)
+        self.assertTrue(checkpointer.checkpoint_exists)
+        checkpointer.clean_up_local_checkpoint_files()
+        self.assertFalse(any(path.exists() for path in files))
+        self.assertEqual(checkpointer.restore(None), ["model: 7", "optimizer: 7", "metrics: 7"])
+
+    def test_directory(self):
+        local_dir = self.tmp / "checkpoint"
+        checkpointer = Checkpointer(
+            local_checkpoint_file=local_dir,
+            restore_function=lambda path: (path / "variables" / "weights").read_text(),
+            checkpoint_function=lambda path, value: (
+                (path / "variables").mkdir(parents=True, exist_ok=True),
+                (path / "variables" / "weights").write_text(str(value)),
+            ),
+            checkpoint_transfer_mode="shared",
+            checkpoint_transfer_target=self.tmp / "target",
+        )
+        local_dir.mkdir()
+        checkpointer.step(3)
+        checkpointer.clean_up_local_checkpoint_files()
+        self.assertFalse(local_dir.exists())
+        self.assertEqual(checkpointer.restore(None), "3")
+
+    def test_directory_sync(self):
+        def make_checkpointer(local_dir):
+            return Checkpointer(
+                local_checkpoint_file=local_dir,
+                restore_function=lambda path: sorted(file.name for file in path.iterdir()),
+                checkpoint_function=lambda path, value: None,  # the files are written by someone else
+                checkpoint_transfer_mode="shared",
+                checkpoint_transfer_target=self.tmp / "target",
+            )
+
+        local_dir = self.tmp / "backup"
+        local_dir.mkdir()
+        for name in ["a", "b", "c"]:
+            (local_dir / name).write_text(name)
+        make_checkpointer(local_dir).step(None)
+
+        # a restarted job only uploads changed files and removes stale ones from the target
+        restarted = make_checkpointer(local_dir)
+        (local_dir / "a").write_text("changed")
+        (local_dir / "c").unlink()
+        restarted.step(None)
+        self.assertEqual(restarted.metrics.counters["unchanged_files"], 1)
+        self.assertFalse((self.tmp / "target" / "slot-0" / "c").exists())
+
+        # restoring only fetches files that differ
+        other_dir = self.tmp / "other"
+        other_dir.mkdir()
+        (other_dir / "b").write_text("b")
+        os.utime(other_dir / "b", ns=(0, 0))
+        (other_dir / "stale").write_text("stale")
+        other = make_checkpointer(other_dir)
+        self.assertEqual(other.restore(None), ["a", "b"])
+        self.assertEqual((other_dir / "b").stat().st_mtime_ns, 0)
+        self.assertEqual((other_dir / "a").read_text(), "changed")
+
+
+    def test_interrupted_transfer_keeps_previous_checkpoint(self):
+        files = [self.tmp / "model.pt", self.tmp / "optimizer.pt"]
+        checkpointer = self.make_checkpointer(files)
+        checkpointer.step(1)
+        upload_file = checkpointer._upload_file
+        uploads = []
+
+        def interrupted_upload(local_file, remote_file, name):
+            if uploads:
+                raise ConnectionError("evicted")
+            uploads.append(remote_file)
+            upload_file(local_file, remote_file, name)
+
+        checkpointer._upload_file = interrupted_upload
+        checkpointer.transfer_workers = 1
+        checkpointer.checkpoint(2)
+        with self.assertRaises(ConnectionError):
+            checkpointer.transfer_checkpoint_files()
+        checkpointer.clean_up_local_checkpoint_files()
+        restarted = self.make_checkpointer(files)
+        self.assertEqual(restarted.restore(None), ["model: 1", "optimizer: 1"])
+
+    def test_corrupted_file_is_detected(self):
+        files = [self.tmp / "model.pt", self.tmp / "optimizer.pt"]
+        checkpointer = self.make_checkpointer(files)
+        checkpointer.step(1)
+        checkpointer.clean_up_local_checkpoint_files()
+        (self.tmp / "target" / "slot-0" / "model.pt").write_text("model: 2")
+        with self.assertRaises(AssertionError):
+            self.make_checkpointer(files).restore(None)
+
+
+class TestSigtermTimeBudget(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        tmp = Path(self.tmp_dir.name)
+        self.target = tmp / "target.txt"
+        self.checkpointer = Checkpointer(
+            local_checkpoint_file=tmp / "checkpoint.txt",
+            restore_function=lambda path: int(path.read_text()),
+            checkpoint_function=lambda path, value: path.write_text(str(value)),
+            checkpoint_every=10,
+            checkpoint_transfer_mode="shared",
+            checkpoint_transfer_target=self.target,
+            sigterm_time_budget=5,
+        )
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_transfer_last_checkpoint(self):
+        self.checkpointer.step(1)
+        self.checkpointer.checkpoint(2)  # written, but not transferred yet
+        self.checkpointer.checkpoint_value = 3
+        self.checkpointer.last_checkpoint_duration = 60
+        self.checkpointer.last_transfer_duration = 1
+        with self.assertRaises(SystemExit) as context:
+            self.checkpointer.on_SIGTERM(None, None)
+        self.assertEqual(context.exception.code, self.checkpointer.checkpoint_exit_code)
+        self.assertEqual(int(self.target.read_text()), 2)
+
+    def test_strategies(self):
+        self.assertEqual(self.checkpointer._emergency_strategy(5), "full")  # nothing measured yet
+        self.checkpointer.step(1)
+        self.checkpointer.last_checkpoint_duration = 4
+        self.checkpointer.last_transfer_duration = 2
+        self.assertEqual(self.checkpointer._emergency_strategy(6), "full")
+        self.assertEqual(self.checkpointer._emergency_strategy(5), "skip")  # the last checkpoint was transferred
+        self.checkpointer.checkpoint(2)
+        self.checkpointer.last_checkpoint_duration = 4
+        self.assertEqual(self.checkpointer._emergency_strategy(5), "transfer")
+        self.assertEqual(self.checkpointer._emergency_strategy(1), "skip")
+
+
+class TestPrefetch(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        checkpointer = self.make_checkpointer()
+        checkpointer.step(1)
+        checkpointer.clean_up_local_checkpoint_files()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def make_checkpointer(self, **kwargs):
+        tmp = Path(self.tmp_dir.name)
+        return Checkpointer(
+            local_checkpoint_file=tmp / "checkpoint.txt",
+            restore_function=lambda path: int(path.read_text()),
+            checkpoint_function=lambda path, value: path.write_text(str(value)),
+            checkpoint_transfer_mode="shared",
+            checkpoint_transfer_target=tmp / "target.txt",
+            **kwargs
+        )
+
+    def test_restore_waits_for_prefetch(self):
+        checkpointer = self.make_checkpointer()
+        started, release = threading.Event(), threading.Event()
+        fetch = checkpointer._fetch_checkpoint
+
+        def slow_fetch():
+            started.set()
+            release.wait(10)
+            fetch()
+
+        checkpointer._fetch_checkpoint = slow_fetch
+        future = checkpointer.prefetch()
+        self.assertTrue(started.wait(10))
+        self.assertFalse(future.done())
+        release.set()
+        self.assertEqual(checkpointer.restore(0), 1)
+        self.assertTrue(future.done())
+        phases = checkpointer.metrics.summary()["phases"]
+        self.assertEqual(phases["fetch"]["count"], 1)  # not fetched again
+        self.assertEqual(phases["prefetch_wait"]["count"], 1)
+
+    def test_prefetch_on_construction(self):
+        checkpointer = self.make_checkpointer(prefetch=True)
+        self.assertEqual(checkpointer.restore(0), 1)
+
+    def test_failed_prefetch(self):
+        checkpointer = self.make_checkpointer()
+        fetch = checkpointer._fetch_checkpoint
+
+        def failing_fetch():
+            checkpointer._fetch_checkpoint = fetch
+            raise OSError("connection reset")
+
+        checkpointer._fetch_checkpoint = failing_fetch
+        checkpointer.prefetch().exception()
+        self.assertEqual(checkpointer.restore(0), 1)
@@ -0,0 +1,62 @@
+import hashlib
+import tempfile
+import unittest
+from pathlib import Path
+from checkpointer.checkpointer import Checkpointer
+
+
+def digest_of(chunk):
+    return hashlib.blake2b(chunk, digest_size=20).hexdigest()
+
+
+class TestDeduplicatedTransfer(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        tmp = Path(self.tmp_dir.name)
+        self.local_file = tmp / "local" / "checkpoint.bin"
+        self.local_file.parent.mkdir()
+        self.target = tmp / "target.bin"
+        self.checkpointer = Checkpointer(
+            local_checkpoint_file=self.local_file,
+            restore_function=lambda path: path.read_bytes(),
+            checkpoint_function=lambda path, value: path.write_bytes(value),
+            checkpoint_transfer_mode="shared",
+            checkpoint_transfer_target=self.target,
+            deduplicate_transfers=True,
+            chunk_size=16,
+        )
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_only_changed_chunks_are_uploaded(self):
+        store = self.checkpointer._chunk_store
+        data = b"a" * 16 + b"b" * 16 + b"c" * 10
+        self.checkpointer.checkpoint(data)
+        self.checkpointer.transfer_checkpoint_files()
+        self.assertEqual(store.uploaded_bytes, 42)
+
+        data = b"a" * 16 + b"d" * 16 + b"c" * 10
+        self.checkpointer.checkpoint(data)
+        self.checkpointer.transfer_checkpoint_files()
+        self.assertEqual(store.uploaded_bytes, 58)
+        # the chunk of the replaced generation is removed
+        self.assertEqual(len(list(store.chunk_dir(self.target).iterdir())), 3)
+
+        self.local_file.unlink()
+        self.assertEqual(self.checkpointer.restore(None), data)
+
+    def test_truncated_chunk_is_uploaded_again(self):
+        store = self.checkpointer._chunk_store
+        data = b"a" * 16 + b"b" * 16
+        digest = digest_of(data[16:])
+        # left over by a job evicted while uploading the chunk
+        chunk_dir = store.chunk_dir(self.target)
+        chunk_dir.mkdir()
+        (chunk_dir / digest).write_bytes(b"b" * 5)
+        self.checkpointer.checkpoint(data)
+        self.checkpointer.transfer_checkpoint_files()
+        self.assertEqual(store.uploaded_bytes, 32)
+        self.assertEqual(sorted(path.name for path in chunk_dir.iterdir()), sorted([digest_of(data[:16]), digest]))
+        self.local_file.unlink()
+        self.assertEqual(self.checkpointer.restore(None), data)
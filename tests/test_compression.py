@@ -0,0 +1,107 @@
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+from checkpointer import compression as compression_module
+from checkpointer.checkpointer import Checkpointer
+from checkpointer.compression import (
+    AdaptiveCompression, available_codecs, compress_file, compressed_codec, decompress_file
+)
+
+
+class TestCompression(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.tmp = Path(self.tmp_dir.name)
+        # compressible, but not trivially
+        self.data = b"".join(b"step %d loss %f\n" % (i, 1 / (i + 1)) for i in range(200000))
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_round_trip(self):
+        source = self.tmp / "checkpoint"
+        source.write_bytes(self.data)
+        for codec in available_codecs():
+            if codec == "none":
+                continue
+            with self.subTest(codec=codec):
+                compress_file(source, self.tmp / "compressed", codec)
+                self.assertEqual(compressed_codec(self.tmp / "compressed"), codec)
+                self.assertLess((self.tmp / "compressed").stat().st_size, len(self.data))
+                decompress_file(self.tmp / "compressed", self.tmp / "restored")
+                self.assertEqual((self.tmp / "restored").read_bytes(), self.data)
+        self.assertIsNone(compressed_codec(source))
+
+    def test_adaptive_choice(self):
+        source = self.tmp / "checkpoint"
+        source.write_bytes(self.data)
+        compression = AdaptiveCompression(candidates=[("zlib", 1)])
+        # nothing is compressed before the bandwidth is known
+        self.assertEqual(compression.choose(source), ("none", None))
+        compression.observe(10 * 2**20, 1.0)
+        self.assertEqual(compression.bandwidth, 10 * 2**20)
+        self.assertEqual(compression.choose(source), ("zlib", 1))
+        # on a fast link, compressing takes longer than sending the raw file
+        compression.bandwidth = 100 * 2**30
+        self.assertEqual(compression.choose(source), ("none", None))
+        # random data does not compress
+        source.write_bytes(os.urandom(2 * 2**20))
+        compression = AdaptiveCompression(candidates=[("zlib", 1)], bandwidth=10 * 2**20, reestimate_every=1)
+        self.assertEqual(compression.choose(source), ("none", None))
+        # estimates are kept per name, for a bounded number of names
+        with mock.patch.object(compression_module, "MAX_ESTIMATES", 2):
+            for name in ["a", "b", "a", "c"]:
+                compression.choose(source, name)
+        self.assertEqual(list(compression._estimates), ["a", "c"])
+
+    def _make_checkpointer(self, **kwargs):
+        return Checkpointer(
+            local_checkpoint_file=self.tmp / "job" / "checkpoint.txt",
+            restore_function=lambda path: path.read_bytes(),
+            checkpoint_function=lambda path, value: path.write_bytes(value),
+            checkpoint_transfer_mode="shared",
+            checkpoint_transfer_target=self.tmp / "storage" / "checkpoint.txt",
+            checkpoint_every=1,
+            **kwargs
+        )
+
+    def test_checkpointer_fixed_codec(self):
+        (self.tmp / "job").mkdir()
+        (self.tmp / "storage").mkdir()
+        checkpointer = self._make_checkpointer(compression="zlib", compression_level=1)
+        checkpointer.step(self.data)
+        remote = self.tmp / "storage" / "checkpoint.txt"
+        self.assertEqual(compressed_codec(remote), "zlib")
+        self.assertLess(remote.stat().st_size, len(self.data))
+        self.assertIn("compress", checkpointer.metrics.summary()["phases"])
+        checkpointer.clean_up_local_checkpoint_files()
+
+        # decompressed transparently, also without compression set
+        restarted = self._make_checkpointer()
+        self.assertEqual(restarted.restore(b""), self.data)
+
+    def test_checkpointer_auto(self):
+        (self.tmp / "job").mkdir()
+        (self.tmp / "storage").mkdir()
+        compression = AdaptiveCompression(candidates=[("zlib", 1)], bandwidth=1 * 2**20)
+        checkpointer = self._make_checkpointer(compression=compression)
+        checkpointer.step(self.data)
+        checkpointer.step(self.data)
+        self.assertEqual(compression.last_choice, ("zlib", 1))
+        self.assertEqual(compressed_codec(self.tmp / "storage" / "checkpoint.txt"), "zlib")
+        # the estimate of the first transfer is used for the second, although both uploaded another staged copy
+        self.assertEqual(list(compression._estimates), ["checkpoint.txt"])
+        self.assertEqual(compression._estimates["checkpoint.txt"][0], 2)
+        checkpointer.clean_up_local_checkpoint_files()
+        self.assertEqual(self._make_checkpointer(compression="auto").restore(b""), self.data)
+
+    def test_not_with_deduplication(self):
+        (self.tmp / "storage").mkdir()
+        with self.assertRaises(AssertionError):
+            self._make_checkpointer(compression="zlib", deduplicate_transfers=True)
+
+
+if __name__ == "__main__":
+    unittest.main()
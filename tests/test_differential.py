@@ -0,0 +1,72 @@
+import tempfile
+import unittest
+from pathlib import Path
+from checkpointer.checkpointer import Checkpointer
+from checkpointer.differential import DifferentialCheckpoint
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+@unittest.skipIf(np is None, "numpy is not installed")
+class TestDifferentialCheckpoint(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.tmp = Path(self.tmp_dir.name)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def make_state(self, step):
+        return {
+            "model": {"frozen": np.ones((256, 256)), "head": np.full(4, float(step))},
+            "optimizer": {"state": {0: {"momentum": np.full(4, float(step))}}},
+            "step": step,
+        }
+
+    def test_deltas(self):
+        differential = DifferentialCheckpoint(base_every=4, slow_keys=["optimizer"], slow_every=2)
+        directory = self.tmp / "checkpoint"
+        for step in range(3):
+            differential.checkpoint(directory, self.make_state(step))
+        # head and step changed, the optimizer is only stored every second checkpoint
+        self.assertEqual(differential.last_written_entries, 3)
+        self.assertEqual(sorted(path.name for path in directory.iterdir()),
+                         ["base-00000000.pkl", "delta-00000001.pkl", "delta-00000002.pkl", "index.json"])
+
+        restored = DifferentialCheckpoint(base_every=4).restore(directory)
+        np.testing.assert_array_equal(restored["model"]["head"], np.full(4, 2.0))
+        np.testing.assert_array_equal(restored["optimizer"]["state"][0]["momentum"], np.full(4, 2.0))
+        self.assertEqual(restored["step"], 2)
+
+        differential.checkpoint(directory, self.make_state(3))
+        differential.checkpoint(directory, self.make_state(4))  # a new base replaces the chain
+        self.assertEqual(sorted(path.name for path in directory.iterdir()), ["base-00000004.pkl", "index.json"])
+
+    def test_transfer_only_changes(self):
+        def make_checkpointer():
+            differential = DifferentialCheckpoint(base_every=3)
+            return Checkpointer(
+                local_checkpoint_file=self.tmp / "job" / "checkpoint",
+                checkpoint_function=differential.checkpoint,
+                restore_function=differential.restore,
+                checkpoint_every=1,
+                checkpoint_transfer_mode="local",
+                checkpoint_transfer_target="/store/checkpoint",
+                checkpoint_transfer_backend_kwargs={"root": self.tmp / "storage"},
+            )
+
+        checkpointer = make_checkpointer()
+        for step in range(5):
+            checkpointer.step(self.make_state(step))
+        remote = self.tmp / "storage" / "store" / "checkpoint"
+        # bases and deltas are uploaded once, and the chain of the previous base was removed
+        self.assertEqual(checkpointer.metrics.counters["unchanged_files"], 0 + 1 + 2 + 0 + 1)
+        self.assertEqual(sorted(path.name for path in remote.rglob("*") if path.is_file() and not path.name.startswith(".")),
+                         ["base-00000003.pkl", "delta-00000004.pkl", "index.json"])
+
+        checkpointer.clean_up_local_checkpoint_files()
+        restarted = make_checkpointer()
+        self.assertEqual(restarted.restore(None)["step"], 4)
@@ -0,0 +1,92 @@
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+from checkpointer.checkpointer import Checkpointer
+from checkpointer.distributed import detect_rank_and_world_size
+
+
+class TestDistributedCheckpoint(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.tmp = Path(self.tmp_dir.name)
+        self.storage = self.tmp / "storage"
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def make_checkpointer(self, rank, world_size=3):
+        (self.tmp / f"rank{rank}").mkdir(exist_ok=True)
+        return Checkpointer(
+            local_checkpoint_file=self.tmp / f"rank{rank}" / "checkpoint.txt",
+            restore_function=lambda path: int(path.read_text()),
+            checkpoint_function=lambda path, value: path.write_text(str(value)),
+            checkpoint_transfer_mode="shared",
+            checkpoint_transfer_target=self.storage,
+            distributed=True,
+            rank=rank,
+            world_size=world_size,
+            checkpoint_every=1,
+            shard_commit_timeout=0,
+        )
+
+    def test_detect_rank(self):
+        with mock.patch.dict(os.environ, {"SLURM_PROCID": "3", "SLURM_NTASKS": "8"}, clear=True):
+            self.assertEqual(detect_rank_and_world_size(), (3, 8))
+        with mock.patch.dict(os.environ, {}, clear=True):
+            self.assertEqual(detect_rank_and_world_size(), (0, 1))
+
+    def test_commit_and_restore_shards(self):
+        ranks = [self.make_checkpointer(rank) for rank in range(3)]
+        # rank 0 does not wait for the other shards, and commits only once all of them arrived
+        ranks[0].step(100)
+        self.assertTrue(ranks[0].flush(10))
+        self.assertFalse((self.storage / "MANIFEST.json").exists())
+        self.assertFalse(self.make_checkpointer(0).checkpoint_exists)
+        for rank in [1, 2]:
+            ranks[rank].step(100 + rank)
+        self.assertTrue(ranks[0].flush(10))
+        self.assertTrue((self.storage / "MANIFEST.json").exists())
+
+        # an extra checkpoint of one rank, e.g. by a direct call, does not shift the generations of the next steps
+        ranks[0].checkpoint(150)
+        ranks[0].transfer_checkpoint_files()
+        # the next generation replaces the committed one, including its directories
+        for rank in [2, 1, 0]:
+            ranks[rank].step(200 + rank)
+        self.assertTrue(ranks[0].flush(10))
+        self.assertEqual(ranks[0]._coordinator.committed_generation(), 2)
+        self.assertEqual(sorted(path.name for path in self.storage.iterdir()), ["MANIFEST.json", "gen-00000002"])
+        self.assertEqual(ranks[0].checkpoint_transfer_target, self.storage)
+
+        for rank in range(3):
+            (self.tmp / f"rank{rank}" / "checkpoint.txt").unlink()
+            self.assertEqual(self.make_checkpointer(rank).restore(0), 200 + rank)
+
+    def test_late_and_skipped_generations(self):
+        ranks = [self.make_checkpointer(rank) for rank in range(3)]
+        for rank in [0, 1]:
+            ranks[rank].step(1)
+        # the shard of rank 2 is written, but its transfer was skipped, e.g. coalesced with the next one
+        ranks[2].checkpoint(1)
+        ranks[2].step_counter += 1
+        ranks[0].step(2)
+        for rank in [1, 2]:
+            ranks[rank].step(2)
+        # generation 2 completed after the commit pass of rank 0 gave up, and is committed by the next one
+        self.assertFalse((self.storage / "MANIFEST.json").exists())
+        self.assertTrue(ranks[0].flush(10))
+        self.assertEqual(ranks[0]._coordinator.committed_generation(), 2)
+        # the incomplete generation 1 is removed with it
+        self.assertFalse((self.storage / "gen-00000001").exists())
+
+        # a restarted job continues after the committed generation, ignoring leftovers of the previous job
+        ranks[1].step(3)
+        restarted = [self.make_checkpointer(rank) for rank in range(3)]
+        self.assertEqual([checkpointer.restore(0) for checkpointer in restarted], [2, 2, 2])
+        for rank in [2, 0, 1]:
+            restarted[rank].step(30 + rank)
+        self.assertTrue(restarted[0].flush(10))
+        self.assertEqual(restarted[0]._coordinator.committed_generation(), 3)
+        self.assertEqual((self.storage / "gen-00000003" / "shard-00001" / "checkpoint.txt").read_text(), "31")
@@ -0,0 +1,79 @@
+import json
+import tempfile
+import unittest
+from pathlib import Path
+from checkpointer.checkpointer import Checkpointer
+from checkpointer.instrumentation import CheckpointMetrics
+
+
+class TestCheckpointMetrics(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.tmp = Path(self.tmp_dir.name)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_export(self):
+        metrics = CheckpointMetrics(
+            prometheus_file=self.tmp / "checkpointer.prom", json_file=self.tmp / "metrics.json", labels={"job": "1.0"}
+        )
+        metrics.record("transfer", 2.0, 100)
+        metrics.record("transfer", 1.0, 300)
+        metrics.count("skipped")
+        metrics.export()
+        summary = json.loads((self.tmp / "metrics.json").read_text())
+        self.assertEqual(summary["phases"]["transfer"]["total_bytes"], 400)
+        self.assertEqual(summary["phases"]["transfer"]["last_throughput"], 300)
+        self.assertEqual(summary["counters"], {"skipped": 1})
+        text = (self.tmp / "checkpointer.prom").read_text()
+        self.assertIn('checkpointer_phase_duration_seconds_total{job="1.0",phase="transfer"} 3.0', text)
+        self.assertIn('checkpointer_events_total{event="skipped",job="1.0"} 1', text)
+
+    def test_checkpointer_phases(self):
+        measurements = []
+        checkpointer = Checkpointer(
+            local_checkpoint_file=self.tmp / "checkpoint.txt",
+            restore_function=lambda path: int(path.read_text()),
+            checkpoint_function=lambda path, value: path.write_text(str(value)),
+            checkpoint_every=5,
+            checkpoint_transfer_mode="shared",
+            checkpoint_transfer_target=self.tmp / "target.txt",
+            metrics=CheckpointMetrics(hooks=[measurements.append]),
+        )
+        for i in range(10):
+            checkpointer.step(i)
+        checkpointer.clean_up_local_checkpoint_files()
+        self.assertEqual(checkpointer.restore(0), 5)
+
+        phases = checkpointer.metrics.summary()["phases"]
+        self.assertEqual(phases["step"]["count"], 10)
+        self.assertEqual(phases["write"]["count"], 2)
+        self.assertEqual(phases["transfer"]["total_bytes"], 2)
+        self.assertEqual(phases["fetch"]["last_bytes"], 1)
+        self.assertEqual(phases["restore"]["count"], 1)
+        self.assertEqual(checkpointer.metrics.counters["checkpoints"], 2)
+        self.assertEqual(len(measurements), sum(phase["count"] for phase in phases.values()))
+
+    def test_transfer_counts_bytes_sent(self):
+        files = [self.tmp / "model.bin", self.tmp / "metrics.txt"]
+
+        def checkpoint_function(paths, value):
+            if not paths[0].exists():
+                paths[0].write_bytes(b"x" * 10_000)
+            paths[1].write_text(str(value))
+
+        checkpointer = Checkpointer(
+            local_checkpoint_file=files,
+            restore_function=lambda paths: int(paths[1].read_text()),
+            checkpoint_function=checkpoint_function,
+            checkpoint_every=1,
+            checkpoint_transfer_mode="shared",
+            checkpoint_transfer_target=self.tmp / "target",
+        )
+        checkpointer.step(1)
+        checkpointer.step(2)
+        transfer = checkpointer.metrics.summary()["phases"]["transfer"]
+        self.assertGreater(transfer["total_bytes"], 10_000)
+        # the unchanged model was not sent again
+        self.assertLess(transfer["last_bytes"], 1000)
@@ -0,0 +1,138 @@
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from checkpointer.backends import LocalDirectoryBackend
+from checkpointer.checkpointer import Checkpointer
+from checkpointer.ranged import RangedTransfer
+
+
+class FlakyBackend(LocalDirectoryBackend):
+    '''
+    Fails every range write after the first failures_after ones.
+    '''
+
+    def __init__(self, root, failures_after=None):
+        super().__init__(root)
+        self.failures_after = failures_after
+        self.writes = 0
+
+    def open_range_writer(self, remote, truncate=True):
+        writer = super().open_range_writer(remote, truncate)
+        write = writer.write
+
+        def flaky_write(offset, data):
+            self.writes += 1
+            if self.failures_after is not None and self.writes > self.failures_after:
+                raise ConnectionError("connection dropped")
+            write(offset, data)
+
+        writer.write = flaky_write
+        return writer
+
+
+class TestRangedTransfer(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.tmp = Path(self.tmp_dir.name)
+        self.local_file = self.tmp / "checkpoint.bin"
+        self.data = os.urandom(10 * 1024 + 5)
+        self.local_file.write_bytes(self.data)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_upload_resumes_after_failure(self):
+        backend = FlakyBackend(self.tmp / "storage", failures_after=4)
+        transfer = RangedTransfer(backend, range_size=1024, streams=1, retries=0)
+        with self.assertRaises(ConnectionError):
+            transfer.upload(self.local_file, "/store/checkpoint.bin")
+        self.assertFalse(backend.exists("/store/checkpoint.bin"))
+
+        backend.failures_after = None
+        transfer.upload(self.local_file, "/store/checkpoint.bin")
+        self.assertEqual(transfer.resumed_bytes, 4 * 1024)
+        self.assertEqual(backend.writes, 5 + 7)
+        self.assertEqual((self.tmp / "storage" / "store" / "checkpoint.bin").read_bytes(), self.data)
+
+    def test_retry(self):
+        backend = FlakyBackend(self.tmp / "storage", failures_after=0)
+        transfer = RangedTransfer(backend, range_size=1024, streams=4, retries=1, backoff=0)
+        with self.assertRaises(ConnectionError):
+            transfer.upload(self.local_file, "/store/checkpoint.bin")
+
+    def test_checkpointer_roundtrip(self):
+        checkpointer = Checkpointer(
+            local_checkpoint_file=self.local_file,
+            restore_function=lambda path: path.read_bytes(),
+            checkpoint_function=lambda path, value: path.write_bytes(value),
+            checkpoint_transfer_mode="local",
+            checkpoint_transfer_target="/store/checkpoint.bin",
+            checkpoint_transfer_backend_kwargs={"root": self.tmp / "storage"},
+            ranged_transfers=True,
+            range_size=1024,
+        )
+        checkpointer.step(self.data)
+        self.local_file.unlink()
+        self.assertEqual(checkpointer.restore(None), self.data)
+        self.assertEqual(sorted(path.name for path in self.tmp.iterdir()), ["checkpoint.bin", "storage"])
+
+    def test_upload_resumes_in_new_checkpointer(self):
+        def make_checkpointer():
+            return Checkpointer(
+                local_checkpoint_file=self.local_file,
+                restore_function=lambda path: path.read_bytes(),
+                checkpoint_function=lambda path, value: path.write_bytes(value),
+                checkpoint_transfer_mode="local",
+                checkpoint_transfer_target="/store/checkpoint.bin",
+                checkpoint_transfer_backend_kwargs={"root": self.tmp / "storage"},
+                ranged_transfers=True,
+                range_size=1024,
+                transfer_streams=1,
+                transfer_retries=0,
+            )
+
+        checkpointer = make_checkpointer()
+        checkpointer._ranged_transfer.backend = FlakyBackend(self.tmp / "storage", failures_after=4)
+        with self.assertRaises(ConnectionError):
+            checkpointer.step(self.data)
+        # evicted: the local checkpoint is removed, and the next job writes the same state again
+        checkpointer.clean_up_local_checkpoint_files()
+        restarted = make_checkpointer()
+        restarted.step(self.data)
+        self.assertEqual(restarted._ranged_transfer.resumed_bytes, 4 * 1024)
+        self.assertEqual((self.tmp / "storage" / "store" / "checkpoint.bin").read_bytes(), self.data)
+        self.assertEqual(sorted(path.name for path in (self.tmp / "storage" / "store").iterdir()), ["checkpoint.bin"])
+
+    def test_download_resumes(self):
+        backend = LocalDirectoryBackend(self.tmp / "storage")
+        backend.put(self.local_file, "/store/checkpoint.bin")
+        transfer = RangedTransfer(backend, range_size=1024, streams=1, retries=0, state_dir=self.tmp / "state")
+        read_range = backend.open_range_reader
+
+        def flaky_reader(remote):
+            reader = read_range(remote)
+            original_read = reader.read
+            reads = []
+
+            def read(offset, size):
+                reads.append(offset)
+                if len(reads) > 3:
+                    raise ConnectionError("connection dropped")
+                return original_read(offset, size)
+
+            reader.read = read
+            return reader
+
+        backend.open_range_reader = flaky_reader
+        restored = self.tmp / "restored" / "checkpoint.bin"
+        restored.parent.mkdir()
+        with self.assertRaises(ConnectionError):
+            transfer.download("/store/checkpoint.bin", restored)
+        # nothing is left next to the destination
+        self.assertEqual(list(restored.parent.iterdir()), [])
+        backend.open_range_reader = read_range
+        transfer.download("/store/checkpoint.bin", restored)
+        self.assertEqual(transfer.resumed_bytes, 3 * 1024)
+        self.assertEqual(restored.read_bytes(), self.data)
+        self.assertFalse((self.tmp / "state").exists())
@@ -0,0 +1,71 @@
+import os
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from unittest import mock
+from checkpointer.scheduling import AdaptiveSchedule, optimal_checkpoint_interval
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestAdaptiveSchedule(unittest.TestCase):
+    def test_optimal_interval(self):
+        # close to Young's sqrt(2 * C * M) for cheap checkpoints
+        self.assertAlmostEqual(optimal_checkpoint_interval(1, 5000), 100, delta=1)
+        self.assertEqual(optimal_checkpoint_interval(100, 10), 10)
+
+    def test_due(self):
+        clock = FakeClock()
+        schedule = AdaptiveSchedule(mean_time_between_failures=5000, min_interval=0, clock=clock)
+        checkpoints = []
+        for step in range(1000):
+            if schedule.due():
+                checkpoints.append(clock.now)
+                clock.now += 1.0  # checkpoint cost
+                schedule.checkpoint_done(1.0)
+            clock.now += 1.0  # step duration
+        self.assertEqual(schedule.step_duration, 1.0)
+        self.assertEqual(checkpoints[0], 0.0)
+        gaps = [b - a for a, b in zip(checkpoints, checkpoints[1:])]
+        # interval of ~99.3s work plus the checkpoint itself
+        self.assertTrue(all(99 <= gap <= 101 for gap in gaps), gaps)
+
+    def test_jitter(self):
+        clock = FakeClock()
+        schedule = AdaptiveSchedule(mean_time_between_failures=5000, min_interval=0, jitter=0.2, clock=clock)
+        checkpoints = []
+        for step in range(5000):
+            if schedule.due():
+                checkpoints.append(clock.now)
+                clock.now += 1.0
+                schedule.checkpoint_done(1.0)
+            clock.now += 1.0
+        gaps = [b - a for a, b in zip(checkpoints, checkpoints[1:])]
+        self.assertTrue(all(79 <= gap <= 121 for gap in gaps), gaps)
+        self.assertGreater(len(set(gaps)), 1)
+
+    def test_job_ad_limit(self):
+        clock = FakeClock()
+        with tempfile.TemporaryDirectory() as tmp:
+            job_ad_path = Path(tmp) / ".job.ad"
+            # the job has been running for 50 of its 60 minutes
+            job_ad_path.write_text(f"MaxRuntime = 3600\nJobCurrentStartDate = {int(time.time()) - 3000}\n")
+            with mock.patch.dict(os.environ, {"_CONDOR_JOB_AD": str(job_ad_path)}):
+                schedule = AdaptiveSchedule(
+                    mean_time_between_failures=24 * 3600, min_interval=10, job_ad_limit="MaxRuntime", clock=clock
+                )
+        schedule.checkpoint_done(60.0)
+        # bounded by the 10 minutes left, not by the 60 minutes of the limit
+        self.assertAlmostEqual(schedule.interval, optimal_checkpoint_interval(60, 600), delta=1)
+        clock.now = 400
+        self.assertAlmostEqual(schedule.interval, optimal_checkpoint_interval(60, 200), delta=1)
+        # past the limit, the interval does not drop below min_interval
+        clock.now = 1000
+        self.assertEqual(schedule.interval, 10)
@@ -0,0 +1,133 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+from checkpointer.checkpointer import Checkpointer
+from checkpointer.shipper import CheckpointShipper, InotifyWatcher, PollingWatcher, main
+
+
+def wait_for(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.05)
+    return True
+
+
+class TestShipper(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.local_dir = Path(self.tmp_dir.name) / "local"
+        self.target_dir = Path(self.tmp_dir.name) / "target"
+        self.local_dir.mkdir()
+        self.target_dir.mkdir()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def _run_shipper(self, local_checkpoint_file, use_inotify):
+        checkpointer = Checkpointer(
+            local_checkpoint_file=local_checkpoint_file,
+            checkpoint_function=None,
+            restore_function=None,
+            checkpoint_transfer_mode="shared",
+            checkpoint_transfer_target=self.target_dir / local_checkpoint_file.name,
+        )
+        shipper = CheckpointShipper(checkpointer, settle_time=0.2, poll_interval=0.05, use_inotify=use_inotify)
+        stop = threading.Event()
+        thread = threading.Thread(target=shipper.run, args=(stop,))
+        thread.start()
+        return shipper, stop, thread
+
+    def _test_ships_file(self, use_inotify):
+        local_file = self.local_dir / "checkpoint.txt"
+        shipper, stop, thread = self._run_shipper(local_file, use_inotify)
+        try:
+            # written atomically, like by save_tensors
+            tmp_file = self.local_dir / ".checkpoint.txt.tmp"
+            tmp_file.write_text("1")
+            os.replace(tmp_file, local_file)
+            target = self.target_dir / "checkpoint.txt"
+            self.assertTrue(wait_for(lambda: target.exists() and target.read_text() == "1"))
+            # a write before the shipper compared the files with those before the transfer is shipped twice
+            self.assertTrue(wait_for(lambda: shipper.shipped == 1))
+            local_file.write_text("2")
+            self.assertTrue(wait_for(lambda: target.read_text() == "2"))
+            # other files in the directory are ignored
+            (self.local_dir / "other.txt").write_text("other")
+            time.sleep(0.5)
+            self.assertEqual(shipper.shipped, 2)
+        finally:
+            stop.set()
+            thread.join()
+
+    def test_ships_file_inotify(self):
+        self._test_ships_file(use_inotify=True)
+
+    def test_ships_file_polling(self):
+        self._test_ships_file(use_inotify=False)
+
+    def test_ships_directory_inotify(self):
+        checkpoint_dir = self.local_dir / "checkpoint"
+        checkpoint_dir.mkdir()
+        shipper, stop, thread = self._run_shipper(checkpoint_dir, use_inotify=True)
+        self.assertIsInstance(shipper.watcher, InotifyWatcher)
+        try:
+            (checkpoint_dir / "model").mkdir()
+            (checkpoint_dir / "model" / "weights.txt").write_text("weights")
+            (checkpoint_dir / "optimizer.txt").write_text("optimizer")
+            target = self.target_dir / "checkpoint" / "slot-0"
+            self.assertTrue(wait_for(lambda: (target / "model" / "weights.txt").exists()
+                                     and (target / "optimizer.txt").exists()))
+        finally:
+            stop.set()
+            thread.join()
+        # both files were written within settle_time, so they are transferred together
+        self.assertEqual(shipper.shipped, 1)
+
+    def test_polling_watcher(self):
+        local_file = self.local_dir / "checkpoint.txt"
+        watcher = PollingWatcher([local_file], poll_interval=0.01)
+        self.assertFalse(watcher.wait(0.05))
+        local_file.write_text("1")
+        self.assertTrue(watcher.wait(0.05))
+        self.assertFalse(watcher.wait(0.05))
+
+    def test_reships_checkpoint_changed_during_transfer(self):
+        local_file = self.local_dir / "checkpoint.txt"
+        local_file.write_text("1")
+        target = self.target_dir / "checkpoint.txt"
+
+        def upload(source, destination):
+            if not target.exists():
+                # the other process writes the next checkpoint while the first one is uploaded
+                local_file.write_text("22")
+            Path(destination).write_text(Path(source).read_text())
+
+        checkpointer = Checkpointer(
+            local_checkpoint_file=local_file,
+            checkpoint_function=None,
+            restore_function=None,
+            checkpoint_transfer_mode="manual",
+            checkpoint_transfer_target=str(target),
+            checkpoint_transfer_callback=upload,
+            checkpoint_transfer_callback_kwargs={},
+        )
+        shipper = CheckpointShipper(checkpointer, use_inotify=False)
+        shipper.ship()
+        self.assertEqual(shipper.shipped, 2)
+        self.assertEqual(target.read_text(), "22")
+
+    def test_main_once(self):
+        local_file = self.local_dir / "checkpoint.txt"
+        local_file.write_text("1")
+        target = self.target_dir / "checkpoint.txt"
+        self.assertEqual(main(["--local-checkpoint-file", str(local_file), "--target", str(target), "--once"]), 0)
+        self.assertEqual(target.read_text(), "1")
+
+
+if __name__ == "__main__":
+    unittest.main()
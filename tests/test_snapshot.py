@@ -0,0 +1,77 @@
+import json
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+from checkpointer.checkpointer import Checkpointer
+from checkpointer.snapshot import StateSnapshot
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class TestStateSnapshot(unittest.TestCase):
+    @unittest.skipIf(np is None, "numpy not installed")
+    def test_buffers_are_reused(self):
+        snapshot = StateSnapshot()
+        state = {"weights": np.arange(10.0), "meta": {"epoch": 1}}
+        first = snapshot(state)
+        state["weights"] += 1
+        self.assertEqual(first["weights"][0], 0.0)
+        second = snapshot(state)
+        self.assertIs(first["weights"], second["weights"])
+        self.assertEqual(second["weights"][0], 1.0)
+
+    def test_snapshot_then_persist(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            checkpointer = Checkpointer(
+                local_checkpoint_file=Path(tmp_dir) / "checkpoint.json",
+                restore_function=lambda path: json.loads(path.read_text()),
+                checkpoint_function=lambda path, value: path.write_text(json.dumps(value)),
+                snapshot_function=StateSnapshot(),
+                checkpoint_every=10,
+            )
+            state = {"step": 0}
+            for i in range(100):
+                state["step"] = i
+                checkpointer.step(state)
+            state["step"] = -1
+            self.assertEqual(checkpointer.restore(None), {"step": 90})
+
+    def test_snapshot_does_not_wait_for_upload(self):
+        uploading, release = threading.Event(), threading.Event()
+
+        def slow_upload(source, destination):
+            uploading.set()
+            release.wait(10)
+            Path(destination).write_text(Path(source).read_text())
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            checkpointer = Checkpointer(
+                local_checkpoint_file=Path(tmp_dir) / "checkpoint.json",
+                restore_function=lambda path: json.loads(path.read_text()),
+                checkpoint_function=lambda path, value: path.write_text(json.dumps(value)),
+                snapshot_function=lambda value: dict(value),
+                checkpoint_every=1,
+                checkpoint_transfer_mode="manual",
+                checkpoint_transfer_target=str(Path(tmp_dir) / "target.json"),
+                checkpoint_transfer_callback=slow_upload,
+                checkpoint_transfer_callback_kwargs={},
+            )
+            checkpointer.step({"step": 0})
+            self.assertTrue(uploading.wait(10))
+            stepped = threading.Event()
+
+            def steps():
+                for i in range(1, 4):
+                    checkpointer.step({"step": i})
+                stepped.set()
+
+            # the snapshots are written while the first checkpoint is still uploaded
+            threading.Thread(target=steps, daemon=True).start()
+            self.assertTrue(stepped.wait(5))
+            release.set()
+            self.assertTrue(checkpointer.flush(10))
+            self.assertEqual(json.loads((Path(tmp_dir) / "target.json").read_text()), {"step": 3})
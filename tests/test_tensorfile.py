@@ -0,0 +1,66 @@
+import tempfile
+import unittest
+from pathlib import Path
+from checkpointer.checkpointer import Checkpointer
+from checkpointer.tensorfile import TensorFile, load_tensors, save_tensors
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+@unittest.skipIf(np is None, "numpy is not installed")
+class TestTensorFile(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.tmp = Path(self.tmp_dir.name)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_round_trip(self):
+        state = {
+            "model": {"weight": np.arange(12, dtype=np.float32).reshape(3, 4), "bias": np.zeros(3, dtype=np.float16)},
+            "optimizer": {
+                "state": {0: {"step": np.array(5)}},
+                "param_groups": [{"params": [0], "betas": (0.9, 0.999), "names": {0: "weight"}}],
+                "lr": 0.1,
+            },
+            "epoch": 3,
+            "rng": (1, 2, 3),
+            "empty": np.zeros((0, 2)),
+        }
+        path = self.tmp / "checkpoint.tensors"
+        save_tensors(path, state)
+        restored = load_tensors(path)
+        self.assertIsInstance(restored["model"], TensorFile)
+        weight = restored["model"]["weight"]
+        self.assertEqual(weight.ctypes.data % 64, 0)
+        np.testing.assert_array_equal(weight, state["model"]["weight"])
+        self.assertEqual(restored["model"]["bias"].dtype, np.float16)
+        self.assertEqual(restored["optimizer"]["state"][0]["step"], 5)
+        self.assertEqual(restored["optimizer"]["lr"], 0.1)
+        # values JSON would change, such as tuples and int keys in lists, are pickled
+        self.assertEqual(restored["rng"], (1, 2, 3))
+        self.assertEqual(restored["optimizer"]["param_groups"], state["optimizer"]["param_groups"])
+        self.assertEqual(restored["empty"].shape, (0, 2))
+        self.assertEqual(set(restored.to_dict()), set(state))
+        # views are copy-on-write
+        weight += 1
+        np.testing.assert_array_equal(load_tensors(path)["model"]["weight"], state["model"]["weight"])
+
+    def test_direct_restore(self):
+        target = self.tmp / "target.tensors"
+        checkpointer = Checkpointer(
+            local_checkpoint_file=self.tmp / "checkpoint.tensors",
+            checkpoint_function=save_tensors,
+            restore_function=load_tensors,
+            checkpoint_transfer_mode="shared",
+            checkpoint_transfer_target=target,
+            restore_mode="direct",
+        )
+        checkpointer.step({"weight": np.ones(1000)})
+        self.assertEqual(checkpointer.restore(None)["weight"].sum(), 1000)
+        with open(target, "rb") as file:
+            self.assertEqual(load_tensors(file)["weight"].sum(), 1000)
@@ -0,0 +1,114 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+from checkpointer.checkpointer import Checkpointer
+from checkpointer.throttling import THROTTLE_CHUNK_SIZE, TransferThrottle
+
+
+class TestTransferThrottle(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.tmp = Path(self.tmp_dir.name)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_bandwidth(self):
+        throttle = TransferThrottle(bandwidth=10 * 2**20, burst=0.1)
+        start = time.monotonic()
+        throttle.consume(2**20)  # within the burst
+        self.assertLess(time.monotonic() - start, 0.05)
+        throttle.consume(2 * 2**20)
+        self.assertGreater(time.monotonic() - start, 0.15)
+        # waiting never exceeds the deadline
+        throttle.deadline = time.monotonic() + 0.05
+        start = time.monotonic()
+        throttle.consume(100 * 2**20)
+        self.assertLess(time.monotonic() - start, 1)
+
+    def test_slots(self):
+        first = TransferThrottle(slot_dir=self.tmp / "slots", max_concurrent=1)
+        second = TransferThrottle(slot_dir=self.tmp / "slots", max_concurrent=1, poll_interval=0.01)
+        entered = threading.Event()
+
+        def transfer():
+            with second.transfer_slot():
+                entered.set()
+
+        with first.transfer_slot():
+            thread = threading.Thread(target=transfer)
+            thread.start()
+            time.sleep(0.2)
+            self.assertFalse(entered.is_set())
+        thread.join(5)
+        self.assertTrue(entered.is_set())
+        self.assertGreater(second.waited, 0.1)
+
+    def test_slot_timeout(self):
+        first = TransferThrottle(slot_dir=self.tmp / "slots", max_concurrent=2)
+        second = TransferThrottle(slot_dir=self.tmp / "slots", max_concurrent=2, poll_interval=0.01, slot_timeout=0.1)
+        with first.transfer_slot(), first.transfer_slot():
+            start = time.monotonic()
+            with second.transfer_slot():
+                self.assertGreaterEqual(time.monotonic() - start, 0.1)
+
+    def test_checkpointer(self):
+        (self.tmp / "job").mkdir()
+        (self.tmp / "storage").mkdir()
+        written = []
+
+        def checkpoint_function(path, value):
+            written.append(value)
+            path.write_text(str(value))
+
+        checkpointer = Checkpointer(
+            local_checkpoint_file=self.tmp / "job" / "checkpoint.txt",
+            checkpoint_function=checkpoint_function,
+            restore_function=lambda path: int(path.read_text()),
+            checkpoint_transfer_mode="shared",
+            checkpoint_transfer_target=self.tmp / "storage" / "checkpoint.txt",
+            checkpoint_every=5,
+            randomize_phase=True,
+            transfer_throttle=TransferThrottle(bandwidth=2**30, slot_dir=self.tmp / "slots", max_concurrent=1, jitter=0.01),
+        )
+        for step in range(10):
+            checkpointer.step(step)
+        # one checkpoint every 5 steps, starting at a random step
+        self.assertEqual(len(written), 2)
+        self.assertEqual(written[1] - written[0], 5)
+        self.assertLess(written[0], 5)
+        self.assertEqual((self.tmp / "storage" / "checkpoint.txt").read_text(), str(written[1]))
+        self.assertEqual(checkpointer.metrics.summary()["phases"]["throttle"]["count"], 2)
+
+    def test_upload_is_paced(self):
+        (self.tmp / "job").mkdir()
+        content = os.urandom(2 * THROTTLE_CHUNK_SIZE + 10)
+        throttle = TransferThrottle(bandwidth=2**30)
+        consumed = []
+        consume = throttle.consume
+
+        def record(nbytes):
+            consumed.append(nbytes)
+            consume(nbytes)
+
+        throttle.consume = record
+        checkpointer = Checkpointer(
+            local_checkpoint_file=self.tmp / "job" / "checkpoint.bin",
+            checkpoint_function=lambda path, value: path.write_bytes(content),
+            restore_function=lambda path: path.read_bytes(),
+            checkpoint_transfer_mode="shared",
+            checkpoint_transfer_target=self.tmp / "checkpoint.bin",
+            transfer_throttle=throttle,
+        )
+        checkpointer.step(None)
+        # the bandwidth is waited for piece by piece, not for the whole file before sending it at full speed
+        self.assertEqual(consumed, [THROTTLE_CHUNK_SIZE, THROTTLE_CHUNK_SIZE, 10])
+        self.assertEqual((self.tmp / "checkpoint.bin").read_bytes(), content)
+        self.assertEqual(sorted(path.name for path in self.tmp.iterdir()), ["checkpoint.bin", "job"])
+
+
+if __name__ == "__main__":
+    unittest.main()
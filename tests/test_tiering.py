@@ -0,0 +1,179 @@
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+from unittest import mock
+from checkpointer import tiering
+from checkpointer.checkpointer import Checkpointer
+from checkpointer.tiering import GENERATION_SUFFIX, StorageTier, TieredBackend
+
+
+class TestTiering(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.tmp = Path(self.tmp_dir.name)
+        for name in ["job", "ssd", "site", "remote"]:
+            (self.tmp / name).mkdir()
+        self.ssd = {"mode": "shared", "root": self.tmp / "ssd", "durable": False}
+        self.site = {"mode": "shared", "root": self.tmp / "site"}
+        self.remote = {"mode": "local", "root": "/store", "backend_kwargs": {"root": self.tmp / "remote"}}
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def _make_checkpointer(self, tiers, local_checkpoint_file=None):
+        return Checkpointer(
+            local_checkpoint_file=local_checkpoint_file or self.tmp / "job" / "checkpoint.txt",
+            checkpoint_function=lambda path, value: path.write_text(str(value)),
+            restore_function=lambda path: int(path.read_text()),
+            checkpoint_transfer_mode="tiered",
+            checkpoint_transfer_target="/run/checkpoint.txt",
+            checkpoint_transfer_backend_kwargs={"tiers": tiers},
+            checkpoint_every=1,
+        )
+
+    def test_write_back(self):
+        checkpointer = self._make_checkpointer([self.ssd, self.site, self.remote])
+        backend = checkpointer.backend
+        self.assertEqual([tier.root for tier in backend.sync_tiers], [self.tmp / "ssd", self.tmp / "site"])
+        checkpointer.step(1)
+        # durable once the site tier has it
+        self.assertEqual((self.tmp / "ssd" / "run" / "checkpoint.txt").read_text(), "1")
+        self.assertEqual((self.tmp / "site" / "run" / "checkpoint.txt").read_text(), "1")
+        self.assertTrue(checkpointer.flush(10))
+        remote_file = self.tmp / "remote" / "store" / "run" / "checkpoint.txt"
+        self.assertEqual(remote_file.read_text(), "1")
+        self.assertTrue(remote_file.with_name(remote_file.name + GENERATION_SUFFIX).exists())
+        self.assertEqual(backend.failures, 0)
+        checkpointer.clean_up_local_checkpoint_files()
+
+        # on another site, only the remote tier is reachable
+        moved = self._make_checkpointer([{"mode": "shared", "root": self.tmp / "other_ssd", "durable": False}, self.remote])
+        (self.tmp / "other_ssd").mkdir()
+        self.assertTrue(moved.checkpoint_exists)
+        self.assertEqual(moved.restore(0), 1)
+
+    def test_newest_copy(self):
+        checkpointer = self._make_checkpointer([self.ssd, self.site, self.remote])
+        checkpointer.step(1)
+        checkpointer.flush()
+        checkpointer.clean_up_local_checkpoint_files()
+        # the job continued on another node, leaving a stale copy on the SSD of this one
+        elsewhere = self._make_checkpointer([self.site, self.remote])
+        elsewhere.step(2)
+        elsewhere.flush()
+        elsewhere.clean_up_local_checkpoint_files()
+
+        returned = self._make_checkpointer([self.ssd, self.site, self.remote])
+        self.assertEqual(returned.restore(0), 2)
+
+    def test_incomplete_copy_is_ignored(self):
+        backend = TieredBackend([StorageTier(**self.ssd), StorageTier(**self.site)])
+        local = self.tmp / "job" / "file"
+        local.write_text("complete")
+        backend.put(local, "/file")
+        # a newer, partially written copy on the fast tier without its record
+        (self.tmp / "ssd" / "file").write_text("partial, but longer")
+        backend.get("/file", self.tmp / "job" / "restored")
+        self.assertEqual((self.tmp / "job" / "restored").read_text(), "complete")
+
+    def test_copy_without_record_is_incomplete(self):
+        backend = TieredBackend([StorageTier(**self.ssd)])
+        local = self.tmp / "job" / "file"
+        local.write_text("complete")
+        backend.put(local, "/index")
+        backend.put(local, "/file")
+        # evicted after writing the next version of the file, but before its record
+        (self.tmp / "ssd" / ("file" + GENERATION_SUFFIX)).unlink()
+        (self.tmp / "ssd" / "file").write_text("partial")
+        restarted = TieredBackend([StorageTier(**self.ssd)])
+        self.assertFalse(restarted.exists("/file"))
+        self.assertTrue(restarted.exists("/index"))
+        # files written without TieredBackend are still found
+        (self.tmp / "legacy").mkdir()
+        (self.tmp / "legacy" / "file").write_text("legacy")
+        legacy = TieredBackend([{"mode": "shared", "root": self.tmp / "legacy"}])
+        legacy.get("/file", self.tmp / "job" / "legacy")
+        self.assertEqual((self.tmp / "job" / "legacy").read_text(), "legacy")
+
+    def test_background_copies_keep_put_order(self):
+        backend = TieredBackend([StorageTier(**self.site), StorageTier(mode="shared", root=self.tmp / "ssd")])
+        slow = backend.background_tiers[0].backend
+        put, copied, release = slow.put, [], threading.Event()
+
+        def blocking_put(local, remote):
+            release.wait(10)
+            if not str(remote).endswith(GENERATION_SUFFIX):
+                copied.append(Path(remote).name)
+            put(local, remote)
+
+        slow.put = blocking_put
+        local = self.tmp / "job" / "file"
+        for name in ["model", "index", "model", "index"]:
+            local.write_text(name)
+            backend.put(local, f"/run/{name}")
+        release.set()
+        self.assertTrue(backend.flush(10))
+        # the index is copied after the newest version of the files it lists
+        self.assertEqual(copied[-2:], ["model", "index"])
+
+    @mock.patch.object(tiering, "RETRY_DELAY", 0.01)
+    @mock.patch.object(tiering, "COPY_ATTEMPTS", 3)
+    def test_failed_copies_are_retried(self):
+        backend = TieredBackend([StorageTier(**self.site), StorageTier(**self.remote)])
+        remote = backend.background_tiers[0].backend
+        put, outages = remote.put, [2]
+
+        def unreliable_put(local, path):
+            if outages[0]:
+                outages[0] -= 1
+                raise OSError("storage element unavailable")
+            put(local, path)
+
+        remote.put = unreliable_put
+        local = self.tmp / "job" / "file"
+        local.write_text("1")
+        backend.put(local, "/run/file")
+        self.assertTrue(backend.flush(10))
+        self.assertEqual(backend.failures, 2)
+        self.assertEqual((self.tmp / "remote" / "store" / "run" / "file").read_text(), "1")
+
+        # given up after COPY_ATTEMPTS, until the file is copied successfully
+        outages[0] = 3
+        local.write_text("2")
+        backend.put(local, "/run/file")
+        self.assertFalse(backend.flush(10))
+        self.assertEqual(list(backend.failed_copies), [(0, "/run/file")])
+        backend.put(local, "/run/file")
+        self.assertTrue(backend.flush(10))
+        self.assertEqual((self.tmp / "remote" / "store" / "run" / "file").read_text(), "2")
+
+        with self.assertRaises(FileNotFoundError):
+            backend.get("/run/missing", self.tmp / "job" / "missing")
+
+    def test_directory_checkpoint(self):
+        checkpoint_dir = self.tmp / "job" / "checkpoint"
+
+        def checkpoint_function(path, value):
+            path.mkdir(exist_ok=True)
+            (path / "model.txt").write_text(str(value))
+            (path / "optimizer.txt").write_text(str(value))
+
+        checkpointer = Checkpointer(
+            local_checkpoint_file=checkpoint_dir,
+            checkpoint_function=checkpoint_function,
+            restore_function=lambda path: int((path / "model.txt").read_text()),
+            checkpoint_transfer_mode="tiered",
+            checkpoint_transfer_target="/run/checkpoint",
+            checkpoint_transfer_backend_kwargs={"tiers": [self.ssd, self.remote]},
+            checkpoint_every=1,
+        )
+        checkpointer.step(3)
+        checkpointer.flush()
+        self.assertEqual((self.tmp / "remote" / "store" / "run" / "checkpoint" / "slot-0" / "optimizer.txt").read_text(), "3")
+        checkpointer.clean_up_local_checkpoint_files()
+        self.assertEqual(checkpointer.restore(0), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,62 @@
+import os
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+from checkpointer import transport
+from checkpointer.transport import copy_file
+
+
+class TestCopyFile(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.source = Path(self.tmp_dir.name) / "source.bin"
+        self.data = os.urandom(3 * 2**20 + 17)
+        self.source.write_bytes(self.data)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_copy(self):
+        target = Path(self.tmp_dir.name) / "target.bin"
+        method = copy_file(self.source, target)
+        self.assertIn(method, ["reflink", "copy_file_range", "sendfile", "buffered"])
+        self.assertEqual(target.read_bytes(), self.data)
+
+    def test_copy_into_directory(self):
+        target_dir = Path(self.tmp_dir.name) / "target"
+        target_dir.mkdir()
+        copy_file(self.source, target_dir)
+        self.assertEqual((target_dir / "source.bin").read_bytes(), self.data)
+
+    def test_buffered_fallback(self):
+        methods = transport._METHODS
+        transport._METHODS = []
+        try:
+            target = Path(self.tmp_dir.name) / "target.bin"
+            self.assertEqual(copy_file(self.source, target), "buffered")
+            self.assertEqual(target.read_bytes(), self.data)
+        finally:
+            transport._METHODS = methods
+
+    def test_same_file(self):
+        link = Path(self.tmp_dir.name) / "link.bin"
+        os.link(self.source, link)
+        for target in [self.source, link]:
+            with self.assertRaises(shutil.SameFileError):
+                copy_file(self.source, target)
+        self.assertEqual(self.source.read_bytes(), self.data)
+
+    def test_short_copy_falls_back(self):
+        def short_copy(source_fd, target_fd, size):
+            os.write(target_fd, os.pread(source_fd, 100, 0))
+            return 100
+
+        methods = transport._METHODS
+        transport._METHODS = [("copy_file_range", short_copy)]
+        try:
+            target = Path(self.tmp_dir.name) / "target.bin"
+            self.assertEqual(copy_file(self.source, target), "buffered")
+            self.assertEqual(target.read_bytes(), self.data)
+        finally:
+            transport._METHODS = methods